@@ -1,30 +1,125 @@
-import sqlite3
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
 import shutil
-import schedule
+import sqlite3
 import time
-from datetime import datetime
-import os
+import zlib
+from datetime import datetime, time as dt_time
+from zoneinfo import ZoneInfo
+import config
+
+logger = logging.getLogger(__name__)
+
+class BackupError(Exception):
+    """Backup tạo ra không hợp lệ"""
+
+class BackupRestarted(Exception):
+    """Backup từng bước bị khởi động lại quá nhiều lần do database bị ghi liên tục"""
 
 class BackupManager:
-    def __init__(self, db_path, backup_dir="backups"):
+    def __init__(self, db_path, backup_dir="backups", compress=True,
+                 pages_per_step=1024, step_sleep=0.005, max_restarts=3):
         self.db_path = db_path
         self.backup_dir = backup_dir
+        self.compress = compress
+        
+        # Số trang sao chép mỗi bước; giữa các bước SQLite nhả khóa cho bot ghi
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.max_restarts = max_restarts
         
         if not os.path.exists(backup_dir):
             os.makedirs(backup_dir)
     
     def create_backup(self):
-        """Tạo backup database"""
+        """Tạo backup database bằng API backup trực tuyến của SQLite
+        
+        Trả về dict gồm đường dẫn, số byte đã ghi và thời gian chạy (giây).
+        """
+        started = time.perf_counter()
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = f"{self.backup_dir}/todo_backup_{timestamp}.db"
+        snapshot_path = f"{self.backup_dir}/.todo_backup_{timestamp}.tmp"
+        
+        try:
+            self.snapshot(snapshot_path)
+            
+            if self.compress:
+                backup_path = f"{self.backup_dir}/todo_backup_{timestamp}.db.gz"
+                with open(snapshot_path, "rb") as src, gzip.open(backup_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            else:
+                backup_path = f"{self.backup_dir}/todo_backup_{timestamp}.db"
+                os.replace(snapshot_path, backup_path)
+        finally:
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
         
-        # Sao chép file database
-        shutil.copy2(self.db_path, backup_path)
+        result = {
+            "path": backup_path,
+            "bytes": os.path.getsize(backup_path),
+            "duration": time.perf_counter() - started
+        }
+        logger.info("Đã backup %s: %d bytes trong %.2fs", result["path"], result["bytes"], result["duration"])
         
         # Giữ chỉ 7 backup gần nhất
         self.cleanup_old_backups()
         
-        return backup_path
+        return result
+    
+    def snapshot(self, path):
+        """Chụp database đang chạy ra file path và kiểm tra toàn vẹn"""
+        source = sqlite3.connect(self.db_path)
+        target = sqlite3.connect(path)
+        # File đích chỉ là bản nháp: ghi đè file cũ không cần rollback journal
+        target.execute("PRAGMA journal_mode=OFF")
+        try:
+            self._copy(source, target)
+        finally:
+            target.close()
+            source.close()
+        
+        self.verify_backup(path)
+    
+    def _copy(self, source, target):
+        """Sao chép database sang target, ảnh chụp luôn nhất quán
+        
+        Sao chép từng nhóm trang và nhả khóa giữa các bước để bot vẫn ghi được.
+        SQLite bắt đầu lại từ đầu mỗi khi có kết nối khác ghi vào database; nếu
+        điều đó lặp lại quá max_restarts lần thì chép một lần liền mạch.
+        """
+        restarts = 0
+        last_remaining = None
+        
+        def progress(status, remaining, total):
+            nonlocal restarts, last_remaining
+            if last_remaining is not None and remaining > last_remaining:
+                restarts += 1
+                if restarts > self.max_restarts:
+                    raise BackupRestarted()
+            last_remaining = remaining
+        
+        try:
+            source.backup(target, pages=self.pages_per_step, progress=progress, sleep=self.step_sleep)
+        except BackupRestarted:
+            logger.warning("Database bị ghi liên tục, chuyển sang backup một bước")
+            source.backup(target)
+    
+    @staticmethod
+    def verify_backup(path):
+        """Kiểm tra toàn vẹn file backup, báo lỗi nếu hỏng"""
+        conn = sqlite3.connect(path)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            conn.close()
+        
+        if result != "ok":
+            raise BackupError(f"Backup {path} không toàn vẹn: {result}")
     
     def cleanup_old_backups(self, keep=7):
         """Xóa các backup cũ"""
@@ -36,11 +131,307 @@ class BackupManager:
         for old_backup in backups[keep:]:
             os.remove(f"{self.backup_dir}/{old_backup}")
     
-    def schedule_backups(self):
-        """Lập lịch backup tự động"""
+    def schedule_backups(self, job_queue):
+        """Lập lịch backup tự động trên JobQueue của bot"""
         # Backup hàng ngày lúc 2:00 sáng
-        schedule.every().day.at("02:00").do(self.create_backup)
+        backup_time = dt_time(2, 0, tzinfo=ZoneInfo(config.Config.TIMEZONE))
+        job_queue.run_daily(self.backup_job, time=backup_time, name="backup")
+    
+    async def backup_job(self, context):
+        """Chạy backup trong thread riêng để không chặn event loop"""
+        try:
+            await asyncio.to_thread(self.create_backup)
+        except Exception:
+            logger.exception("Backup thất bại")
+
+class IncrementalBackupManager(BackupManager):
+    """Backup tăng dần, khử trùng lặp theo nội dung
+    
+    Ảnh chụp database được cắt thành các khối gồm chunk_pages trang liên tiếp.
+    Mỗi khối lưu một lần duy nhất trong chunks/ theo mã SHA-256 của nội dung
+    (nén zlib); mỗi lần backup chỉ ghi các khối mới cùng một manifest liệt kê
+    thứ tự các khối. Nhờ vậy giữ nhiều mốc backup (theo giờ/ngày/tuần) chỉ tốn
+    dung lượng cho phần trang thay đổi.
+    """
+    def __init__(self, db_path, backup_dir="backups", chunk_pages=4, interval_minutes=60,
+                 keep_hourly=24, keep_daily=7, keep_weekly=4, pin_attempts=5, **kwargs):
+        super().__init__(db_path, backup_dir, **kwargs)
+        self.chunk_pages = chunk_pages
+        self.interval_minutes = interval_minutes
+        self.pin_attempts = pin_attempts
+        self.keep_hourly = keep_hourly
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        
+        self.chunks_dir = os.path.join(backup_dir, "chunks")
+        self.manifests_dir = os.path.join(backup_dir, "manifests")
+        # Chỉ dùng khi không đọc thẳng được file database; ghi đè mỗi lần thay vì tạo file tạm mới
+        self.snapshot_path = os.path.join(backup_dir, ".snapshot.db")
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+    
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+    
+    @staticmethod
+    def _write_atomic(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+    
+    @staticmethod
+    def _page_size(path):
+        """Đọc kích thước trang từ header của file SQLite"""
+        with open(path, "rb") as f:
+            header = f.read(100)
+        page_size = int.from_bytes(header[16:18], "big")
+        return 65536 if page_size == 1 else page_size
+    
+    def create_backup(self):
+        """Tạo backup tăng dần, trả về dict gồm manifest, số byte đã ghi và thời gian chạy
+        
+        Với database ở chế độ WAL, các khối được đọc thẳng từ file database
+        trong lúc giữ một giao dịch đọc (xem _pin_database), không chép ra file
+        tạm nên mỗi lần backup chỉ ghi các khối mới. Chế độ khác chụp vào một
+        file snapshot dùng lại giữa các lần chạy.
+        """
+        started = time.perf_counter()
+        now = datetime.now()
+        timestamp = now.strftime("%Y%m%d_%H%M%S")
+        
+        pinned = self._pin_database()
+        try:
+            if pinned is not None:
+                source_path = self.db_path
+            else:
+                source_path = self.snapshot_path
+                self.snapshot(source_path)
+            chunks, size, page_size, written, new_chunks = self._store_chunks(source_path)
+        finally:
+            if pinned is not None:
+                pinned.close()
+        
+        manifest = {
+            "created_at": now.isoformat(),
+            "size": size,
+            "page_size": page_size,
+            "chunk_size": page_size * self.chunk_pages,
+            "chunks": chunks
+        }
+        manifest_path = os.path.join(self.manifests_dir, f"todo_backup_{timestamp}.json")
+        written += self._write_atomic(manifest_path, json.dumps(manifest).encode())
         
-        while True:
-            schedule.run_pending()
-            time.sleep(3600)  # Kiểm tra mỗi giờ
\ No newline at end of file
+        result = {
+            "path": manifest_path,
+            "bytes": written,
+            "new_chunks": new_chunks,
+            "total_chunks": len(chunks),
+            "direct": pinned is not None,
+            "duration": time.perf_counter() - started
+        }
+        logger.info(
+            "Đã backup tăng dần %s: %d/%d khối mới, %d bytes trong %.2fs",
+            manifest_path, new_chunks, len(chunks), written, result["duration"]
+        )
+        
+        self.cleanup_old_backups()
+        
+        return result
+    
+    def _pin_database(self):
+        """Giữ file database chính làm ảnh chụp nhất quán, trả về kết nối đang giữ hoặc None
+        
+        Ở chế độ WAL, sau checkpoint TRUNCATE mọi trang đã nằm trong file chính.
+        Một giao dịch đọc bắt đầu khi WAL còn rỗng chỉ đọc file chính và chặn
+        checkpoint ghi ngược vào đó cho tới khi đóng kết nối; bot vẫn ghi bình
+        thường vào WAL. Nếu không có được WAL rỗng sau vài lần thử (bot đang ghi
+        liên tục) hoặc database không ở chế độ WAL thì trả về None.
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal":
+                wal_path = self.db_path + "-wal"
+                for _ in range(self.pin_attempts):
+                    busy = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+                    if not busy:
+                        conn.execute("BEGIN")
+                        conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+                        # WAL vẫn rỗng sau khi giao dịch đọc đã bắt đầu: ảnh chụp không cần trang nào trong WAL
+                        if not os.path.exists(wal_path) or os.path.getsize(wal_path) == 0:
+                            return conn
+                        conn.execute("ROLLBACK")
+                    time.sleep(self.step_sleep)
+                logger.warning("Không giữ được ảnh chụp trực tiếp, chuyển sang chụp ra file snapshot")
+        except Exception:
+            conn.close()
+            raise
+        
+        conn.close()
+        return None
+    
+    def _store_chunks(self, path):
+        """Cắt file database thành khối và ghi các khối chưa có
+        
+        Trả về (danh sách mã khối, kích thước file, kích thước trang, số byte đã ghi, số khối mới).
+        """
+        page_size = self._page_size(path)
+        chunk_size = page_size * self.chunk_pages
+        
+        written = 0
+        new_chunks = 0
+        chunks = []
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            while f.tell() < size:
+                data = f.read(min(chunk_size, size - f.tell()))
+                if not data:
+                    break
+                digest = hashlib.sha256(data).hexdigest()
+                chunk_path = self._chunk_path(digest)
+                if not os.path.exists(chunk_path):
+                    written += self._write_atomic(chunk_path, zlib.compress(data))
+                    new_chunks += 1
+                chunks.append(digest)
+        
+        return chunks, size, page_size, written, new_chunks
+    
+    def schedule_backups(self, job_queue):
+        """Backup tăng dần mỗi interval_minutes phút để tầng giữ theo giờ có mốc để giữ"""
+        interval = self.interval_minutes * 60
+        job_queue.run_repeating(self.backup_job, interval=interval, first=interval, name="backup")
+    
+    def list_backups(self):
+        """Danh sách (thời điểm, đường dẫn manifest), mới nhất trước"""
+        backups = []
+        for name in os.listdir(self.manifests_dir):
+            if name.startswith("todo_backup_") and name.endswith(".json"):
+                created_at = datetime.strptime(name[len("todo_backup_"):-len(".json")], "%Y%m%d_%H%M%S")
+                backups.append((created_at, os.path.join(self.manifests_dir, name)))
+        return sorted(backups, reverse=True)
+    
+    def cleanup_old_backups(self, keep=None):
+        """Giữ backup mới nhất của mỗi giờ/ngày/tuần gần đây, xóa phần còn lại và các khối không dùng"""
+        policies = [
+            (self.keep_hourly, lambda d: (d.date(), d.hour)),
+            (self.keep_daily, lambda d: d.date()),
+            (self.keep_weekly, lambda d: d.isocalendar()[:2])
+        ]
+        
+        backups = self.list_backups()
+        kept = set(path for _, path in backups[:1])
+        for limit, bucket in policies:
+            seen = set()
+            for created_at, path in backups:
+                key = bucket(created_at)
+                if key not in seen and len(seen) < limit:
+                    seen.add(key)
+                    kept.add(path)
+        
+        for _, path in backups:
+            if path not in kept:
+                os.remove(path)
+        
+        # Xóa các khối không còn manifest nào tham chiếu
+        referenced = set()
+        for path in kept:
+            with open(path) as f:
+                referenced.update(json.load(f)["chunks"])
+        
+        for prefix in os.listdir(self.chunks_dir):
+            prefix_dir = os.path.join(self.chunks_dir, prefix)
+            for digest in os.listdir(prefix_dir):
+                if digest not in referenced:
+                    os.remove(os.path.join(prefix_dir, digest))
+    
+    def restore(self, target_path, at=None):
+        """Khôi phục database tại thời điểm at (mặc định: backup mới nhất) ra target_path
+        
+        Mỗi khối được kiểm tra mã SHA-256, file kết quả được kiểm tra toàn vẹn
+        trước khi thay thế target_path.
+        """
+        started = time.perf_counter()
+        candidates = [(created_at, path) for created_at, path in self.list_backups() if at is None or created_at <= at]
+        if not candidates:
+            raise BackupError("Không có backup nào phù hợp để khôi phục")
+        created_at, manifest_path = candidates[0]
+        
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        
+        tmp_path = target_path + ".restore"
+        try:
+            with open(tmp_path, "wb") as out:
+                for digest in manifest["chunks"]:
+                    with open(self._chunk_path(digest), "rb") as f:
+                        data = zlib.decompress(f.read())
+                    if hashlib.sha256(data).hexdigest() != digest:
+                        raise BackupError(f"Khối {digest} bị hỏng")
+                    out.write(data)
+            
+            if os.path.getsize(tmp_path) != manifest["size"]:
+                raise BackupError("Kích thước database khôi phục không khớp manifest")
+            self.verify_backup(tmp_path)
+            # File WAL cũ của target_path không thuộc về database khôi phục, nếu
+            # còn sẽ bị SQLite áp vào khi mở và làm hỏng dữ liệu
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(target_path + suffix):
+                    os.remove(target_path + suffix)
+            os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        
+        result = {
+            "path": target_path,
+            "backup": manifest_path,
+            "created_at": created_at,
+            "bytes": manifest["size"],
+            "duration": time.perf_counter() - started
+        }
+        logger.info("Đã khôi phục %s từ %s trong %.2fs", target_path, manifest_path, result["duration"])
+        return result
+
+def create_backup_manager(db_path):
+    """Tạo BackupManager theo cấu hình BACKUP_MODE"""
+    if config.Config.BACKUP_MODE == "incremental":
+        return IncrementalBackupManager(
+            db_path,
+            config.Config.BACKUP_DIR,
+            chunk_pages=config.Config.BACKUP_CHUNK_PAGES,
+            interval_minutes=config.Config.BACKUP_INTERVAL_MINUTES,
+            keep_hourly=config.Config.BACKUP_KEEP_HOURLY,
+            keep_daily=config.Config.BACKUP_KEEP_DAILY,
+            keep_weekly=config.Config.BACKUP_KEEP_WEEKLY
+        )
+    return BackupManager(db_path, config.Config.BACKUP_DIR, compress=config.Config.BACKUP_COMPRESS)
+
+def main():
+    parser = argparse.ArgumentParser(description="Backup và khôi phục database của bot")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("backup", help="Tạo backup ngay")
+    subparsers.add_parser("list", help="Liệt kê các backup tăng dần")
+    restore_parser = subparsers.add_parser("restore", help="Khôi phục từ backup tăng dần")
+    restore_parser.add_argument("target", help="Đường dẫn file database khôi phục")
+    restore_parser.add_argument("--at", help="Thời điểm khôi phục, dạng 'YYYY-MM-DD HH:MM'")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    
+    if args.command in ("list", "restore"):
+        manager = IncrementalBackupManager(None, config.Config.BACKUP_DIR)
+        if args.command == "list":
+            for created_at, path in manager.list_backups():
+                print(created_at.strftime("%Y-%m-%d %H:%M:%S"), path)
+        else:
+            at = datetime.strptime(args.at, "%Y-%m-%d %H:%M") if args.at else None
+            print(manager.restore(args.target, at))
+        return
+    
+    from database import db
+    print(create_backup_manager(db.sqlite_path).create_backup())
+
+if __name__ == "__main__":
+    main()
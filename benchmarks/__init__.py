@@ -0,0 +1,28 @@
+"""Bộ benchmark đầu-cuối cho bot
+
+Tạo database mẫu ở nhiều quy mô, chạy các handler thật của TodoBot qua một
+Bot API giả lập trên máy, và đo thông lượng cùng các phân vị độ trễ theo từng
+handler. Kết quả được lưu thành JSON để so sánh giữa các commit.
+
+Ví dụ:
+    python -m benchmarks.run --scale 1k
+    python -m benchmarks.run --scale 100k --scenarios view_tasks,search --concurrency 8
+    python -m benchmarks.run --scale 100k --compare benchmarks/results/100k-abc1234.json
+
+Độ trễ khi 200 user thao tác cùng lúc, so với truy vấn chạy thẳng trên event loop:
+    python -m benchmarks.run --scale 100k --users 200 --concurrency 200 --iterations 2000 --api-latency 20 --blocking-db
+    python -m benchmarks.run --scale 100k --users 200 --concurrency 200 --iterations 2000 --api-latency 20 \\
+        --compare benchmarks/results/100k-<commit>-blocking-db.json
+
+Thông lượng khi đọc và ghi xen kẽ, cấu hình SQLite hiện tại so với rollback journal:
+    python -m benchmarks.run --scale 100k --scenarios read_write --concurrency 16 --iterations 2000 --skip-micro --sqlite-profile legacy
+    python -m benchmarks.run --scale 100k --scenarios read_write --concurrency 16 --iterations 2000 --skip-micro \\
+        --compare benchmarks/results/100k-<commit>-legacy-sqlite.json
+"""
+
+# Quy mô dữ liệu mẫu -> (số user, số task)
+SCALES = {
+    "1k": (20, 1_000),
+    "100k": (1_000, 100_000),
+    "1m": (5_000, 1_000_000)
+}
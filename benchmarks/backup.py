@@ -0,0 +1,175 @@
+"""Đo số byte ghi ra đĩa mỗi lần backup: bản đầy đủ so với backup tăng dần
+
+Tạo một database SQLite (chế độ WAL) cỡ --size-mb, chạy một lần backup nền,
+sửa ngẫu nhiên --churn phần task (mặc định 1%) rồi backup lại, với mỗi cách:
+    full         bản sao nén gzip như BackupManager
+    incremental  khối trang đọc thẳng từ file database (IncrementalBackupManager)
+    snapshot     backup tăng dần với database không ở chế độ WAL: chụp ra file snapshot trước
+
+Số byte ghi lấy từ /proc/self/io (wchar: mọi lần gọi write của tiến trình,
+kể cả SQLite ghi file snapshot); nơi không có /proc dùng số byte backup tự báo.
+
+    python -m benchmarks.backup --size-mb 500 --churn 0.01
+    python -m benchmarks.backup --size-mb 50 --chunk-pages 4,16,64
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from benchmarks.run import DEFAULT_DATA_DIR, RESULTS_DIR, git_revision
+from backup import BackupManager, IncrementalBackupManager
+
+ROW_BYTES = 400
+INSERT_BATCH = 10_000
+
+def bytes_written():
+    """Tổng số byte tiến trình đã ghi, None nếu hệ điều hành không cung cấp"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def create_database(path, size_mb):
+    """Tạo database mẫu cỡ size_mb (dùng lại nếu đã có), trả về số task"""
+    if not os.path.exists(path):
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE tasks (id INTEGER PRIMARY KEY, user_id INTEGER, title TEXT, "
+            "description TEXT, completed INTEGER, updated_at TEXT)"
+        )
+        conn.execute("CREATE INDEX ix_tasks_user ON tasks (user_id, completed)")
+        target = size_mb * 1024 * 1024
+        while os.path.getsize(path) < target:
+            # Mô tả là chuỗi hex ngẫu nhiên: nén được khoảng một nửa, gần với văn bản thật
+            conn.execute(
+                "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+                "INSERT INTO tasks (user_id, title, description, completed, updated_at) "
+                "SELECT abs(random()) % 5000, 'Task ' || i, substr(hex(randomblob(?)), 1, ?), 0, datetime('now') FROM n",
+                (INSERT_BATCH, ROW_BYTES, ROW_BYTES)
+            )
+            conn.commit()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+    
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT count(*) FROM tasks").fetchone()[0]
+    finally:
+        conn.close()
+
+def apply_churn(path, fraction):
+    """Sửa ngẫu nhiên fraction phần task, trả về số task đã sửa"""
+    conn = sqlite3.connect(path)
+    try:
+        total = conn.execute("SELECT count(*) FROM tasks").fetchone()[0]
+        count = max(1, int(total * fraction))
+        conn.execute(
+            "UPDATE tasks SET completed = 1 - completed, updated_at = datetime('now'), "
+            "description = substr(hex(randomblob(?)), 1, ?) "
+            "WHERE id IN (SELECT id FROM tasks ORDER BY random() LIMIT ?)",
+            (ROW_BYTES, ROW_BYTES, count)
+        )
+        conn.commit()
+        return count
+    finally:
+        conn.close()
+
+def measure(manager):
+    """Chạy một lần backup, trả về (số byte đã ghi, thời gian chạy)"""
+    before = bytes_written()
+    started = time.perf_counter()
+    result = manager.create_backup()
+    duration = time.perf_counter() - started
+    after = bytes_written()
+    written = after - before if before is not None and after is not None else result["bytes"]
+    return written, duration
+
+def make_manager(mode, db_path, backup_dir, chunk_pages):
+    if mode == "full":
+        return BackupManager(db_path, backup_dir, compress=True)
+    if mode == "snapshot":
+        # Không ở chế độ WAL thì không đọc thẳng được file database
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+    return IncrementalBackupManager(db_path, backup_dir, chunk_pages=chunk_pages)
+
+def run(args):
+    os.makedirs(args.data_dir, exist_ok=True)
+    source_path = os.path.join(args.data_dir, f"backup_{args.size_mb}mb.db")
+    print(f"Chuẩn bị database {args.size_mb} MB...")
+    tasks = create_database(source_path, args.size_mb)
+    size = os.path.getsize(source_path)
+    
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="todo_backup_bench_")
+    try:
+        for mode in args.modes.split(","):
+            for chunk_pages in ([None] if mode == "full" else [int(c) for c in args.chunk_pages.split(",")]):
+                name = mode if chunk_pages is None else f"{mode}-{chunk_pages}p"
+                # Mỗi cách đo trên một bản sao riêng để cùng xuất phát điểm
+                db_path = os.path.join(work_dir, "todo.db")
+                shutil.copyfile(source_path, db_path)
+                backup_dir = os.path.join(work_dir, name)
+                manager = make_manager(mode, db_path, backup_dir, chunk_pages)
+                
+                baseline_bytes, baseline_duration = measure(manager)
+                changed = apply_churn(db_path, args.churn)
+                # Hai lần backup trong cùng một giây trùng tên file
+                time.sleep(1)
+                churn_bytes, churn_duration = measure(manager)
+                
+                results[name] = {
+                    "baseline_bytes": baseline_bytes,
+                    "baseline_s": round(baseline_duration, 3),
+                    "churn_bytes": churn_bytes,
+                    "churn_s": round(churn_duration, 3),
+                    "changed_tasks": changed
+                }
+                print(
+                    f"{name:18s} nền {baseline_bytes / 1e6:9.1f} MB {baseline_duration:7.2f}s   "
+                    f"sau churn {churn_bytes / 1e6:9.1f} MB {churn_duration:7.2f}s"
+                )
+                
+                shutil.rmtree(backup_dir)
+                os.remove(db_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    return {
+        "commit": git_revision(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "database_bytes": size,
+        "tasks": tasks,
+        "churn": args.churn,
+        "results": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark số byte ghi khi backup")
+    parser.add_argument("--size-mb", type=int, default=500, help="Kích thước database mẫu (MB)")
+    parser.add_argument("--churn", type=float, default=0.01, help="Tỉ lệ task bị sửa giữa hai lần backup")
+    parser.add_argument("--modes", default="full,incremental,snapshot", help="Các cách backup cần đo")
+    parser.add_argument("--chunk-pages", default="4", help="Số trang mỗi khối của backup tăng dần (phân tách bằng dấu phẩy)")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Thư mục chứa database mẫu (dùng lại giữa các lần chạy)")
+    parser.add_argument("--output", help="File JSON kết quả (mặc định benchmarks/results/backup-<size>mb-<commit>.json)")
+    args = parser.parse_args()
+    
+    report = run(args)
+    output = args.output or os.path.join(RESULTS_DIR, f"backup-{args.size_mb}mb-{report['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nĐã lưu kết quả vào {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Chạy bộ benchmark và lưu kết quả JSON
+
+    python -m benchmarks.run --scale 100k [--scenarios a,b] [--concurrency 8] [--compare file.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from benchmarks import SCALES
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "todo_bot_bench")
+
+# Cấu hình SQLite của bot (mặc định, xem config.py) và một cấu hình gần với mặc định
+# của SQLite trước khi có tinh chỉnh: rollback journal, synchronous FULL, không mmap
+SQLITE_PROFILES = {
+    "tuned": {},
+    "legacy": {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_CACHE_SIZE_KB": "2000",
+        "SQLITE_MMAP_SIZE": "0"
+    }
+}
+
+def git_revision():
+    """Commit hiện tại (kèm "-dirty" nếu có thay đổi chưa commit), None nếu không có git"""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ("-dirty" if dirty else "")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def configure_environment(args, api_port):
+    """Cấu hình bot cho benchmark; phải chạy trước khi nạp các module của bot"""
+    os.makedirs(args.data_dir, exist_ok=True)
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(args.data_dir, f'bench_{args.scale}.db')}",
+        "TELEGRAM_BOT_TOKEN": "123456:bench",
+        "BOT_API_URL": f"http://127.0.0.1:{api_port}/bot",
+        # Đo chi phí xử lý, không đo các giới hạn tần suất
+        "RATE_LIMIT_MESSAGES": str(10 ** 9),
+        "RATE_LIMIT_CALLBACKS": str(10 ** 9),
+        "RATE_LIMIT_CALLBACKS_TOTAL": str(10 ** 9),
+        "RATE_LIMIT_EXPORTS": str(10 ** 9),
+        "RATE_LIMIT_IMPORTS": str(10 ** 9),
+        "OUTBOUND_GLOBAL_RATE": str(10 ** 9),
+        "OUTBOUND_CHAT_INTERVAL": "0",
+        "CONCURRENT_UPDATES": str(max(args.concurrency, 1))
+    })
+    os.environ.update(SQLITE_PROFILES[args.sqlite_profile])
+
+def print_table(title, results, baseline=None, unit="ms"):
+    """In bảng kết quả; unit "us" hiển thị độ trễ theo micro giây (JSON luôn lưu mili giây)"""
+    factor = 1000 if unit == "us" else 1
+    print(f"\n{title}")
+    header = f"{'tên':30s} {'số lần':>8s} {'/giây':>10s} {f'p50 {unit}':>9s} {f'p95 {unit}':>9s} {f'p99 {unit}':>9s}"
+    allocations = any("alloc_bytes" in result for result in results.values())
+    if allocations:
+        header += f" {'byte/lần':>9s}"
+    if baseline is not None:
+        header += f" {'Δp50':>8s} {'Δ/giây':>8s}"
+    print(header)
+    for name, result in results.items():
+        line = (
+            f"{name:30s} {result['count']:8d} {result['throughput']:10.1f} "
+            f"{result['p50_ms'] * factor:9.3f} {result['p95_ms'] * factor:9.3f} {result['p99_ms'] * factor:9.3f}"
+        )
+        if allocations:
+            alloc = result.get("alloc_bytes")
+            line += f" {alloc:9.0f}" if alloc is not None else f" {'-':>9s}"
+        previous = (baseline or {}).get(name)
+        if previous:
+            line += f" {change(previous['p50_ms'], result['p50_ms']):>8s} {change(previous['throughput'], result['throughput']):>8s}"
+        if result.get("errors"):
+            line += f"  ⚠️ {result['errors']} lỗi: {result.get('last_error')}"
+        print(line)
+
+def change(before, after):
+    if not before:
+        return "-"
+    return f"{(after - before) / before * 100:+.0f}%"
+
+async def run_benchmarks(args, api_port):
+    # Các module của bot đọc cấu hình lúc nạp, nên chỉ nạp sau configure_environment
+    from benchmarks.seed import seed
+    from benchmarks.scenarios import (
+        SCENARIOS, HandlerBench, block_event_loop_database, load_users,
+        micro_benchmarks, run_micro, run_outbound_limiter
+    )
+    from benchmarks.stub_api import StubBotAPI
+    from bot import TodoBot
+    from metrics import metrics
+    
+    seed(args.scale)
+    if args.blocking_db:
+        block_event_loop_database()
+    selected = set(args.scenarios.split(",")) if args.scenarios else None
+    handlers = {}
+    micro = {}
+    
+    stub = StubBotAPI(
+        port=api_port, latency=args.api_latency / 1000,
+        flood_every=args.flood_every, retry_after=args.retry_after
+    )
+    await stub.start()
+    try:
+        bot = TodoBot()
+        application = bot.build_application()
+        bench = HandlerBench(application, stub, load_users(args.users), bot.editor)
+        async with application:
+            for scenario in SCENARIOS:
+                if selected and scenario.name not in selected:
+                    continue
+                # Một lượt làm nóng (kết nối, cache câu lệnh) không tính vào kết quả
+                await bench.run(scenario, min(args.iterations, len(bench.users)), args.concurrency)
+                handlers[scenario.name] = await bench.run(
+                    scenario, args.iterations, args.concurrency, args.think_time / 1000
+                )
+    finally:
+        await stub.stop()
+    
+    if not args.skip_micro:
+        for name, func in micro_benchmarks().items():
+            if not selected or name in selected:
+                micro[name] = run_micro(func, args.micro_iterations)
+        if not selected or "outbound_limiter" in selected:
+            micro["outbound_limiter"] = await run_outbound_limiter(args.micro_iterations)
+    
+    # Số câu lệnh SQL và request Bot API theo handler/route, đo trong các kịch bản handler
+    return handlers, micro, dict(stub.calls), dict(stub.flooded), metrics.handler_summary()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark đầu-cuối cho TodoBot")
+    parser.add_argument("--scale", choices=SCALES, default="1k", help="Quy mô dữ liệu mẫu")
+    parser.add_argument("--iterations", type=int, default=200, help="Số update mỗi kịch bản handler")
+    parser.add_argument("--micro-iterations", type=int, default=200, help="Số lô (100 lần gọi) mỗi micro-benchmark")
+    parser.add_argument("--concurrency", type=int, default=1, help="Số client gửi update song song")
+    parser.add_argument("--think-time", type=float, default=0, help="Thời gian nghỉ trung bình của mỗi client giữa hai update (ms)")
+    parser.add_argument("--users", type=int, default=50, help="Số user mẫu luân phiên gửi update")
+    parser.add_argument("--scenarios", help="Chỉ chạy các kịch bản này (phân tách bằng dấu phẩy)")
+    parser.add_argument("--skip-micro", action="store_true", help="Bỏ qua micro-benchmark")
+    parser.add_argument("--blocking-db", action="store_true", help="Chạy truy vấn ngay trên event loop (cách cũ) để so sánh")
+    parser.add_argument("--sqlite-profile", choices=SQLITE_PROFILES, default="tuned", help="Cấu hình PRAGMA của SQLite")
+    parser.add_argument("--api-latency", type=float, default=0, help="Độ trễ giả lập của Bot API (ms)")
+    parser.add_argument("--flood-every", type=int, default=0, help="Bot API giả lập trả 429 cho mỗi request gửi/sửa tin nhắn thứ N (0: tắt)")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after (giây) kèm lỗi 429 giả lập")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Thư mục chứa database mẫu (dùng lại giữa các lần chạy)")
+    parser.add_argument("--output", help="File JSON kết quả (mặc định benchmarks/results/<scale>-<commit>.json)")
+    parser.add_argument("--compare", help="File JSON kết quả cũ để so sánh")
+    args = parser.parse_args()
+    
+    api_port = free_port()
+    configure_environment(args, api_port)
+    
+    started = time.perf_counter()
+    handlers, micro, api_calls, api_flooded, routes = asyncio.run(run_benchmarks(args, api_port))
+    
+    revision = git_revision()
+    report = {
+        "revision": revision,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "scale": args.scale,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "think_time_ms": args.think_time,
+            "users": args.users,
+            "api_latency_ms": args.api_latency,
+            "flood_every": args.flood_every,
+            "retry_after": args.retry_after,
+            "blocking_db": args.blocking_db,
+            "sqlite_profile": args.sqlite_profile
+        },
+        "handlers": handlers,
+        "micro": micro,
+        "api_calls": api_calls,
+        "api_flooded": api_flooded,
+        "routes": routes,
+        "duration": time.perf_counter() - started
+    }
+    
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    
+    print_table(f"Handler ({args.scale}, concurrency {args.concurrency})", handlers, baseline and baseline.get("handlers"))
+    if micro:
+        print_table("Micro-benchmark", micro, baseline and baseline.get("micro"), unit="us")
+    
+    suffix = ("-blocking-db" if args.blocking_db else "") + ("-legacy-sqlite" if args.sqlite_profile == "legacy" else "")
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.scale}-{revision or 'local'}{suffix}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nĐã lưu kết quả vào {output}")
+
+if __name__ == "__main__":
+    main()
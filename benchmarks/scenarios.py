@@ -0,0 +1,378 @@
+"""Các kịch bản đo: handler chạy qua Application thật, và micro-benchmark
+
+Handler nhận update dựng sẵn qua update_processor của Application, giống hệt
+đường đi của update từ webhook/polling (rate limit, router, database, render,
+gọi Bot API giả lập). Kịch bản "cold" xóa render cache của user trước mỗi
+lần để đo đường render từ database. Độ trễ tính tới khi handler xong; lần sửa
+tin nhắn được MessageEditor gửi nền và được chờ hết ở cuối kịch bản (tính vào
+thông lượng).
+"""
+import asyncio
+import itertools
+import random
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import date, datetime
+from telegram import Update
+from bot import TASKS_PER_PAGE
+from cache import render_cache
+from database import db, User, Task, TaskRow, TaskDetailRow
+from keyboards import TIMEZONE, TodoKeyboards
+from outbound import OutboundRateLimiter
+from router import SEPARATOR, Choice, Nullable, callbacks
+from security import Security
+from utils import formatter
+from benchmarks.seed import TELEGRAM_ID_BASE, WORDS
+
+# Số task mẫu của mỗi user dùng cho các kịch bản xem chi tiết/hoàn thành
+SAMPLE_TASKS = 20
+
+BenchUser = namedtuple("BenchUser", "telegram_id user_id task_ids page_data")
+
+class Scenario:
+    def __init__(self, name, build, cold=False, max_iterations=None):
+        self.name = name
+        self.build = build  # build(bench, user, i) -> dict update
+        self.cold = cold
+        self.max_iterations = max_iterations
+
+SCENARIOS = [
+    Scenario("start", lambda bench, user, i: bench.message(user, "/start")),
+    Scenario("help", lambda bench, user, i: bench.message(user, "/help")),
+    Scenario("todo", lambda bench, user, i: bench.message(user, "/todo")),
+    Scenario("today", lambda bench, user, i: bench.message(user, "/today")),
+    Scenario("view_tasks", lambda bench, user, i: bench.callback(user, callbacks.encode("view_tasks")), cold=True),
+    Scenario("view_tasks_cached", lambda bench, user, i: bench.callback(user, callbacks.encode("view_tasks"))),
+    Scenario("next_page", lambda bench, user, i: bench.callback(user, user.page_data), cold=True),
+    Scenario(
+        "task_detail",
+        lambda bench, user, i: bench.callback(user, callbacks.encode("task_detail", bench.task_id(user, i))),
+        cold=True
+    ),
+    Scenario(
+        "complete",
+        lambda bench, user, i: bench.callback(user, callbacks.encode("complete", bench.task_id(user, i)))
+    ),
+    Scenario("search", lambda bench, user, i: bench.message(user, f"/search {WORDS[i % len(WORDS)]}")),
+    Scenario("search_prefix", lambda bench, user, i: bench.message(user, f"/search {WORDS[i % len(WORDS)][:2]}")),
+    Scenario(
+        "export_csv",
+        lambda bench, user, i: bench.callback(user, callbacks.encode("export", "csv", False)),
+        max_iterations=20
+    ),
+    # Thao tác thường ngày xen lẫn một lần xuất dữ liệu mỗi MIXED_EXPORT_EVERY update:
+    # truy vấn nặng chạy trên event loop (--blocking-db) làm chậm update của mọi user khác
+    Scenario("mixed", lambda bench, user, i: bench.mixed(user, i), cold=True),
+    # Đọc và ghi xen kẽ theo READ_WRITE_PATTERN (cố định nên chạy lại cho cùng chuỗi update):
+    # đo tranh chấp giữa người đọc và người ghi của SQLite, so sánh với --sqlite-profile legacy
+    Scenario("read_write", lambda bench, user, i: bench.read_write(user, i), cold=True)
+]
+
+MIXED_EXPORT_EVERY = 50
+
+# 3/10 update ghi (hoàn thành task, đổi độ ưu tiên), còn lại đọc
+READ_WRITE_PATTERN = (
+    "view_tasks", "complete", "task_detail", "today", "set_priority",
+    "next_page", "search", "task_detail", "complete", "view_tasks"
+)
+
+def percentile(values, p):
+    """Phân vị p (0-100) của danh sách đã sắp xếp"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, round(p / 100 * (len(values) - 1)))]
+
+def summarize(latencies, elapsed, count=None):
+    """Thông lượng và các phân vị độ trễ (mili giây)"""
+    values = sorted(latencies)
+    count = len(values) if count is None else count
+    return {
+        "count": count,
+        "throughput": count / elapsed if elapsed else 0.0,
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p90_ms": percentile(values, 90) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": values[-1] * 1000 if values else 0.0
+    }
+
+def load_users(count):
+    """Chọn count user trải đều theo thứ hạng (gồm cả user nhiều việc nhất) và dữ liệu mẫu của họ"""
+    users = []
+    with db.session_scope() as session:
+        total = session.query(User.id).count()
+        ranks = sorted({rank * total // count for rank in range(min(count, total))})
+        for rank in ranks:
+            telegram_id = TELEGRAM_ID_BASE + rank
+            user_id = session.query(User.id).filter_by(telegram_id=telegram_id).scalar()
+            task_ids = [row.id for row in session.query(Task.id).filter_by(user_id=user_id).limit(SAMPLE_TASKS)]
+            
+            page = db.get_tasks_page(session, user_id, TASKS_PER_PAGE)
+            if len(page) == TASKS_PER_PAGE:
+                page_data = TodoKeyboards.page_callback(1, "n", page[-1])
+            else:
+                page_data = callbacks.encode("view_tasks")
+            users.append(BenchUser(telegram_id, user_id, task_ids, page_data))
+    return [user for user in users if user.task_ids]
+
+class HandlerBench:
+    def __init__(self, application, stub, users, editor=None):
+        self.application = application
+        self.stub = stub
+        self.users = users
+        self.editor = editor  # MessageEditor: chờ các lần sửa gửi nền trước khi chốt số liệu
+        self.update_ids = itertools.count(1)
+        # Mỗi callback trên một tin nhắn khác nhau, để MessageEditor không bỏ qua lần sửa
+        self.message_ids = itertools.count(1)
+        self.errors = 0
+        self.last_error = None
+        application.add_error_handler(self.on_error)
+    
+    async def on_error(self, update, context):
+        self.errors += 1
+        self.last_error = repr(context.error)
+    
+    @staticmethod
+    def sender(user):
+        return {"id": user.telegram_id, "is_bot": False, "first_name": "Bench"}
+    
+    @staticmethod
+    def chat(user):
+        return {"id": user.telegram_id, "type": "private"}
+    
+    def message(self, user, text):
+        message_id = next(self.message_ids)
+        entities = []
+        if text.startswith("/"):
+            entities.append({"type": "bot_command", "offset": 0, "length": len(text.split()[0])})
+        return {
+            "update_id": next(self.update_ids),
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": self.chat(user),
+                "from": self.sender(user),
+                "text": text,
+                "entities": entities
+            }
+        }
+    
+    def callback(self, user, data):
+        update_id = next(self.update_ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": "bench",
+                "data": data,
+                "from": self.sender(user),
+                "message": {
+                    "message_id": next(self.message_ids),
+                    "date": int(time.time()),
+                    "chat": self.chat(user),
+                    "text": "bench"
+                }
+            }
+        }
+    
+    @staticmethod
+    def task_id(user, i):
+        return user.task_ids[i % len(user.task_ids)]
+    
+    def mixed(self, user, i):
+        if i % MIXED_EXPORT_EVERY == MIXED_EXPORT_EVERY - 1:
+            return self.callback(user, callbacks.encode("export", "csv", False))
+        kind = i % 4
+        if kind == 0:
+            return self.callback(user, callbacks.encode("view_tasks"))
+        if kind == 1:
+            return self.callback(user, callbacks.encode("task_detail", self.task_id(user, i)))
+        if kind == 2:
+            return self.message(user, "/today")
+        return self.message(user, f"/search {WORDS[i % len(WORDS)]}")
+    
+    def read_write(self, user, i):
+        kind = READ_WRITE_PATTERN[i % len(READ_WRITE_PATTERN)]
+        if kind == "view_tasks":
+            return self.callback(user, callbacks.encode("view_tasks"))
+        if kind == "next_page":
+            return self.callback(user, user.page_data)
+        if kind == "task_detail":
+            return self.callback(user, callbacks.encode("task_detail", self.task_id(user, i)))
+        if kind == "today":
+            return self.message(user, "/today")
+        if kind == "search":
+            return self.message(user, f"/search {WORDS[i % len(WORDS)]}")
+        if kind == "complete":
+            return self.callback(user, callbacks.encode("complete", self.task_id(user, i)))
+        return self.callback(user, callbacks.encode("set_priority", self.task_id(user, i), i % 3 + 1))
+    
+    async def run(self, scenario, iterations, concurrency=1, think_time=0):
+        """Chạy một kịch bản với concurrency client song song, trả về số liệu
+        
+        think_time (giây): mỗi client nghỉ ngẫu nhiên trung bình think_time giữa
+        hai update, như user thật, thay vì gửi liên tục.
+        """
+        if scenario.max_iterations:
+            iterations = min(iterations, scenario.max_iterations)
+        
+        items = []
+        for i in range(iterations):
+            user = self.users[i % len(self.users)]
+            items.append((user, Update.de_json(scenario.build(self, user, i), self.application.bot)))
+        
+        pending = iter(items)
+        latencies = []
+        processor = self.application.update_processor
+        
+        async def client(seed):
+            rng = random.Random(seed)
+            for user, update in pending:
+                if think_time:
+                    await asyncio.sleep(rng.uniform(0, 2 * think_time))
+                if scenario.cold:
+                    render_cache.bump(user.telegram_id)
+                started = time.perf_counter()
+                await processor.process_update(update, self.application.process_update(update))
+                latencies.append(time.perf_counter() - started)
+        
+        errors = self.errors
+        calls = sum(self.stub.calls.values())
+        started = time.perf_counter()
+        await asyncio.gather(*(client(seed) for seed in range(concurrency)))
+        if self.editor:
+            await self.editor.drain()
+        elapsed = time.perf_counter() - started
+        
+        result = summarize(latencies, elapsed)
+        result["errors"] = self.errors - errors
+        result["api_calls"] = sum(self.stub.calls.values()) - calls
+        if result["errors"]:
+            result["last_error"] = self.last_error
+        return result
+
+def block_event_loop_database():
+    """Cho db.run chạy truy vấn ngay trên event loop, như handler truy cập database trước khi có thread pool
+    
+    Dùng để so sánh độ trễ khi nhiều user cùng thao tác (--blocking-db).
+    """
+    async def run(func, *args, **kwargs):
+        with db.session_scope() as session:
+            return func(session, *args, **kwargs)
+    
+    db.run = run
+
+# Dữ liệu mẫu cho micro-benchmark
+SAMPLE_DATE = datetime(2025, 6, 1, 9, 30)
+SAMPLE_ROWS = [
+    TaskRow(100000 + i, f"Công việc mẫu số {i}", i % 3 == 0, i % 3 + 1, SAMPLE_DATE)
+    for i in range(TASKS_PER_PAGE)
+]
+SAMPLE_DETAIL = TaskDetailRow(
+    123456, "Báo cáo quý", "Tổng hợp số liệu bán hàng", False, 1,
+    SAMPLE_DATE, None, SAMPLE_DATE, "Công việc"
+)
+SAMPLE_VALUES = {int: 123456, bool: True, str: "csv", date: SAMPLE_DATE.date(), datetime: SAMPLE_DATE}
+
+def sample_value(kind):
+    if isinstance(kind, Nullable):
+        return sample_value(kind.kind)
+    return min(kind.values) if isinstance(kind, Choice) else SAMPLE_VALUES[kind]
+
+def sample_args(route):
+    """Tham số mẫu hợp lệ cho một route"""
+    return tuple(sample_value(kind) for kind in route.types)
+
+# Mọi route đã đăng ký, và dữ liệu hỏng/giả mạo mà router phải từ chối
+SAMPLE_ROUTES = [(route.name, sample_args(route)) for route in callbacks.names.values()]
+SAMPLE_CALLBACKS = [callbacks.encode(name, *args) for name, args in SAMPLE_ROUTES]
+SAMPLE_INVALID = [data + SEPARATOR for data in SAMPLE_CALLBACKS] + [
+    # Tham số bắt buộc bị bỏ trống
+    callbacks.encode(name, *args).rsplit(SEPARATOR, 1)[0] + SEPARATOR
+    for name, args in SAMPLE_ROUTES if args
+] + [
+    callbacks.encode("remind", 123456, "off")[:-3] + "abc",
+    "0" + SAMPLE_CALLBACKS[0][1:],
+    callbacks.version + "?"
+]
+
+def micro_benchmarks():
+    """Tên -> hàm không tham số được đo"""
+    user_ids = itertools.cycle(range(10_000))
+    routes = itertools.cycle(SAMPLE_ROUTES)
+    encoded = itertools.cycle(SAMPLE_CALLBACKS)
+    invalid = itertools.cycle(SAMPLE_INVALID)
+    
+    def encode():
+        name, args = next(routes)
+        return callbacks.encode(name, *args)
+    
+    return {
+        # Luân phiên qua mọi route nên mỗi mẫu là chi phí trung bình của bảng định tuyến
+        "router_encode": encode,
+        "router_decode": lambda: callbacks.decode(next(encoded)),
+        "router_decode_invalid": lambda: callbacks.decode(next(invalid)),
+        # Bàn phím được cache đo theo cặp: bản _uncached gọi thẳng hàm gốc
+        # (__wrapped__ của lru_cache) để thấy chi phí dựng markup mà cache tránh được
+        "keyboard_main_menu": TodoKeyboards.main_menu,
+        "keyboard_main_menu_uncached": TodoKeyboards.main_menu.__wrapped__,
+        "keyboard_task_detail": lambda: TodoKeyboards.task_detail(123456),
+        "keyboard_task_detail_uncached": lambda: TodoKeyboards.task_detail.__wrapped__(123456),
+        "keyboard_priority": lambda: TodoKeyboards.priority_buttons(123456),
+        "keyboard_priority_uncached": lambda: TodoKeyboards.priority_buttons.__wrapped__(123456),
+        "keyboard_reminder": lambda: TodoKeyboards.reminder_buttons(123456),
+        "keyboard_reminder_uncached": lambda: TodoKeyboards.reminder_buttons.__wrapped__(123456),
+        "keyboard_due_date": lambda: TodoKeyboards.due_date_buttons(123456),
+        "keyboard_due_date_uncached": lambda: TodoKeyboards._due_date_buttons.__wrapped__(
+            datetime.now(TIMEZONE).date(), 123456
+        ),
+        "keyboard_task_list": lambda: TodoKeyboards.task_list(SAMPLE_ROWS, 1, 20),
+        "formatter_tasks_list": lambda: formatter.format_tasks_list(SAMPLE_ROWS),
+        "formatter_task_detail": lambda: formatter.format_task(SAMPLE_DETAIL),
+        "rate_limit_check": lambda: Security.rate_limit_check(next(user_ids), "bench", 10 ** 9, 10)
+    }
+
+def run_micro(func, iterations, batch=100):
+    """Đo func theo từng lô batch lần gọi; mỗi mẫu là thời gian trung bình một lần gọi trong lô"""
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        batch_started = time.perf_counter()
+        for _ in range(batch):
+            func()
+        samples.append((time.perf_counter() - batch_started) / batch)
+    result = summarize(samples, time.perf_counter() - started, iterations * batch)
+    result["alloc_bytes"] = allocated_per_call(func, batch)
+    return result
+
+def allocated_per_call(func, calls):
+    """Số byte cấp phát đỉnh trung bình của một lần gọi func (tracemalloc, đo riêng ngoài phần tính giờ)"""
+    total = 0
+    tracemalloc.start()
+    try:
+        for _ in range(calls):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            func()
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / calls
+
+async def run_outbound_limiter(iterations, batch=100):
+    """Chi phí điều phối của OutboundRateLimiter cho một request (không chờ giới hạn)"""
+    limiter = OutboundRateLimiter(global_rate=10 ** 9, chat_interval=0, chat_burst=1)
+    
+    async def send():
+        return True
+    
+    samples = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        batch_started = time.perf_counter()
+        for j in range(batch):
+            await limiter.process_request(send, (), {}, "sendMessage", {"chat_id": j}, None)
+        samples.append((time.perf_counter() - batch_started) / batch)
+    return summarize(samples, time.perf_counter() - started, iterations * batch)
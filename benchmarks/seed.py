@@ -0,0 +1,95 @@
+"""Tạo database mẫu cho benchmark
+
+Số task của mỗi user lệch theo phân phối Zipf (vài user rất nhiều việc, đa số
+ít việc) như dữ liệu thật. Cùng quy mô và seed luôn cho cùng một database.
+"""
+import random
+import time
+from datetime import datetime, timedelta
+from database import db, User, Category, Task
+from benchmarks import SCALES
+
+# Telegram ID của user mẫu thứ i là TELEGRAM_ID_BASE + i
+TELEGRAM_ID_BASE = 10_000_000
+
+CATEGORIES_PER_USER = 5
+BATCH_SIZE = 10_000
+
+WORDS = (
+    "báo cáo họp khách hàng hợp đồng email gọi điện thiết kế kiểm thử triển khai "
+    "sửa lỗi tài liệu ngân sách mua sắm thanh toán hóa đơn lịch trình dự án nhóm "
+    "đánh giá kế hoạch tuần tháng quý đọc sách tập thể dục nấu ăn dọn dẹp sinh nhật "
+    "du lịch đặt vé khám bệnh học tiếng anh phỏng vấn tuyển dụng marketing bán hàng"
+).split()
+
+CATEGORY_NAMES = ("Công việc", "Cá nhân", "Học tập", "Gia đình", "Sức khỏe")
+
+def phrase(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def is_seeded():
+    with db.session_scope() as session:
+        return session.query(Task.id).first() is not None
+
+def seed(scale, rng_seed=42, log=print):
+    """Tạo user, danh mục và task cho quy mô scale; bỏ qua nếu database đã có dữ liệu"""
+    if is_seeded():
+        return False
+    
+    users, tasks = SCALES[scale]
+    rng = random.Random(rng_seed)
+    now = datetime.now().replace(microsecond=0)
+    started = time.perf_counter()
+    
+    with db.session_scope() as session:
+        session.execute(User.__table__.insert(), [
+            {
+                "telegram_id": TELEGRAM_ID_BASE + i,
+                "username": f"bench{i}",
+                "first_name": f"Bench {i}",
+                "last_name": None,
+                "created_at": now
+            }
+            for i in range(users)
+        ])
+        user_ids = [row.id for row in session.query(User.id).order_by(User.id)]
+        
+        session.execute(Category.__table__.insert(), [
+            {"user_id": user_id, "name": name, "color": "#3498db"}
+            for user_id in user_ids for name in CATEGORY_NAMES
+        ])
+        categories = {}
+        for category_id, user_id in session.query(Category.id, Category.user_id):
+            categories.setdefault(user_id, []).append(category_id)
+    
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(users)]
+    cumulative = []
+    total = 0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    
+    for offset in range(0, tasks, BATCH_SIZE):
+        count = min(BATCH_SIZE, tasks - offset)
+        rows = []
+        for user_id in rng.choices(user_ids, cum_weights=cumulative, k=count):
+            due_date = None
+            if rng.random() < 0.6:
+                due_date = now + timedelta(days=rng.randint(-30, 30), hours=rng.randint(0, 12))
+            rows.append({
+                "user_id": user_id,
+                "category_id": rng.choice(categories[user_id]) if rng.random() < 0.7 else None,
+                "title": phrase(rng, rng.randint(2, 6)).capitalize(),
+                "description": phrase(rng, rng.randint(5, 20)) if rng.random() < 0.5 else None,
+                "completed": rng.random() < 0.3,
+                "priority": rng.randint(1, 3),
+                "due_date": due_date
+            })
+        with db.session_scope() as session:
+            db.insert_tasks(session, rows)
+        log(f"  đã tạo {offset + count}/{tasks} task")
+    
+    # Cập nhật thống kê cho planner và gộp WAL như database đang chạy lâu
+    db.maintenance()
+    log(f"Tạo dữ liệu {scale} trong {time.perf_counter() - started:.1f}s")
+    return True
@@ -0,0 +1,123 @@
+"""Bot API giả lập cho benchmark: trả lời mọi method bằng dữ liệu hợp lệ tối thiểu
+
+Giữ kết nối keep-alive như Bot API thật; latency (giây) mô phỏng độ trễ mạng.
+
+Mô phỏng giới hạn flood: request gửi/sửa tin nhắn thứ flood_every (và các
+request sau flood(count)) nhận lỗi 429 kèm parameters.retry_after như Bot API
+thật. history ghi (thời điểm monotonic, method, mã HTTP) của từng request.
+"""
+import asyncio
+import json
+import time
+from collections import Counter
+
+BOT_INFO = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+def fake_message(message_id=1):
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": 1, "type": "private"},
+        "text": ""
+    }
+
+class StubBotAPI:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, flood_every=0, retry_after=1):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.calls = Counter()  # method -> số lần gọi
+        self.flooded = Counter()  # method -> số lần trả 429
+        self.history = []
+        self.server = None
+        self._limited = 0
+        self._flood_remaining = 0
+    
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/bot"
+    
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+    
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+    
+    def flood(self, count=1):
+        """count request gửi/sửa tin nhắn kế tiếp nhận 429"""
+        self._flood_remaining = count
+    
+    def should_flood(self, method):
+        if not (method.startswith("send") or method.startswith("edit")):
+            return False
+        self._limited += 1
+        if self._flood_remaining:
+            self._flood_remaining -= 1
+            return True
+        return bool(self.flood_every) and self._limited % self.flood_every == 0
+    
+    def result(self, method):
+        if method == "getMe":
+            return BOT_INFO
+        if method.startswith("send") or method.startswith("edit"):
+            return fake_message()
+        return True
+    
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, target, _ = request_line.decode("latin-1").split(" ", 2)
+                
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                
+                length = int(headers.get("content-length", 0))
+                if length:
+                    await reader.readexactly(length)
+                
+                method = target.rsplit("/", 1)[-1]
+                self.calls[method] += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                
+                if self.should_flood(method):
+                    self.flooded[method] += 1
+                    status = 429
+                    body = {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {self.retry_after}",
+                        "parameters": {"retry_after": self.retry_after}
+                    }
+                else:
+                    status = 200
+                    body = {"ok": True, "result": self.result(method)}
+                self.history.append((time.monotonic(), method, status))
+                
+                payload = json.dumps(body).encode()
+                reason = b"OK" if status == 200 else b"Too Many Requests"
+                writer.write(
+                    b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n" % (status, reason, len(payload)) + payload
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
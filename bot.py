@@ -1,16 +1,33 @@
+import asyncio
 import logging
-from telegram import Update, ReplyKeyboardRemove
+import signal
+from telegram import Update, ReplyKeyboardRemove, InputFile
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler,
-    MessageHandler, ConversationHandler, filters,
-    ContextTypes
+    MessageHandler, ConversationHandler, TypeHandler, filters,
+    ContextTypes, ApplicationHandlerStop
 )
 from telegram.constants import ParseMode
 import config
-from database import db
+from database import db, search_terms
+from cache import render_cache
 from keyboards import TodoKeyboards
+from router import callbacks
+from security import Security
 from utils import formatter, date_utils
-from datetime import datetime
+from reminders import ReminderScheduler
+from outbound import OutboundRateLimiter, MessageEditor
+from backup import create_backup_manager
+from persistence import DatabasePersistence
+from updates import ChatSerializedUpdateProcessor
+from webhook import WebhookServer
+from metrics import metrics
+from query_debug import query_debugger
+import shard
+from export import exporter, EXPORT_FORMATS
+from importer import importer, IMPORT_FORMATS
+from tempfile import SpooledTemporaryFile
+from datetime import datetime, timedelta, time
 
 # Cấu hình logging
 logging.basicConfig(
@@ -22,9 +39,94 @@ logger = logging.getLogger(__name__)
 # States cho ConversationHandler
 TITLE, DESCRIPTION, CATEGORY, PRIORITY, DUE_DATE = range(5)
 
+# Số công việc mỗi trang danh sách
+TASKS_PER_PAGE = 5
+
+# Các nút đã có trên bàn phím nhưng chưa có handler
+PLANNED_ACTIONS = ("account_info", "notification_settings", "edit_task")
+
+# Địa chỉ nghe chỉ truy cập được từ chính máy chủ
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+IMPORT_HELP = """📥 *Nhập dữ liệu*
+
+Gửi cho bot một file để thêm nhiều công việc cùng lúc:
+• *.txt*: mỗi dòng một công việc
+• *.csv*: có dòng tiêu đề với cột title (tùy chọn description, priority, due\\_date, completed, category)
+• *.json*: mảng các công việc, hoặc file xuất từ bot
+
+File xuất đã mã hóa (.enc) cũng được chấp nhận."""
+
 class TodoBot:
     def __init__(self):
         self.application = None
+        self.reminders = ReminderScheduler()
+        # Nhiều worker: tin nhắn trong nhóm có thể do worker khác sửa nên không ghi nhớ nội dung
+        self.editor = MessageEditor(
+            config.Config.EDIT_FINGERPRINT_SIZE,
+            track_shared_chats=config.Config.SHARD_COUNT == 1
+        )
+        
+        # Tên hành động trong router.py -> handler; tham số user/context được thêm theo khai báo route
+        self.callback_handlers = {
+            "main_menu": self.show_main_menu,
+            "settings": self.show_settings,
+            "manage_categories": self.show_categories,
+            "view_tasks": self.show_tasks_list,
+            "page": self.show_tasks_page,
+            "task_detail": self.show_task_detail,
+            "complete": self.complete_task,
+            "delete_task": self.confirm_delete_task,
+            "confirm_delete": self.delete_task,
+            "search": self.show_search_results,
+            "set_priority": self.set_task_priority,
+            "set_category": self.set_task_category,
+            "set_duedate": self.set_task_duedate,
+            "set_reminder": self.show_reminder_options,
+            "remind": self.set_task_reminder,
+            "export_data": self.show_export_options,
+            "export": self.export_data,
+            "import_data": self.show_import_help
+        }
+    
+    async def rate_limit_guard(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Chặn update khi user thao tác quá nhanh (chạy trước mọi handler khác)"""
+        user = update.effective_user
+        if not user:
+            return
+        
+        if update.callback_query:
+            # Mỗi route một bucket (bấm nhanh qua các trang không làm hết lượt xuất dữ liệu),
+            # cộng thêm một bucket chung cho mọi route
+            route = callbacks.route_name(update.callback_query.data) or "invalid"
+            limit, period = config.Config.RATE_LIMIT_ROUTES.get(
+                route, (config.Config.RATE_LIMIT_CALLBACKS, config.Config.RATE_LIMIT_CALLBACK_PERIOD)
+            )
+            if not (
+                Security.rate_limit_check(user.id, f"callback:{route}", limit, period)
+                and Security.rate_limit_check(
+                    user.id, "callback",
+                    config.Config.RATE_LIMIT_CALLBACKS_TOTAL,
+                    config.Config.RATE_LIMIT_CALLBACK_PERIOD
+                )
+            ):
+                await update.callback_query.answer("⏳ Bạn thao tác quá nhanh, vui lòng thử lại sau!")
+                raise ApplicationHandlerStop
+        
+        elif update.message:
+            if not Security.rate_limit_check(
+                user.id, "message",
+                config.Config.RATE_LIMIT_MESSAGES,
+                config.Config.RATE_LIMIT_MESSAGE_PERIOD
+            ):
+                raise ApplicationHandlerStop
+            if update.message.document and not Security.rate_limit_check(
+                user.id, "import",
+                config.Config.RATE_LIMIT_IMPORTS,
+                config.Config.RATE_LIMIT_IMPORT_PERIOD
+            ):
+                await update.message.reply_text("⏳ Bạn nhập dữ liệu quá nhiều lần, vui lòng thử lại sau ít phút!")
+                raise ApplicationHandlerStop
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Xử lý lệnh /start"""
@@ -32,15 +134,13 @@ class TodoBot:
         chat_id = update.effective_chat.id
         
         # Lưu thông tin user vào database
-        session = db.get_session()
-        db_user = db.get_or_create_user(
-            session, 
-            user.id, 
-            user.username, 
-            user.first_name, 
+        await db.run(
+            db.get_or_create_user,
+            user.id,
+            user.username,
+            user.first_name,
             user.last_name
         )
-        session.close()
         
         welcome_text = f"""👋 Xin chào *{user.first_name}*!
 
@@ -59,10 +159,12 @@ Tôi là *TodoBot* - trợ lý quản lý công việc của bạn.
 /new - Thêm việc mới
 /list - Xem danh sách
 /today - Việc hôm nay
+/search - Tìm công việc
+/import - Nhập nhiều việc từ file
 /help - Trợ giúp
 
 Hãy bắt đầu bằng cách nhấn vào nút bên dưới!"""
-        
+
         await update.message.reply_text(
             welcome_text,
             parse_mode=ParseMode.MARKDOWN,
@@ -97,9 +199,10 @@ Hãy bắt đầu bằng cách nhấn vào nút bên dưới!"""
 • Dùng độ ưu tiên để sắp xếp công việc
 • Đặt hạn chót để nhận nhắc nhở
 • Xuất dữ liệu định kỳ để backup
+• Gửi file CSV/JSON/TXT để nhập nhiều việc cùng lúc (/import)
 
 Cần hỗ trợ thêm? Liên hệ @admin_username"""
-        
+
         await update.message.reply_text(
             help_text,
             parse_mode=ParseMode.MARKDOWN,
@@ -116,21 +219,14 @@ Cần hỗ trợ thêm? Liên hệ @admin_username"""
     
     async def today_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Xử lý lệnh /today - Hiển thị công việc hôm nay"""
-        session = db.get_session()
-        user = session.query(db.User).filter_by(telegram_id=update.effective_user.id).first()
+        user = await db.find_user(update.effective_user.id)
         
         if not user:
             await update.message.reply_text("❌ Không tìm thấy thông tin người dùng!")
-            session.close()
             return
         
         today = datetime.now().date()
-        tasks = session.query(db.Task).filter(
-            db.Task.user_id == user.id,
-            db.Task.due_date >= today,
-            db.Task.due_date < today + timedelta(days=1),
-            db.Task.completed == False
-        ).order_by(db.Task.priority, db.Task.due_date).all()
+        tasks = await db.run(db.get_today_tasks, user.id, today)
         
         if tasks:
             text = f"📅 *Công việc hôm nay ({today.strftime('%d/%m/%Y')})*\n\n"
@@ -138,8 +234,6 @@ Cần hỗ trợ thêm? Liên hệ @admin_username"""
         else:
             text = "🎉 Không có công việc nào cần làm hôm nay!"
         
-        session.close()
-        
         await update.message.reply_text(
             text,
             parse_mode=ParseMode.MARKDOWN,
@@ -147,227 +241,379 @@ Cần hỗ trợ thêm? Liên hệ @admin_username"""
         )
     
     async def button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Xử lý tất cả callback queries"""
+        """Xử lý tất cả callback queries theo bảng định tuyến trong router.py"""
         query = update.callback_query
         await query.answer()
         
-        data = query.data
-        user_id = query.from_user.id
-        
-        session = db.get_session()
-        user = session.query(db.User).filter_by(telegram_id=user_id).first()
-        
-        if not user:
-            await query.edit_message_text("❌ Lỗi: Không tìm thấy người dùng!")
-            session.close()
+        route, args = callbacks.decode(query.data)
+        if route:
+            metrics.relabel(f"callback:{route.name}")
+        if route and route.name in PLANNED_ACTIONS:
+            await query.answer("🚧 Tính năng đang được phát triển!", show_alert=True)
             return
         
-        # Xử lý các callback khác nhau
-        if data == "main_menu":
-            await self.show_main_menu(query)
-        
-        elif data == "view_tasks":
-            await self.show_tasks_list(query, session, user)
-        
-        elif data == "add_task":
-            await self.start_add_task(query, context)
-        
-        elif data.startswith("task_detail_"):
-            task_id = int(data.split("_")[2])
-            await self.show_task_detail(query, session, task_id)
-        
-        elif data.startswith("complete_"):
-            task_id = int(data.split("_")[1])
-            await self.complete_task(query, session, task_id)
-        
-        elif data.startswith("delete_task_"):
-            task_id = int(data.split("_")[2])
-            await self.confirm_delete_task(query, task_id)
-        
-        elif data.startswith("confirm_delete_"):
-            task_id = int(data.split("_")[2])
-            await self.delete_task(query, session, task_id)
-        
-        elif data.startswith("page_"):
-            page = int(data.split("_")[1])
-            await self.show_tasks_list(query, session, user, page)
-        
-        elif data == "settings":
-            await self.show_settings(query)
-        
-        elif data.startswith("set_priority_"):
-            parts = data.split("_")
-            task_id = int(parts[2])
-            priority = int(parts[3])
-            await self.set_task_priority(query, session, task_id, priority)
-        
-        elif data.startswith("set_category_"):
-            parts = data.split("_")
-            task_id = int(parts[2])
-            category_id = int(parts[3])
-            await self.set_task_category(query, session, task_id, category_id)
-        
-        elif data.startswith("set_duedate_"):
-            parts = data.split("_")
-            task_id = int(parts[2])
-            date_str = parts[3]
-            await self.set_task_duedate(query, session, task_id, date_str)
-        
-        elif data == "manage_categories":
-            await self.show_categories(query, session, user)
+        if route is None or route.name not in self.callback_handlers:
+            # Nút từ phiên bản cũ, dữ liệu hỏng, hoặc bước hội thoại đã kết thúc
+            await self.editor.edit(
+                query,
+                "⚠️ Nút này không còn hiệu lực, vui lòng dùng menu mới.",
+                reply_markup=TodoKeyboards.main_menu()
+            )
+            return
         
-        session.close()
+        # Chỉ tra cứu user với các route cần đến
+        prefix = [query]
+        if route.user:
+            user = await db.find_user(query.from_user.id)
+            if not user:
+                await self.editor.edit(query, "❌ Lỗi: Không tìm thấy người dùng!")
+                return
+            prefix.append(user)
+        if route.context:
+            prefix.append(context)
+        
+        await self.callback_handlers[route.name](*prefix, *args)
+    
+    async def show_import_help(self, query):
+        """Hiển thị hướng dẫn nhập dữ liệu"""
+        await self.editor.edit(
+            query,
+            IMPORT_HELP,
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=TodoKeyboards.settings_menu()
+        )
     
     async def show_main_menu(self, query):
         """Hiển thị menu chính"""
-        await query.edit_message_text(
+        await self.editor.edit(
+            query,
             "📋 *Menu chính*",
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=TodoKeyboards.main_menu()
         )
     
-    async def show_tasks_list(self, query, session, user, page=0):
+    async def cached_screen(self, telegram_id, key, render, *args):
+        """Lấy màn hình (text, bàn phím) từ render cache, chỉ render lại khi dữ liệu của user đã đổi"""
+        screen, token = render_cache.lookup(telegram_id, key)
+        if screen is None:
+            screen = await render(*args)
+            if screen is not None:
+                render_cache.store(token, screen)
+        return screen
+    
+    async def show_tasks_list(self, query, user, page=0, cursor=None, backward=False):
         """Hiển thị danh sách công việc"""
-        tasks = session.query(db.Task).filter_by(user_id=user.id).order_by(
-            db.Task.completed,
-            db.Task.priority,
-            db.Task.due_date
-        ).all()
+        text, reply_markup = await self.cached_screen(
+            user.telegram_id, ("list", page, cursor, backward),
+            self.render_tasks_list, user, page, cursor, backward
+        )
+        await self.editor.edit(query, text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+    
+    async def show_tasks_page(self, query, user, page, backward, completed, priority, due_date, task_id):
+        """Chuyển trang danh sách, mốc là khóa sắp xếp của task đầu/cuối trang liền kề"""
+        await self.show_tasks_list(query, user, page, (completed, priority, due_date, task_id), backward)
+    
+    async def render_tasks_list(self, user, page, cursor, backward):
+        total = await db.run(db.count_tasks, user.id)
         
-        if not tasks:
-            await query.edit_message_text(
+        if not total:
+            return (
                 "📭 Bạn chưa có công việc nào!\n\nNhấn '➕ Thêm việc mới' để bắt đầu.",
-                reply_markup=TodoKeyboards.main_menu()
+                TodoKeyboards.main_menu()
             )
-            return
         
-        # Phân trang
-        tasks_per_page = 5
-        total_pages = (len(tasks) + tasks_per_page - 1) // tasks_per_page
+        # Phân trang theo keyset, chỉ lấy các task của trang hiện tại
+        tasks = await db.run(db.get_tasks_page, user.id, TASKS_PER_PAGE, cursor, backward)
+        if not tasks:
+            # Mốc trang đã không còn hợp lệ (task bị xóa/sửa): quay về trang đầu
+            page = 0
+            tasks = await db.run(db.get_tasks_page, user.id, TASKS_PER_PAGE)
+        
+        total_pages = (total + TASKS_PER_PAGE - 1) // TASKS_PER_PAGE
+        page = min(page, total_pages - 1)
         
         text = f"📋 *Danh sách công việc* (Trang {page + 1}/{total_pages})\n\n"
-        text += formatter.format_tasks_list(tasks)
+        text += formatter.format_tasks_list(tasks, start=page * TASKS_PER_PAGE + 1)
+        return text, TodoKeyboards.task_list(tasks, page, total_pages)
+    
+    async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Xử lý lệnh /search <từ khóa> - Tìm công việc theo tiêu đề và mô tả"""
+        user = await db.find_user(update.effective_user.id)
         
-        await query.edit_message_text(
-            text,
-            parse_mode=ParseMode.MARKDOWN,
-            reply_markup=TodoKeyboards.task_list(tasks, page, tasks_per_page)
+        if not user:
+            await update.message.reply_text("❌ Không tìm thấy thông tin người dùng!")
+            return
+        
+        search_query = " ".join(context.args)
+        if not search_terms(search_query):
+            await update.message.reply_text(
+                "🔍 Nhập từ khóa sau lệnh, ví dụ: `/search mua sữa`",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        # Lưu từ khóa để các nút chuyển trang không phải mang theo trong callback_data
+        context.user_data["search_query"] = search_query
+        text, reply_markup = await self.render_search_results(user, search_query, 0)
+        await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+    
+    async def show_search_results(self, query, user, context, page):
+        """Chuyển trang kết quả tìm kiếm"""
+        search_query = context.user_data.get("search_query")
+        if not search_query:
+            await self.editor.edit(
+                query,
+                "🔍 Phiên tìm kiếm đã hết hạn, hãy dùng lại lệnh /search.",
+                reply_markup=TodoKeyboards.main_menu()
+            )
+            return
+        
+        text, reply_markup = await self.render_search_results(user, search_query, page)
+        await self.editor.edit(query, text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+    
+    async def render_search_results(self, user, search_query, page):
+        # Lấy thêm một task để biết còn trang sau hay không
+        tasks = await db.run(
+            db.search_tasks, user.id, search_query, TASKS_PER_PAGE + 1, page * TASKS_PER_PAGE
         )
+        has_next = len(tasks) > TASKS_PER_PAGE
+        tasks = tasks[:TASKS_PER_PAGE]
+        
+        keywords = " ".join(search_terms(search_query))
+        if not tasks:
+            return f"🔍 Không tìm thấy công việc nào với từ khóa \"{keywords}\"", TodoKeyboards.main_menu()
+        
+        text = f"🔍 *Kết quả tìm kiếm:* {keywords} (Trang {page + 1})\n\n"
+        text += formatter.format_tasks_list(tasks, start=page * TASKS_PER_PAGE + 1)
+        return text, TodoKeyboards.search_results(tasks, page, has_next)
     
-    async def show_task_detail(self, query, session, task_id):
+    async def show_task_detail(self, query, task_id):
         """Hiển thị chi tiết công việc"""
-        task = session.query(db.Task).filter_by(id=task_id).first()
+        screen = await self.cached_screen(
+            query.from_user.id, ("detail", task_id), self.render_task_detail, task_id
+        )
         
-        if not task:
+        if not screen:
             await query.answer("❌ Công việc không tồn tại!", show_alert=True)
             return
         
-        text = formatter.format_task(task)
-        
-        await query.edit_message_text(
-            text,
-            parse_mode=ParseMode.MARKDOWN,
-            reply_markup=TodoKeyboards.task_detail(task_id)
-        )
+        text, reply_markup = screen
+        await self.editor.edit(query, text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+    
+    async def render_task_detail(self, task_id):
+        task = await db.run(db.get_task, task_id)
+        if not task:
+            return None
+        return formatter.format_task(task), TodoKeyboards.task_detail(task_id)
     
-    async def complete_task(self, query, session, task_id):
+    async def complete_task(self, query, task_id):
         """Đánh dấu công việc đã hoàn thành"""
-        task = session.query(db.Task).filter_by(id=task_id).first()
+        completed = await db.run(db.toggle_task, task_id)  # Toggle trạng thái
         
-        if not task:
+        if completed is None:
             await query.answer("❌ Công việc không tồn tại!", show_alert=True)
             return
+        render_cache.bump(query.from_user.id)
         
-        task.completed = not task.completed  # Toggle trạng thái
-        session.commit()
-        
-        status = "đã hoàn thành" if task.completed else "chưa hoàn thành"
+        status = "đã hoàn thành" if completed else "chưa hoàn thành"
         await query.answer(f"✅ Công việc {status}!")
         
         # Cập nhật lại view
-        await self.show_task_detail(query, session, task_id)
+        await self.show_task_detail(query, task_id)
     
     async def confirm_delete_task(self, query, task_id):
         """Xác nhận xóa công việc"""
-        await query.edit_message_text(
+        await self.editor.edit(
+            query,
             "🗑️ *Xác nhận xóa*\n\nBạn có chắc chắn muốn xóa công việc này?",
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=TodoKeyboards.confirm_delete(task_id)
         )
     
-    async def delete_task(self, query, session, task_id):
+    async def delete_task(self, query, user, task_id):
         """Xóa công việc"""
-        task = session.query(db.Task).filter_by(id=task_id).first()
-        
-        if task:
-            session.delete(task)
-            session.commit()
+        if await db.run(db.delete_task, task_id):
+            render_cache.bump(user.telegram_id)
             await query.answer("🗑️ Công việc đã bị xóa!", show_alert=True)
         
-        await self.show_tasks_list(query, session, task.user)
+        await self.show_tasks_list(query, user)
     
-    async def start_add_task(self, query, context):
+    async def start_add_task(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Bắt đầu quá trình thêm công việc mới"""
-        await query.edit_message_text(
-            "📝 *Thêm công việc mới*\n\nVui lòng nhập *tiêu đề* công việc:",
-            parse_mode=ParseMode.MARKDOWN
-        )
+        text = "📝 *Thêm công việc mới*\n\nVui lòng nhập *tiêu đề* công việc:"
+        
+        # Có thể bắt đầu từ nút bấm hoặc lệnh /new
+        if update.callback_query:
+            await update.callback_query.answer()
+            await self.editor.edit(update.callback_query, text, parse_mode=ParseMode.MARKDOWN)
+        else:
+            await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
         context.user_data['adding_task'] = True
         return TITLE
     
     async def show_settings(self, query):
         """Hiển thị menu cài đặt"""
-        await query.edit_message_text(
+        await self.editor.edit(
+            query,
             "⚙️ *Cài đặt*",
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=TodoKeyboards.settings_menu()
         )
     
-    async def set_task_priority(self, query, session, task_id, priority):
-        """Thiết lập độ ưu tiên cho task"""
-        task = session.query(db.Task).filter_by(id=task_id).first()
+    async def show_export_options(self, query):
+        """Hiển thị các định dạng xuất dữ liệu"""
+        await self.editor.edit(
+            query,
+            "📤 *Xuất dữ liệu*\n\nChọn định dạng file:",
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=TodoKeyboards.export_options()
+        )
+    
+    async def export_data(self, query, user, fmt, encrypt):
+        """Xuất toàn bộ công việc của user và gửi dưới dạng file"""
+        if fmt not in EXPORT_FORMATS:
+            return
         
-        if task:
-            task.priority = priority
-            session.commit()
+        await self.editor.edit(query, "⏳ Đang xuất dữ liệu...")
+        file, filename = await db.run(exporter.export, user.id, fmt, encrypt)
+        try:
+            caption = "📤 Dữ liệu công việc của bạn"
+            if encrypt:
+                caption += " (đã mã hóa)"
+            # Gửi thẳng từ file handle, không đọc toàn bộ file vào bộ nhớ
+            await query.message.reply_document(
+                document=InputFile(file, filename=filename, read_file_handle=False),
+                caption=caption
+            )
+        finally:
+            file.close()
+        
+        await self.editor.edit(
+            query,
+            "✅ Đã xuất dữ liệu!",
+            reply_markup=TodoKeyboards.settings_menu()
+        )
+    
+    async def import_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Xử lý lệnh /import - Hướng dẫn nhập dữ liệu"""
+        await update.message.reply_text(IMPORT_HELP, parse_mode=ParseMode.MARKDOWN)
+    
+    async def import_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Nhập nhiều công việc từ file người dùng gửi lên"""
+        document = update.message.document
+        user = await db.find_user(update.effective_user.id)
+        
+        if not user:
+            await update.message.reply_text("❌ Không tìm thấy thông tin người dùng!")
+            return
+        
+        fmt, encrypted = importer.detect_format(document.file_name)
+        if fmt not in IMPORT_FORMATS:
+            await update.message.reply_text("❌ Chỉ hỗ trợ file .csv, .json hoặc .txt!")
+            return
+        
+        if document.file_size and document.file_size > config.Config.IMPORT_MAX_SIZE:
+            await update.message.reply_text("❌ File quá lớn!")
+            return
+        
+        status = await update.message.reply_text("⏳ Đang nhập dữ liệu...")
+        
+        # Tải file vào file tạm (chuyển sang đĩa khi lớn) rồi đọc dần từng dòng
+        file = SpooledTemporaryFile(max_size=config.Config.EXPORT_SPOOL_SIZE)
+        try:
+            telegram_file = await document.get_file()
+            await telegram_file.download_to_memory(out=file)
+            file.seek(0)
+            result = await db.run(importer.import_tasks, user.id, file, fmt, encrypted)
+        except Exception:
+            # Lô đã ghi vẫn được giữ; không để tin nhắn trạng thái treo ở "Đang nhập"
+            render_cache.bump(user.telegram_id)
+            await status.edit_text("❌ Nhập dữ liệu thất bại, vui lòng thử lại!", reply_markup=TodoKeyboards.main_menu())
+            raise
+        finally:
+            file.close()
+        render_cache.bump(user.telegram_id)
+        
+        logger.info(
+            "User %s nhập %d task (%d lỗi) trong %.2fs",
+            user.telegram_id, result["imported"], result["rejected"], result["duration"]
+        )
+        await status.edit_text(
+            importer.format_report(result),
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=TodoKeyboards.main_menu()
+        )
+    
+    async def set_task_priority(self, query, task_id, priority):
+        """Thiết lập độ ưu tiên cho task"""
+        if await db.run(db.update_task, task_id, priority=priority):
+            render_cache.bump(query.from_user.id)
             await query.answer(f"🏷️ Đã đặt độ ưu tiên!", show_alert=True)
-            await self.show_task_detail(query, session, task_id)
+            await self.show_task_detail(query, task_id)
     
-    async def set_task_category(self, query, session, task_id, category_id):
+    async def set_task_category(self, query, task_id, category_id):
         """Thiết lập danh mục cho task"""
-        task = session.query(db.Task).filter_by(id=task_id).first()
-        category = session.query(db.Category).filter_by(id=category_id).first()
+        category_name = await db.run(db.set_task_category, task_id, category_id)
         
-        if task and category:
-            task.category = category
-            session.commit()
-            await query.answer(f"📂 Đã chọn danh mục: {category.name}!", show_alert=True)
-            await self.show_task_detail(query, session, task_id)
+        if category_name:
+            render_cache.bump(query.from_user.id)
+            await query.answer(f"📂 Đã chọn danh mục: {category_name}!", show_alert=True)
+            await self.show_task_detail(query, task_id)
     
-    async def set_task_duedate(self, query, session, task_id, date_str):
+    async def set_task_duedate(self, query, task_id, due):
         """Thiết lập hạn chót cho task"""
-        task = session.query(db.Task).filter_by(id=task_id).first()
-        due_date = date_utils.parse_date(date_str)
+        due_date = datetime.combine(due, time.min)
         
-        if task and due_date:
-            task.due_date = due_date
-            session.commit()
+        if await db.run(db.update_task, task_id, due_date=due_date):
+            render_cache.bump(query.from_user.id)
             await query.answer(f"📅 Đã đặt hạn chót: {date_utils.format_date(due_date)}!", show_alert=True)
-            await self.show_task_detail(query, session, task_id)
+            await self.show_task_detail(query, task_id)
     
-    async def show_categories(self, query, session, user):
+    async def show_reminder_options(self, query, task_id):
+        """Hiển thị các lựa chọn giờ nhắc nhở"""
+        await self.editor.edit(
+            query,
+            "⏰ *Đặt nhắc nhở*\n\nChọn thời điểm nhắc:",
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=TodoKeyboards.reminder_buttons(task_id)
+        )
+    
+    async def set_task_reminder(self, query, task_id, option):
+        """Thiết lập (hoặc tắt) nhắc nhở cho task"""
+        now = datetime.now()
+        if option == "off":
+            remind_at = None
+        elif option == "tomorrow":
+            remind_at = datetime.combine(now.date() + timedelta(days=1), time(9, 0))
+        else:
+            remind_at = now + timedelta(minutes=int(option))
+        
+        if not await db.run(db.update_task, task_id, remind_at=remind_at):
+            await query.answer("❌ Công việc không tồn tại!", show_alert=True)
+            return
+        render_cache.bump(query.from_user.id)
+        
+        if remind_at:
+            self.reminders.schedule(task_id, remind_at)
+            await query.answer(f"⏰ Sẽ nhắc lúc {remind_at.strftime('%H:%M %d/%m/%Y')}!", show_alert=True)
+        else:
+            await query.answer("🔕 Đã tắt nhắc nhở!", show_alert=True)
+        await self.show_task_detail(query, task_id)
+    
+    async def show_categories(self, query, user):
         """Hiển thị danh sách danh mục"""
-        categories = session.query(db.Category).filter_by(user_id=user.id).all()
+        categories = await db.run(db.get_category_counts, user.id)
         
         if not categories:
             text = "📂 Bạn chưa có danh mục nào!"
         else:
             text = "📂 *Danh sách danh mục*\n\n"
-            for cat in categories:
-                task_count = session.query(db.Task).filter_by(category_id=cat.id).count()
-                text += f"• {cat.name}: {task_count} công việc\n"
+            for name, task_count, completed_count in categories:
+                open_count = task_count - completed_count
+                text += f"• {name}: {task_count} công việc (✅ {completed_count} · ⬜ {open_count})\n"
         
-        await query.edit_message_text(
+        await self.editor.edit(
+            query,
             text,
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=TodoKeyboards.main_menu()
@@ -389,10 +635,8 @@ Cần hỗ trợ thêm? Liên hệ @admin_username"""
         context.user_data['task_description'] = ""
         
         # Lấy danh sách danh mục
-        session = db.get_session()
-        user = session.query(db.User).filter_by(telegram_id=update.effective_user.id).first()
-        categories = session.query(db.Category).filter_by(user_id=user.id).all()
-        session.close()
+        user = await db.find_user(update.effective_user.id)
+        categories = await db.run(db.get_categories, user.id)
         
         await update.message.reply_text(
             "📂 *Chọn danh mục:*",
@@ -406,10 +650,8 @@ Cần hỗ trợ thêm? Liên hệ @admin_username"""
         context.user_data['task_description'] = update.message.text
         
         # Lấy danh sách danh mục
-        session = db.get_session()
-        user = session.query(db.User).filter_by(telegram_id=update.effective_user.id).first()
-        categories = session.query(db.Category).filter_by(user_id=user.id).all()
-        session.close()
+        user = await db.find_user(update.effective_user.id)
+        categories = await db.run(db.get_categories, user.id)
         
         await update.message.reply_text(
             "📂 *Chọn danh mục:*",
@@ -423,9 +665,14 @@ Cần hỗ trợ thêm? Liên hệ @admin_username"""
         query = update.callback_query
         await query.answer()
         
-        context.user_data['category_id'] = int(query.data.split("_")[2])
+        route, args = callbacks.decode(query.data)
+        # Dữ liệu hỏng hoặc giả mạo: giữ nguyên bước hiện tại để user chọn lại
+        if route is None:
+            return CATEGORY
+        context.user_data['category_id'], = args
         
-        await query.edit_message_text(
+        await self.editor.edit(
+            query,
             "🏷️ *Chọn độ ưu tiên:*",
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=TodoKeyboards.priority_buttons()
@@ -437,9 +684,13 @@ Cần hỗ trợ thêm? Liên hệ @admin_username"""
         query = update.callback_query
         await query.answer()
         
-        context.user_data['priority'] = int(query.data.split("_")[1])
+        route, args = callbacks.decode(query.data)
+        if route is None:
+            return PRIORITY
+        context.user_data['priority'], = args
         
-        await query.edit_message_text(
+        await self.editor.edit(
+            query,
             "📅 *Chọn hạn chót:*",
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=TodoKeyboards.due_date_buttons()
@@ -451,15 +702,18 @@ Cần hỗ trợ thêm? Liên hệ @admin_username"""
         query = update.callback_query
         await query.answer()
         
-        if query.data == "custom_date":
-            await query.edit_message_text(
+        route, args = callbacks.decode(query.data)
+        if route is None:
+            return DUE_DATE
+        if route.name == "custom_date":
+            await self.editor.edit(
+                query,
                 "📅 Vui lòng nhập ngày (định dạng YYYY-MM-DD):\n\nVí dụ: 2024-12-31",
                 parse_mode=ParseMode.MARKDOWN
             )
             return DUE_DATE
         
-        date_str = query.data.split("_")[1]
-        context.user_data['due_date'] = date_str
+        context.user_data['due_date'] = args[0].isoformat()
         
         # Lưu task vào database
         await self.save_task(update, context)
@@ -487,14 +741,12 @@ Cần hỗ trợ thêm? Liên hệ @admin_username"""
         task_data = context.user_data
         
         # Tạo task mới
-        session = db.get_session()
-        user = session.query(db.User).filter_by(
-            telegram_id=update.effective_user.id
-        ).first()
+        user = await db.find_user(update.effective_user.id)
         
         due_date = date_utils.parse_date(task_data.get('due_date'))
         
-        task = db.Task(
+        await db.run(
+            db.add_task,
             user_id=user.id,
             category_id=task_data.get('category_id'),
             title=task_data.get('task_title'),
@@ -502,17 +754,15 @@ Cần hỗ trợ thêm? Liên hệ @admin_username"""
             priority=task_data.get('priority', 2),
             due_date=due_date
         )
-        
-        session.add(task)
-        session.commit()
-        session.close()
+        render_cache.bump(update.effective_user.id)
         
         # Xóa dữ liệu tạm
         context.user_data.clear()
         
         # Gửi thông báo thành công
         if update.callback_query:
-            await update.callback_query.edit_message_text(
+            await self.editor.edit(
+                update.callback_query,
                 "✅ *Công việc đã được thêm thành công!*",
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=TodoKeyboards.main_menu()
@@ -533,48 +783,188 @@ Cần hỗ trợ thêm? Liên hệ @admin_username"""
         )
         return ConversationHandler.END
     
-    def run(self):
-        """Khởi chạy bot"""
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Xử lý lệnh /stats - Số liệu hiệu năng, chỉ dành cho admin"""
+        admin_id = config.Config.ADMIN_USER_ID
+        if not admin_id or update.effective_user.id != admin_id:
+            return
+        
+        await update.message.reply_text(metrics.summary(), parse_mode=ParseMode.MARKDOWN)
+    
+    async def post_stop(self, application):
+        """Gửi nốt các lần sửa tin nhắn đang chờ trước khi đóng kết nối Bot API"""
+        await self.editor.drain()
+    
+    async def post_shutdown(self, application):
+        """Dọn dẹp tài nguyên khi bot dừng"""
+        db.close()
+    
+    def build_application(self):
+        """Tạo application và đăng ký handlers"""
         # Tạo application
-        self.application = Application.builder().token(config.Config.BOT_TOKEN).build()
+        self.application = (
+            Application.builder()
+            .token(config.Config.BOT_TOKEN)
+            .base_url(config.Config.BOT_API_URL)
+            .rate_limiter(OutboundRateLimiter(
+                global_rate=config.Config.OUTBOUND_GLOBAL_RATE,
+                chat_interval=config.Config.OUTBOUND_CHAT_INTERVAL,
+                chat_burst=config.Config.OUTBOUND_CHAT_BURST,
+                max_retries=config.Config.OUTBOUND_MAX_RETRIES
+            ))
+            .concurrent_updates(ChatSerializedUpdateProcessor(config.Config.CONCURRENT_UPDATES))
+            .persistence(DatabasePersistence(
+                update_interval=config.Config.PERSISTENCE_INTERVAL,
+                cache_size=config.Config.PERSISTENCE_CACHE_SIZE
+            ))
+            .post_stop(self.post_stop)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
+        
+        # Mọi handler được đo độ trễ, số câu lệnh SQL và request Bot API (xem metrics.py)
+        timed = metrics.instrument
+        if query_debugger.installed:
+            # SQL_DEBUG: gom câu lệnh SQL của từng lần chạy handler để phát hiện N+1
+            timed = lambda callback: metrics.instrument(query_debugger.trace(callback))
+        
+        # Giới hạn tần suất, chạy trước các handler khác
+        self.application.add_handler(TypeHandler(Update, timed(self.rate_limit_guard)), group=-1)
         
         # Thêm command handlers
-        self.application.add_handler(CommandHandler("start", self.start))
-        self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("todo", self.todo_command))
-        self.application.add_handler(CommandHandler("today", self.today_command))
-        self.application.add_handler(CommandHandler("new", self.start_add_task))
+        self.application.add_handler(CommandHandler("start", timed(self.start)))
+        self.application.add_handler(CommandHandler("help", timed(self.help_command)))
+        self.application.add_handler(CommandHandler("todo", timed(self.todo_command)))
+        self.application.add_handler(CommandHandler("today", timed(self.today_command)))
+        self.application.add_handler(CommandHandler("import", timed(self.import_command)))
+        self.application.add_handler(CommandHandler("search", timed(self.search_command)))
+        self.application.add_handler(CommandHandler("stats", timed(self.stats_command)))
         
         # Thêm conversation handler cho thêm task
         conv_handler = ConversationHandler(
             entry_points=[
-                CallbackQueryHandler(self.start_add_task, pattern="^add_task$"),
-                CommandHandler("new", self.start_add_task)
+                CallbackQueryHandler(timed(self.start_add_task), pattern=callbacks.pattern("add_task")),
+                CommandHandler("new", timed(self.start_add_task))
             ],
             states={
-                TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.receive_task_title)],
+                TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(self.receive_task_title))],
                 DESCRIPTION: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.receive_task_description),
-                    CommandHandler("skip", self.skip_description)
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, timed(self.receive_task_description)),
+                    CommandHandler("skip", timed(self.skip_description))
                 ],
-                CATEGORY: [CallbackQueryHandler(self.receive_category, pattern="^select_category_")],
-                PRIORITY: [CallbackQueryHandler(self.receive_priority, pattern="^priority_")],
+                CATEGORY: [CallbackQueryHandler(timed(self.receive_category), pattern=callbacks.pattern("select_category"))],
+                PRIORITY: [CallbackQueryHandler(timed(self.receive_priority), pattern=callbacks.pattern("priority"))],
                 DUE_DATE: [
-                    CallbackQueryHandler(self.receive_duedate, pattern="^duedate_"),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.receive_custom_date)
+                    CallbackQueryHandler(timed(self.receive_duedate), pattern=callbacks.pattern("duedate")),
+                    CallbackQueryHandler(timed(self.receive_duedate), pattern=callbacks.pattern("custom_date")),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, timed(self.receive_custom_date))
                 ]
             },
-            fallbacks=[CommandHandler("cancel", self.cancel)],
+            fallbacks=[CommandHandler("cancel", timed(self.cancel))],
+            # Hội thoại bỏ dở tự kết thúc để trạng thái lưu trong database không tích tụ
+            conversation_timeout=config.Config.CONVERSATION_TIMEOUT,
+            # Nhấn "Thêm việc mới" giữa chừng thì bắt đầu lại từ đầu
+            allow_reentry=True,
+            # Giữ hội thoại dở dang qua các lần khởi động lại
+            name="add_task",
+            persistent=True
         )
         
         self.application.add_handler(conv_handler)
         
         # Thêm callback query handler
-        self.application.add_handler(CallbackQueryHandler(self.button_handler))
+        self.application.add_handler(CallbackQueryHandler(timed(self.button_handler)))
+        self.application.add_handler(MessageHandler(filters.Document.ALL, timed(self.import_document)))
+        
+        # Số liệu cache và bộ đệm cho /metrics và /stats
+        metrics.register("render_cache", render_cache.stats)
+        metrics.register("user_cache", db.user_cache.stats)
+        metrics.register("keyboards", TodoKeyboards.cache_stats)
+        metrics.register("editor", self.editor.stats)
+        metrics.register("outbound", self.application.bot.rate_limiter.stats)
+        metrics.register("persistence", self.application.persistence.stats)
+        
+        # Job gửi nhắc nhở
+        self.reminders.start(self.application.job_queue)
+        
+        # Backup hàng ngày và bảo trì database (chỉ với SQLite, và chỉ ở worker đầu tiên)
+        if db.sqlite_path and config.Config.SHARD_INDEX == 0:
+            create_backup_manager(db.sqlite_path).schedule_backups(self.application.job_queue)
+            db.schedule_maintenance(self.application.job_queue)
+        
+        return self.application
+    
+    async def run_webhook(self):
+        """Chạy bot ở chế độ webhook với máy chủ HTTP riêng (có /health)"""
+        server = WebhookServer(
+            self.application,
+            config.Config.WEBHOOK_HOST,
+            config.Config.PORT,
+            config.Config.WEBHOOK_PATH,
+            config.Config.WEBHOOK_SECRET
+        )
+        servers = [server]
+        
+        # /metrics không được lộ ra cổng public khi chưa có token; worker của chế độ
+        # sharded vốn chỉ nghe trên 127.0.0.1 nên không cần
+        public_metrics = config.Config.METRICS_TOKEN or config.Config.WEBHOOK_HOST in LOOPBACK_HOSTS
+        if public_metrics:
+            server.add_route("GET", "/metrics", metrics.serve)
+        if config.Config.METRICS_PORT:
+            internal = WebhookServer(
+                self.application,
+                config.Config.METRICS_HOST,
+                config.Config.METRICS_PORT + config.Config.SHARD_INDEX,
+                None
+            )
+            internal.add_route("GET", "/metrics", metrics.serve)
+            servers.append(internal)
+        elif not public_metrics:
+            logger.warning("Chưa đặt METRICS_TOKEN hoặc METRICS_PORT: không phục vụ /metrics")
+        
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        
+        async with self.application:
+            await self.application.start()
+            # Worker của chế độ sharded nhận update từ front, không đăng ký webhook
+            if config.Config.WEBHOOK_URL and config.Config.BOT_MODE == "webhook":
+                await self.application.bot.set_webhook(
+                    url=config.Config.WEBHOOK_URL.rstrip("/") + config.Config.WEBHOOK_PATH,
+                    secret_token=config.Config.WEBHOOK_SECRET or None,
+                    allowed_updates=Update.ALL_TYPES
+                )
+            for running in servers:
+                await running.start()
+            
+            try:
+                await stop_event.wait()
+            finally:
+                for running in servers:
+                    await running.stop()
+                await self.application.stop()
+                await self.post_stop(self.application)
+        
+        await self.post_shutdown(self.application)
+    
+    def run(self):
+        """Khởi chạy bot"""
+        if config.Config.BOT_MODE == "sharded":
+            # Tiến trình front: chỉ chia update cho các worker (xem shard.py)
+            print(f"🤖 Bot đang chạy với {config.Config.SHARD_WORKERS} worker...")
+            asyncio.run(shard.run_front())
+            return
+        
+        self.build_application()
         
         # Chạy bot
         print("🤖 Bot đang chạy...")
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if config.Config.BOT_MODE in ("webhook", "worker"):
+            asyncio.run(self.run_webhook())
+        else:
+            self.application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     bot = TodoBot()
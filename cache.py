@@ -0,0 +1,116 @@
+"""Cache trong bộ nhớ dùng chung cho bot"""
+import itertools
+import threading
+import time
+from collections import OrderedDict
+import config
+
+class LRUCache:
+    """Cache LRU giới hạn số phần tử, có thể kèm thời gian sống (TTL, giây)
+    
+    An toàn khi dùng từ nhiều thread (handler và thread pool database).
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+    
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def pop(self, key):
+        """Xóa một phần tử khỏi cache (invalidate)"""
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[0] if item else None
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
+    
+    def stats(self):
+        """Số liệu hit/miss của cache"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+class RenderCache:
+    """Cache các màn hình đã render (text, bàn phím) theo user
+    
+    Mỗi user có một số phiên bản dữ liệu, tăng lên ở mọi thao tác sửa dữ liệu
+    của user đó. Khóa cache gồm phiên bản nên màn hình cũ tự mất hiệu lực mà
+    không cần xóa; các mục lỗi thời bị đẩy ra theo LRU.
+    """
+    def __init__(self, maxsize=10000, ttl=None, max_users=100000):
+        self.entries = LRUCache(maxsize, ttl)
+        self.versions = LRUCache(max_users)
+        self.bumps = 0
+        # Phiên bản lấy từ bộ đếm chung: user bị đẩy khỏi versions rồi quay lại
+        # nhận số mới, không trùng với các mục cũ còn trong cache
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+    
+    def version(self, user_id):
+        with self._lock:
+            version = self.versions.get(user_id)
+            if version is None:
+                version = next(self._counter)
+                self.versions.set(user_id, version)
+            return version
+    
+    def bump(self, user_id):
+        """Đánh dấu dữ liệu của user đã thay đổi"""
+        with self._lock:
+            self.versions.set(user_id, next(self._counter))
+            self.bumps += 1
+    
+    def lookup(self, user_id, key):
+        """Trả về (màn hình đã cache hoặc None, token dùng cho store)
+        
+        Phiên bản được chốt trước khi đọc dữ liệu, nên màn hình render từ dữ
+        liệu cũ không thể được lưu dưới phiên bản mới.
+        """
+        token = (user_id, self.version(user_id), key)
+        return self.entries.get(token), token
+    
+    def store(self, token, screen):
+        self.entries.set(token, screen)
+    
+    def stats(self):
+        stats = self.entries.stats()
+        stats["bumps"] = self.bumps
+        return stats
+
+render_cache = RenderCache(
+    maxsize=config.Config.RENDER_CACHE_SIZE,
+    ttl=config.Config.RENDER_CACHE_TTL
+)
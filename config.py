@@ -3,18 +3,162 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def parse_rate_limits(value):
+    """Đọc "tên:lần/giây,..." thành {tên: (lần, giây)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rate = item.partition(":")
+        count, _, period = rate.partition("/")
+        limits[name.strip()] = (int(count), int(period))
+    return limits
+
 class Config:
     # Bot token từ BotFather
     BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
     
+    # Địa chỉ Bot API (đổi sang server giả lập khi chạy thử cục bộ)
+    BOT_API_URL = os.getenv("BOT_API_URL", "https://api.telegram.org/bot")
+    
+    # Chế độ nhận update: "polling", "webhook" hoặc "sharded" (nhiều worker, xem shard.py)
+    BOT_MODE = os.getenv("BOT_MODE", "polling")
+    
+    # Cấu hình webhook (Render tự đặt PORT và RENDER_EXTERNAL_URL)
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL", os.getenv("RENDER_EXTERNAL_URL", ""))
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    PORT = int(os.getenv("PORT", 8080))
+    
+    # Số update xử lý song song (update trong cùng một chat vẫn xử lý tuần tự)
+    CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 8))
+    
+    # Chế độ nhiều worker (BOT_MODE=sharded): tiến trình front nhận webhook và chia
+    # update theo user cho SHARD_WORKERS tiến trình worker lắng nghe từ SHARD_BASE_PORT
+    SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", 2))
+    SHARD_BASE_PORT = int(os.getenv("SHARD_BASE_PORT", 9100))
+    # Số kết nối song song từ front tới mỗi worker, và số update được giữ khi worker đang khởi động lại
+    SHARD_LANES = int(os.getenv("SHARD_LANES", 8))
+    SHARD_QUEUE_SIZE = int(os.getenv("SHARD_QUEUE_SIZE", 1000))
+    # Tổng số kết nối database chia đều cho các worker
+    SHARD_DB_CONNECTIONS = int(os.getenv("SHARD_DB_CONNECTIONS", 40))
+    # Do front đặt cho từng worker: worker SHARD_INDEX xử lý các user có abs(user_id) % SHARD_COUNT == SHARD_INDEX
+    SHARD_INDEX = int(os.getenv("SHARD_INDEX", 0))
+    SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))
+    
+    # Giới hạn tần suất thao tác của mỗi user (số lần trong một khoảng giây)
+    RATE_LIMIT_CALLBACKS = int(os.getenv("RATE_LIMIT_CALLBACKS", 20))
+    RATE_LIMIT_CALLBACK_PERIOD = int(os.getenv("RATE_LIMIT_CALLBACK_PERIOD", 10))
+    RATE_LIMIT_MESSAGES = int(os.getenv("RATE_LIMIT_MESSAGES", 10))
+    RATE_LIMIT_MESSAGE_PERIOD = int(os.getenv("RATE_LIMIT_MESSAGE_PERIOD", 10))
+    # RATE_LIMIT_CALLBACKS áp dụng cho từng route callback; đây là tổng mọi route trong cùng khoảng thời gian
+    RATE_LIMIT_CALLBACKS_TOTAL = int(os.getenv("RATE_LIMIT_CALLBACKS_TOTAL", 60))
+    # Xuất/nhập dữ liệu tốn nhiều tài nguyên nên có bucket riêng, chặt hơn
+    RATE_LIMIT_EXPORTS = int(os.getenv("RATE_LIMIT_EXPORTS", 3))
+    RATE_LIMIT_EXPORT_PERIOD = int(os.getenv("RATE_LIMIT_EXPORT_PERIOD", 60))
+    RATE_LIMIT_IMPORTS = int(os.getenv("RATE_LIMIT_IMPORTS", 3))
+    RATE_LIMIT_IMPORT_PERIOD = int(os.getenv("RATE_LIMIT_IMPORT_PERIOD", 60))
+    # Giới hạn riêng theo tên route trong router.py, dạng "route:lần/giây,..."
+    # (ví dụ "page:40/10,search:10/10"); route khác dùng RATE_LIMIT_CALLBACKS
+    RATE_LIMIT_ROUTES = {
+        "export": (RATE_LIMIT_EXPORTS, RATE_LIMIT_EXPORT_PERIOD),
+        **parse_rate_limits(os.getenv("RATE_LIMIT_ROUTES", ""))
+    }
+    
+    # Giới hạn gửi tin của Telegram: toàn bot mỗi giây, và khoảng cách giữa các tin trong một chat
+    OUTBOUND_GLOBAL_RATE = int(os.getenv("OUTBOUND_GLOBAL_RATE", 30))
+    OUTBOUND_CHAT_INTERVAL = float(os.getenv("OUTBOUND_CHAT_INTERVAL", 1.0))
+    OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", 3))
+    OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 3))
+    # Số tin nhắn được ghi nhớ nội dung để bỏ qua các lần sửa không đổi gì
+    EDIT_FINGERPRINT_SIZE = int(os.getenv("EDIT_FINGERPRINT_SIZE", 10000))
+    
     # ID admin (lấy từ @userinfobot trên Telegram)
     ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID", 0))
     
+    # Token bảo vệ GET /metrics (gửi kèm header "Authorization: Bearer <token>"). Cổng
+    # webhook public chỉ phục vụ /metrics khi đã đặt token
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+    # Cổng nội bộ riêng cho /metrics (0: tắt); worker thứ i của chế độ sharded dùng METRICS_PORT + i
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+    
     # Cấu hình database
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///todo_bot.db")
     
+    # Số thread tối đa chạy truy vấn database (không chặn event loop)
+    DB_WORKERS = int(os.getenv("DB_WORKERS", 4))
+    
+    # Pool kết nối: mỗi thread database một kết nối, thêm chỗ cho luồng chính và job nền
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", DB_WORKERS + 2))
+    DB_POOL_OVERFLOW = int(os.getenv("DB_POOL_OVERFLOW", 4))
+    
+    # PRAGMA cho SQLite, áp dụng cho mọi kết nối
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+    SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 16 * 1024))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 128 * 1024 * 1024))
+    
+    # Chu kỳ (phút) chạy PRAGMA optimize và checkpoint WAL
+    DB_MAINTENANCE_MINUTES = int(os.getenv("DB_MAINTENANCE_MINUTES", 60))
+    
+    # Gỡ lỗi SQL khi phát triển (xem query_debug.py): cảnh báo N+1 và ghi log truy vấn chậm.
+    # Một dạng câu lệnh lặp lại từ SQL_N_PLUS_ONE_THRESHOLD lần trong một handler bị coi là N+1
+    SQL_DEBUG = os.getenv("SQL_DEBUG", "0") == "1"
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", 5))
+    SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", 100))
+    SQL_DEBUG_LOG = os.getenv("SQL_DEBUG_LOG", "logs/sql_debug.log")
+    SQL_DEBUG_LOG_SIZE = int(os.getenv("SQL_DEBUG_LOG_SIZE", 5 * 1024 * 1024))
+    SQL_DEBUG_LOG_BACKUPS = int(os.getenv("SQL_DEBUG_LOG_BACKUPS", 3))
+    
+    # Cache Telegram ID -> user (số phần tử tối đa, thời gian sống tính bằng giây)
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 3600))
+    
+    # Cache màn hình danh sách/chi tiết; TTL để dấu quá hạn (⚠️) không cũ quá lâu
+    RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", 10000))
+    RENDER_CACHE_TTL = int(os.getenv("RENDER_CACHE_TTL", 60))
+    
+    # Số bàn phím theo task (chi tiết, ưu tiên, nhắc nhở...) được giữ lại để dùng chung
+    KEYBOARD_CACHE_SIZE = int(os.getenv("KEYBOARD_CACHE_SIZE", 4096))
+    
+    # Persistence: chu kỳ (giây) ghi gộp user_data và trạng thái hội thoại xuống database
+    PERSISTENCE_INTERVAL = int(os.getenv("PERSISTENCE_INTERVAL", 30))
+    # Số user/chat được nhớ là đã nạp và bản đã lưu gần nhất (LRU); mục bị đẩy ra chỉ bị nạp/so sánh lại
+    PERSISTENCE_CACHE_SIZE = int(os.getenv("PERSISTENCE_CACHE_SIZE", 10000))
+    # Hội thoại thêm task bỏ dở quá số giây này thì kết thúc, và bị xóa khi nạp lại lúc khởi động
+    CONVERSATION_TIMEOUT = int(os.getenv("CONVERSATION_TIMEOUT", 3600))
+    
+    # Thư mục chứa backup (chỉ áp dụng khi dùng SQLite)
+    BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+    BACKUP_COMPRESS = os.getenv("BACKUP_COMPRESS", "1") == "1"
+    
+    # "full": mỗi lần một bản sao nén; "incremental": chỉ lưu các khối trang thay đổi
+    BACKUP_MODE = os.getenv("BACKUP_MODE", "full")
+    # Chu kỳ (phút) backup tăng dần; backup đầy đủ chạy hàng ngày lúc 2:00
+    BACKUP_INTERVAL_MINUTES = int(os.getenv("BACKUP_INTERVAL_MINUTES", 60))
+    # Số trang mỗi khối: khối nhỏ ghi ít hơn khi thay đổi rải rác nhưng manifest lớn hơn
+    BACKUP_CHUNK_PAGES = int(os.getenv("BACKUP_CHUNK_PAGES", 4))
+    BACKUP_KEEP_HOURLY = int(os.getenv("BACKUP_KEEP_HOURLY", 24))
+    BACKUP_KEEP_DAILY = int(os.getenv("BACKUP_KEEP_DAILY", 7))
+    BACKUP_KEEP_WEEKLY = int(os.getenv("BACKUP_KEEP_WEEKLY", 4))
+    
     # Mã hóa (dùng để mã hóa dữ liệu nhạy cảm)
     ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", "default-secret-key-change-me")
     
+    # Xuất dữ liệu: số dòng đọc mỗi lô, dữ liệu quá ngưỡng spool được ghi ra file tạm trên đĩa
+    EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 1000))
+    EXPORT_SPOOL_SIZE = int(os.getenv("EXPORT_SPOOL_SIZE", 5 * 1024 * 1024))
+    
+    # Nhập dữ liệu: số task mỗi giao dịch, kích thước file tối đa (giới hạn tải file của Bot API là 20MB)
+    IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 500))
+    IMPORT_MAX_SIZE = int(os.getenv("IMPORT_MAX_SIZE", 20 * 1024 * 1024))
+    
     # Cài đặt thời gian
-    TIMEZONE = "Asia/Ho_Chi_Minh"
\ No newline at end of file
+    TIMEZONE = "Asia/Ho_Chi_Minh"
+    
+    # Nhắc nhở: chỉ nạp các lời nhắc trong cửa sổ sắp tới vào bộ nhớ
+    REMINDER_WINDOW_MINUTES = int(os.getenv("REMINDER_WINDOW_MINUTES", 60))
+    REMINDER_TICK_SECONDS = int(os.getenv("REMINDER_TICK_SECONDS", 15))
+    REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", 100))
+    REMINDER_MAX_LOADED = int(os.getenv("REMINDER_MAX_LOADED", 10000))
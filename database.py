@@ -1,8 +1,23 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy import create_engine, event, Column, Integer, BigInteger, String, Text, Boolean, DateTime, LargeBinary, ForeignKey, Index, and_, or_, case, func, false, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import namedtuple
+from datetime import datetime, timedelta
+import asyncio
+import contextvars
+import logging
+import re
 import config
+import migrations
+from cache import LRUCache
+from metrics import metrics
+from query_debug import query_debugger
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
@@ -10,7 +25,7 @@ class User(Base):
     __tablename__ = 'users'
     
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, nullable=False)
+    telegram_id = Column(BigInteger, unique=True, nullable=False)
     username = Column(String(100))
     first_name = Column(String(100))
     last_name = Column(String(100))
@@ -31,6 +46,10 @@ class Category(Base):
     # Quan hệ
     user = relationship("User", back_populates="categories")
     tasks = relationship("Task", back_populates="category")
+    
+    __table_args__ = (
+        Index("ix_categories_user", "user_id"),
+    )
 
 class Task(Base):
     __tablename__ = 'tasks'
@@ -43,22 +62,236 @@ class Task(Base):
     completed = Column(Boolean, default=False)
     priority = Column(Integer, default=2)  # 1: Cao, 2: Trung bình, 3: Thấp
     due_date = Column(DateTime)
+    remind_at = Column(DateTime)  # Thời điểm nhắc nhở, NULL nếu không có hoặc đã gửi
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
     # Quan hệ
     user = relationship("User", back_populates="tasks")
     category = relationship("Category", back_populates="tasks")
+    
+    @property
+    def category_name(self):
+        return self.category.name if self.category else None
+    
+    __table_args__ = (
+        # Danh sách công việc: lọc theo user, sắp xếp (completed, priority, due_date, id)
+        Index("ix_tasks_user_order", "user_id", "completed", "priority", "due_date", "id"),
+        # /today: việc chưa xong của user trong khoảng hạn chót
+        Index("ix_tasks_user_open_due", "user_id", "completed", "due_date"),
+        # Đếm công việc theo danh mục
+        Index("ix_tasks_category", "category_id", "completed"),
+        # Quét lời nhắc sắp đến hạn theo cửa sổ thời gian
+        Index("ix_tasks_remind_at", "remind_at", "id"),
+    )
+
+class PersistentData(Base):
+    """user_data/chat_data của bot (pickle), ghi bởi persistence.py"""
+    __tablename__ = 'persistent_data'
+    
+    scope = Column(String(10), primary_key=True)  # "user" hoặc "chat"
+    key = Column(BigInteger, primary_key=True)  # Telegram user_id/chat_id
+    data = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class ConversationState(Base):
+    """Trạng thái ConversationHandler đang dở dang"""
+    __tablename__ = 'conversation_states'
+    
+    name = Column(String(100), primary_key=True)
+    key = Column(String(100), primary_key=True)  # JSON của khóa hội thoại (chat_id, user_id)
+    state = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# Thông tin user lưu trong cache, đủ dùng cho handler mà không cần truy vấn
+CachedUser = namedtuple("CachedUser", "id telegram_id username first_name last_name")
+
+# Dòng dữ liệu chỉ đọc cho màn hình danh sách và chi tiết, chỉ gồm các cột được hiển thị
+TaskRow = namedtuple("TaskRow", "id title completed priority due_date")
+TaskDetailRow = namedtuple(
+    "TaskDetailRow",
+    "id title description completed priority due_date remind_at created_at category_name"
+)
+
+# Lời nhắc đến hạn, kèm chat cần gửi
+DueReminder = namedtuple("DueReminder", "task_id chat_id title due_date")
+
+# Dòng task khi xuất dữ liệu
+ExportTaskRow = namedtuple(
+    "ExportTaskRow",
+    "id title description completed priority due_date remind_at created_at category_name"
+)
+
+TASK_ROW_COLUMNS = (Task.id, Task.title, Task.completed, Task.priority, Task.due_date)
+
+# Xếp hạng theo số lần khớp: mỗi lần khớp trong tiêu đề bằng 10 lần trong mô tả.
+# Cùng điểm thì ưu tiên tiêu đề ngắn (khớp sát hơn) rồi task mới hơn.
+# highlight() chỉ đọc dòng đang xét, còn bm25 phải duyệt toàn bộ doclist của từng từ
+# để tính IDF, rất chậm với từ phổ biến khi bảng có hàng triệu task.
+SEARCH_QUERY = text("""
+    SELECT tasks.id, tasks.title, tasks.completed, tasks.priority, tasks.due_date
+    FROM (
+        SELECT rowid AS id,
+            length(highlight(tasks_fts, 1, char(1), '')) - length(tasks_fts.title) AS title_hits,
+            length(highlight(tasks_fts, 2, char(1), '')) - length(tasks_fts.description) AS description_hits
+        FROM tasks_fts
+        WHERE tasks_fts MATCH :match
+    ) AS hits JOIN tasks ON tasks.id = hits.id
+    WHERE tasks.user_id = :user_id
+    ORDER BY hits.title_hits * 10 + hits.description_hits DESC, length(tasks.title), tasks.id DESC
+    LIMIT :limit OFFSET :offset
+""").columns(*TASK_ROW_COLUMNS)
+
+def search_terms(query):
+    """Tách chuỗi tìm kiếm thành các từ (giữ nguyên dấu)"""
+    return re.findall(r"[^\W_]+", query)
+
+def engine_options(url):
+    """Tham số create_engine theo loại database
+    
+    Pool luôn đủ kết nối cho mọi thread của DB_WORKERS cộng luồng chính và
+    job nền. Với SQLite file, SQLAlchemy 1.4 mặc định mở kết nối mới cho mỗi
+    session (NullPool); QueuePool giữ kết nối để cache trang và mmap của mỗi
+    kết nối được dùng lại.
+    """
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return {
+            "pool_size": config.Config.DB_POOL_SIZE,
+            "max_overflow": config.Config.DB_POOL_OVERFLOW,
+            "pool_pre_ping": True,
+            "pool_recycle": 1800
+        }
+    if url.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "poolclass": QueuePool,
+        "pool_size": config.Config.DB_POOL_SIZE,
+        "max_overflow": config.Config.DB_POOL_OVERFLOW,
+        # Kết nối được chia sẻ giữa các thread của pool (mỗi lúc một thread)
+        "connect_args": {"check_same_thread": False}
+    }
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Áp dụng các PRAGMA của SQLite cho mỗi kết nối mới
+    
+    WAL cho phép đọc song song trong khi ghi (kể cả khi backup đang chép);
+    synchronous=NORMAL an toàn với WAL, chỉ có thể mất giao dịch cuối khi mất
+    điện chứ không hỏng database.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode = {config.Config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {config.Config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout = {config.Config.SQLITE_BUSY_TIMEOUT_MS:d}")
+        # Số âm: kích thước tính bằng KiB thay vì số trang
+        cursor.execute(f"PRAGMA cache_size = -{config.Config.SQLITE_CACHE_SIZE_KB:d}")
+        cursor.execute(f"PRAGMA mmap_size = {config.Config.SQLITE_MMAP_SIZE:d}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+    finally:
+        cursor.close()
 
 class Database:
     def __init__(self):
-        self.engine = create_engine(config.Config.DATABASE_URL)
+        self.engine = create_engine(config.Config.DATABASE_URL, **engine_options(config.Config.DATABASE_URL))
+        if self.engine.url.get_backend_name() == "sqlite":
+            event.listen(self.engine, "connect", set_sqlite_pragmas)
+        # Đếm số câu lệnh và thời gian SQL theo handler (xem metrics.py)
+        metrics.instrument_engine(self.engine)
+        if config.Config.SQL_DEBUG:
+            query_debugger.install(
+                self.engine,
+                config.Config.SQL_DEBUG_LOG,
+                config.Config.SQL_DEBUG_LOG_SIZE,
+                config.Config.SQL_DEBUG_LOG_BACKUPS
+            )
         Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
+        migrations.upgrade(self.engine, Base.metadata)
+        self.fts_enabled = inspect(self.engine).has_table("tasks_fts")
+        # expire_on_commit=False để object trả về từ thread pool vẫn đọc được sau khi session đóng
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        
+        # Thread pool giới hạn cho các truy vấn đồng bộ, tránh chặn event loop
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.Config.DB_WORKERS,
+            thread_name_prefix="db"
+        )
+        
+        # Cache Telegram ID -> user, tránh truy vấn bảng users ở mỗi update
+        self.user_cache = LRUCache(
+            maxsize=config.Config.USER_CACHE_SIZE,
+            ttl=config.Config.USER_CACHE_TTL
+        )
+    
+    @property
+    def sqlite_path(self):
+        """Đường dẫn file SQLite, None nếu không dùng SQLite file"""
+        url = self.engine.url
+        if url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:"):
+            return url.database
+        return None
     
     def get_session(self):
         return self.Session()
     
+    @contextmanager
+    def session_scope(self):
+        """Session tự động commit/rollback và đóng khi kết thúc"""
+        session = self.Session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    
+    async def run(self, func, *args, **kwargs):
+        """Chạy func(session, *args, **kwargs) trong thread pool và trả về kết quả"""
+        def work():
+            with self.session_scope() as session:
+                return func(session, *args, **kwargs)
+        
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, ctx.run, work)
+    
+    def maintenance(self):
+        """Bảo trì SQLite định kỳ: cập nhật thống kê cho planner và thu gọn file WAL
+        
+        PRAGMA optimize chỉ ANALYZE các bảng cần thiết nên rất nhẹ. Checkpoint
+        TRUNCATE chép WAL vào database rồi cắt file WAL về 0; nếu còn kết nối
+        đang đọc thì trả về busy và lần sau làm tiếp.
+        """
+        if self.engine.url.get_backend_name() != "sqlite":
+            return None
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA optimize")
+            busy, wal_pages, checkpointed = conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").one()
+        return {"busy": bool(busy), "wal_pages": wal_pages, "checkpointed": checkpointed}
+    
+    def schedule_maintenance(self, job_queue):
+        """Lập lịch bảo trì database trên JobQueue của bot"""
+        interval = config.Config.DB_MAINTENANCE_MINUTES * 60
+        job_queue.run_repeating(self.maintenance_job, interval=interval, first=interval, name="db_maintenance")
+    
+    async def maintenance_job(self, context):
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, self.maintenance)
+            logger.info("Bảo trì database: %s", result)
+        except Exception:
+            logger.exception("Bảo trì database thất bại")
+    
+    def close(self):
+        """Giải phóng thread pool và kết nối"""
+        self.executor.shutdown(wait=True)
+        if self.engine.url.get_backend_name() == "sqlite":
+            # Khuyến nghị của SQLite: chạy optimize trước khi đóng kết nối
+            with self.engine.connect() as conn:
+                conn.exec_driver_sql("PRAGMA optimize")
+        self.engine.dispose()
+    
     def get_or_create_user(self, session, telegram_id, username, first_name, last_name):
         user = session.query(User).filter_by(telegram_id=telegram_id).first()
         if not user:
@@ -84,7 +317,332 @@ class Database:
                 session.add(category)
             session.commit()
         
+        self._cache_user(user)
+        return user
+    
+    def _cache_user(self, user):
+        cached = CachedUser(user.id, user.telegram_id, user.username, user.first_name, user.last_name)
+        self.user_cache.set(user.telegram_id, cached)
+        return cached
+    
+    def invalidate_user(self, telegram_id):
+        """Xóa user khỏi cache (khi user bị xóa hoặc đổi thông tin)"""
+        self.user_cache.pop(telegram_id)
+    
+    async def find_user(self, telegram_id):
+        """Tra user theo Telegram ID, chỉ truy vấn database khi cache miss"""
+        user = self.user_cache.get(telegram_id)
+        if user is None:
+            user = await self.run(self.get_user, telegram_id)
         return user
+    
+    # Các truy vấn dùng cho handler (gọi qua db.run)
+    def get_user(self, session, telegram_id):
+        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        return self._cache_user(user) if user else None
+    
+    def get_categories(self, session, user_id):
+        return session.query(Category).filter_by(user_id=user_id).all()
+    
+    def get_task(self, session, task_id):
+        """Lấy chi tiết task kèm tên danh mục trong cùng một truy vấn"""
+        row = session.query(
+            Task.id,
+            Task.title,
+            Task.description,
+            Task.completed,
+            Task.priority,
+            Task.due_date,
+            Task.remind_at,
+            Task.created_at,
+            Category.name
+        ).outerjoin(
+            Category, Task.category_id == Category.id
+        ).filter(Task.id == task_id).first()
+        return TaskDetailRow._make(row) if row else None
+    
+    def iter_export_tasks(self, session, user_id, chunk_size=1000):
+        """Duyệt toàn bộ task của user theo id, đọc từ database từng lô chunk_size dòng"""
+        query = session.query(
+            Task.id,
+            Task.title,
+            Task.description,
+            Task.completed,
+            Task.priority,
+            Task.due_date,
+            Task.remind_at,
+            Task.created_at,
+            Category.name
+        ).outerjoin(
+            Category, Task.category_id == Category.id
+        ).filter(Task.user_id == user_id).order_by(Task.id).yield_per(chunk_size)
+        
+        for row in query:
+            yield ExportTaskRow._make(row)
+    
+    def search_tasks(self, session, user_id, query, limit, offset=0):
+        """Tìm task theo tiêu đề/mô tả, không phân biệt dấu, khớp theo tiền tố từng từ
+        
+        Dùng FTS5 khi có (SQLite), ngược lại dùng LIKE; trả về danh sách TaskRow.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return []
+        
+        if self.fts_enabled:
+            # Mọi từ đều phải khớp (tiền tố) trong tiêu đề hoặc mô tả; owner là điều kiện
+            # riêng giới hạn trong task của user ngay trong index (từ khóa không được khớp cột owner)
+            match = " AND ".join(
+                '"%s"*' % term.replace("đ", "d").replace("Đ", "D") for term in terms
+            )
+            rows = session.execute(SEARCH_QUERY, {
+                "match": f'owner : "u{user_id}" AND {{title description}} : ({match})',
+                "user_id": user_id,
+                "limit": limit,
+                "offset": offset
+            })
+        else:
+            conditions = [
+                or_(Task.title.ilike(f"%{term}%"), Task.description.ilike(f"%{term}%"))
+                for term in terms
+            ]
+            rows = session.query(*TASK_ROW_COLUMNS).filter(
+                Task.user_id == user_id, *conditions
+            ).order_by(Task.priority, Task.id).limit(limit).offset(offset)
+        return [TaskRow._make(row) for row in rows]
+    
+    def count_tasks(self, session, user_id):
+        return session.query(func.count(Task.id)).filter(Task.user_id == user_id).scalar()
+    
+    def get_tasks_page(self, session, user_id, limit, cursor=None, backward=False):
+        """Lấy một trang task theo keyset trên (completed, priority, due_date, id)
+        
+        cursor là khóa sắp xếp của task cuối (hoặc đầu, nếu backward) trang liền kề.
+        """
+        query = session.query(*TASK_ROW_COLUMNS).filter(Task.user_id == user_id)
+        if cursor:
+            query = query.filter(self._keyset_filter(cursor, backward))
+        
+        # NULL due_date luôn đứng trước, giống mặc định của SQLite
+        if backward:
+            query = query.order_by(
+                Task.completed.desc(),
+                Task.priority.desc(),
+                Task.due_date.desc().nullslast(),
+                Task.id.desc()
+            )
+        else:
+            query = query.order_by(
+                Task.completed,
+                Task.priority,
+                Task.due_date.asc().nullsfirst(),
+                Task.id
+            )
+        
+        tasks = [TaskRow._make(row) for row in query.limit(limit)]
+        if backward:
+            tasks.reverse()
+        return tasks
+    
+    @staticmethod
+    def _keyset_filter(cursor, backward):
+        """Điều kiện lấy các task đứng sau (hoặc trước) cursor"""
+        completed, priority, due_date, task_id = cursor
+        if backward:
+            # Cột boolean không so sánh >/< được: False đứng trước True
+            completed_cond = Task.completed == False if completed else false()
+            if due_date is None:
+                due_cond = and_(Task.due_date.is_(None), Task.id < task_id)
+            else:
+                due_cond = or_(
+                    Task.due_date.is_(None),
+                    Task.due_date < due_date,
+                    and_(Task.due_date == due_date, Task.id < task_id)
+                )
+            return or_(
+                completed_cond,
+                and_(Task.completed == completed, or_(
+                    Task.priority < priority,
+                    and_(Task.priority == priority, due_cond)
+                ))
+            )
+        
+        completed_cond = false() if completed else Task.completed == True
+        if due_date is None:
+            due_cond = or_(
+                Task.due_date.isnot(None),
+                and_(Task.due_date.is_(None), Task.id > task_id)
+            )
+        else:
+            due_cond = or_(
+                Task.due_date > due_date,
+                and_(Task.due_date == due_date, Task.id > task_id)
+            )
+        return or_(
+            completed_cond,
+            and_(Task.completed == completed, or_(
+                Task.priority > priority,
+                and_(Task.priority == priority, due_cond)
+            ))
+        )
+    
+    def get_today_tasks(self, session, user_id, today):
+        rows = session.query(*TASK_ROW_COLUMNS).filter(
+            Task.user_id == user_id,
+            Task.due_date >= today,
+            Task.due_date < today + timedelta(days=1),
+            Task.completed == False
+        ).order_by(Task.priority, Task.due_date)
+        return [TaskRow._make(row) for row in rows]
+    
+    def get_category_counts(self, session, user_id):
+        """Đếm công việc theo danh mục bằng một truy vấn GROUP BY
+        
+        Trả về danh sách (tên danh mục, tổng số, số đã hoàn thành).
+        """
+        completed = func.coalesce(func.sum(case((Task.completed == True, 1), else_=0)), 0)
+        return session.query(
+            Category.name,
+            func.count(Task.id),
+            completed
+        ).outerjoin(
+            Task, Task.category_id == Category.id
+        ).filter(
+            Category.user_id == user_id
+        ).group_by(Category.id, Category.name).order_by(Category.id).all()
+    
+    def add_task(self, session, **fields):
+        task = Task(**fields)
+        session.add(task)
+        session.flush()
+        return task
+    
+    def insert_tasks(self, session, rows):
+        """Thêm nhiều task trong một câu lệnh executemany"""
+        now = datetime.now()
+        for row in rows:
+            row.setdefault("created_at", now)
+            row.setdefault("updated_at", now)
+        session.execute(Task.__table__.insert(), rows)
+    
+    def add_category(self, session, user_id, name):
+        category = Category(user_id=user_id, name=name)
+        session.add(category)
+        session.flush()
+        return category.id
+    
+    def toggle_task(self, session, task_id):
+        """Đảo trạng thái hoàn thành, trả về trạng thái mới hoặc None"""
+        task = session.query(Task).filter_by(id=task_id).first()
+        if not task:
+            return None
+        task.completed = not task.completed
+        return task.completed
+    
+    def delete_task(self, session, task_id):
+        task = session.query(Task).filter_by(id=task_id).first()
+        if not task:
+            return False
+        session.delete(task)
+        return True
+    
+    def set_task_category(self, session, task_id, category_id):
+        """Gán danh mục cho task, trả về tên danh mục hoặc None"""
+        task = session.query(Task).filter_by(id=task_id).first()
+        category = session.query(Category).filter_by(id=category_id).first()
+        if not task or not category:
+            return None
+        task.category_id = category.id
+        return category.name
+    
+    def get_upcoming_reminders(self, session, after, until, limit, shard=None):
+        """Các lời nhắc (remind_at, id) đứng sau mốc after và không muộn hơn until
+        
+        shard = (index, count): chỉ lấy lời nhắc của các user thuộc worker index
+        (cùng công thức với shard.shard_for), để mỗi lời nhắc chỉ một worker gửi.
+        """
+        query = session.query(Task.remind_at, Task.id).filter(
+            Task.remind_at.isnot(None),
+            Task.remind_at <= until,
+            Task.completed == False
+        )
+        if shard:
+            index, count = shard
+            query = query.join(User, Task.user_id == User.id).filter(func.abs(User.telegram_id) % count == index)
+        if after:
+            remind_at, task_id = after
+            if task_id is None:
+                query = query.filter(Task.remind_at > remind_at)
+            else:
+                query = query.filter(or_(
+                    Task.remind_at > remind_at,
+                    and_(Task.remind_at == remind_at, Task.id > task_id)
+                ))
+        return [tuple(row) for row in query.order_by(Task.remind_at, Task.id).limit(limit)]
+    
+    def claim_due_reminders(self, session, task_ids, now):
+        """Lấy các lời nhắc còn hiệu lực trong task_ids và đánh dấu đã gửi
+        
+        Bỏ qua task đã bị xóa, đã hoàn thành hoặc đã đổi/tắt giờ nhắc.
+        """
+        rows = session.query(
+            Task.id, User.telegram_id, Task.title, Task.due_date
+        ).join(User, Task.user_id == User.id).filter(
+            Task.id.in_(task_ids),
+            Task.remind_at <= now,
+            Task.completed == False
+        ).all()
+        
+        if rows:
+            session.query(Task).filter(
+                Task.id.in_([row[0] for row in rows])
+            ).update({Task.remind_at: None}, synchronize_session=False)
+        return [DueReminder._make(row) for row in rows]
+    
+    def update_task(self, session, task_id, **fields):
+        task = session.query(Task).filter_by(id=task_id).first()
+        if not task:
+            return False
+        for key, value in fields.items():
+            setattr(task, key, value)
+        return True
+    
+    def load_persistent_data(self, session, scope, key):
+        """Dữ liệu đã lưu của một user/chat, None nếu chưa có"""
+        return session.query(PersistentData.data).filter_by(scope=scope, key=key).scalar()
+    
+    def load_conversations(self, session, name, stale_before=None):
+        """Các cặp (khóa JSON, trạng thái đã pickle) của một ConversationHandler
+        
+        Hội thoại không đổi từ trước stale_before bị xóa thay vì nạp lại.
+        """
+        query = session.query(ConversationState).filter_by(name=name)
+        if stale_before is not None:
+            query.filter(ConversationState.updated_at < stale_before).delete(synchronize_session=False)
+        return session.query(ConversationState.key, ConversationState.state).filter_by(name=name).all()
+    
+    def save_persistence(self, session, data, conversations):
+        """Ghi một lô thay đổi: {(scope, key): bytes|None}, {(name, key): bytes|None}; None là xóa"""
+        now = datetime.now()
+        for model, columns, changes in (
+            (PersistentData, ("scope", "key"), data),
+            (ConversationState, ("name", "key"), conversations)
+        ):
+            if not changes:
+                continue
+            first, second = (getattr(model, column) for column in columns)
+            # Xóa rồi chèn lại: chạy được trên mọi database, gói trong cùng một giao dịch
+            for owner in {pair[0] for pair in changes}:
+                keys = [pair[1] for pair in changes if pair[0] == owner]
+                session.query(model).filter(first == owner, second.in_(keys)).delete(synchronize_session=False)
+            
+            value_column = "data" if model is PersistentData else "state"
+            rows = [
+                {columns[0]: owner, columns[1]: key, value_column: value, "updated_at": now}
+                for (owner, key), value in changes.items() if value is not None
+            ]
+            if rows:
+                session.execute(model.__table__.insert(), rows)
 
 # Khởi tạo database
 db = Database()
\ No newline at end of file
@@ -0,0 +1,142 @@
+import csv
+import json
+import sys
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+import config
+from database import db
+from utils import encryption
+
+# Kích thước (ký tự) của mỗi khối văn bản được ghi ra file, cũng là đơn vị mã hóa
+BLOCK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = ("csv", "json")
+
+CSV_HEADER = [
+    "id", "title", "description", "completed", "priority",
+    "due_date", "remind_at", "created_at", "category"
+]
+
+class ExportWriter:
+    """Gom văn bản thành từng khối rồi ghi ra file nhị phân
+    
+    Khi encrypt=True mỗi khối được mã hóa thành một token Fernet trên một dòng,
+    nên bộ nhớ dùng để mã hóa không phụ thuộc vào kích thước dữ liệu.
+    """
+    def __init__(self, file, encrypt=False):
+        self.file = file
+        self.encrypt = encrypt
+        self.parts = []
+        self.size = 0
+    
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= BLOCK_SIZE:
+            self.flush()
+    
+    def flush(self):
+        if not self.parts:
+            return
+        text = "".join(self.parts)
+        self.parts = []
+        self.size = 0
+        
+        if self.encrypt:
+            self.file.write(encryption.encrypt(text).encode() + b"\n")
+        else:
+            self.file.write(text.encode("utf-8"))
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+class DataExporter:
+    @staticmethod
+    def write_csv(writer, session, user_id, chunk_size):
+        out = csv.writer(writer)
+        out.writerow(CSV_HEADER)
+        for task in db.iter_export_tasks(session, user_id, chunk_size):
+            out.writerow([
+                task.id,
+                task.title,
+                task.description or "",
+                int(task.completed),
+                task.priority,
+                _isoformat(task.due_date) or "",
+                _isoformat(task.remind_at) or "",
+                _isoformat(task.created_at) or "",
+                task.category_name or ""
+            ])
+    
+    @staticmethod
+    def write_json(writer, session, user_id, chunk_size):
+        categories = db.get_categories(session, user_id)
+        writer.write('{"exported_at": %s, "categories": ' % json.dumps(datetime.now().isoformat()))
+        writer.write(json.dumps(
+            [{"id": c.id, "name": c.name, "color": c.color} for c in categories],
+            ensure_ascii=False
+        ))
+        writer.write(', "tasks": [')
+        
+        separator = "\n"
+        for task in db.iter_export_tasks(session, user_id, chunk_size):
+            writer.write(separator)
+            writer.write(json.dumps({
+                "id": task.id,
+                "title": task.title,
+                "description": task.description,
+                "completed": task.completed,
+                "priority": task.priority,
+                "due_date": _isoformat(task.due_date),
+                "remind_at": _isoformat(task.remind_at),
+                "created_at": _isoformat(task.created_at),
+                "category": task.category_name
+            }, ensure_ascii=False))
+            separator = ",\n"
+        writer.write("\n]}\n")
+    
+    @staticmethod
+    def export(session, user_id, fmt="csv", encrypt=False):
+        """Xuất task và danh mục của user ra file tạm, trả về (file, tên file)
+        
+        Task được đọc từ database theo lô EXPORT_CHUNK_SIZE dòng và ghi ngay ra
+        SpooledTemporaryFile (chuyển sang đĩa khi vượt EXPORT_SPOOL_SIZE), nên
+        bộ nhớ sử dụng không tăng theo số lượng task. Người gọi phải đóng file.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+        
+        chunk_size = config.Config.EXPORT_CHUNK_SIZE
+        file = SpooledTemporaryFile(max_size=config.Config.EXPORT_SPOOL_SIZE)
+        try:
+            writer = ExportWriter(file, encrypt)
+            if fmt == "csv":
+                # Dữ liệu CSV chỉ gồm task; tên danh mục nằm trong cột category
+                DataExporter.write_csv(writer, session, user_id, chunk_size)
+            else:
+                DataExporter.write_json(writer, session, user_id, chunk_size)
+            writer.flush()
+            file.seek(0)
+        except Exception:
+            file.close()
+            raise
+        
+        filename = f"todo_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+        if encrypt:
+            filename += ".enc"
+        return file, filename
+    
+    @staticmethod
+    def decrypt_file(source, target):
+        """Giải mã file xuất đã mã hóa (mỗi dòng một token) từng khối một"""
+        for line in source:
+            line = line.strip()
+            if line:
+                target.write(encryption.decrypt(line.decode()).encode("utf-8"))
+
+exporter = DataExporter()
+
+if __name__ == "__main__":
+    # Giải mã file xuất: python export.py todo_export_....csv.enc > todo_export.csv
+    with open(sys.argv[1], "rb") as source:
+        DataExporter.decrypt_file(source, sys.stdout.buffer)
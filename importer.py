@@ -0,0 +1,293 @@
+import csv
+import io
+import json
+import time
+from collections import Counter
+from datetime import datetime
+from cryptography.fernet import InvalidToken
+import config
+from database import db
+from export import BLOCK_SIZE
+from utils import encryption
+
+IMPORT_FORMATS = ("csv", "json", "txt")
+
+# Số dòng lỗi tối đa được liệt kê trong báo cáo
+MAX_REPORTED_ERRORS = 5
+
+TRUE_VALUES = ("1", "true", "yes", "x", "có")
+
+class ImportRowError(ValueError):
+    pass
+
+class DecryptingReader(io.RawIOBase):
+    """Đọc file xuất đã mã hóa (mỗi dòng một token Fernet) như một luồng byte thường"""
+    def __init__(self, file):
+        self.file = file
+        self.buffer = b""
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, target):
+        while not self.buffer:
+            line = self.file.readline()
+            if not line:
+                return 0
+            line = line.strip()
+            if line:
+                self.buffer = encryption.decrypt(line.decode()).encode("utf-8")
+        
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+def _iter_json_tasks(stream):
+    """Duyệt từng phần tử của mảng task mà không đọc cả file
+    
+    Chấp nhận mảng gốc [...] hoặc object có khóa "tasks" (định dạng của export.py).
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(BLOCK_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+    
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+    
+    # Tìm đầu mảng task
+    skip(" \t\r\n")
+    if buffer[pos:pos + 1] == "{":
+        while True:
+            index = buffer.find('"tasks"', pos)
+            if index >= 0:
+                pos = index + len('"tasks"')
+                skip(" \t\r\n:")
+                break
+            if eof:
+                raise ValueError("Không tìm thấy danh sách tasks")
+            pos = max(pos, len(buffer) - len('"tasks"'))
+            fill()
+    if buffer[pos:pos + 1] != "[":
+        raise ValueError("File JSON phải là một mảng task")
+    pos += 1
+    
+    while True:
+        skip(" \t\r\n,")
+        if pos >= len(buffer):
+            raise ValueError("File JSON bị cắt cụt")
+        if buffer[pos] == "]":
+            return
+        
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError("File JSON không hợp lệ")
+            fill()
+            continue
+        pos = end
+        yield item
+
+def _iter_csv_tasks(stream):
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    
+    columns = [name.strip().lower() for name in header]
+    if "title" not in columns:
+        # Không có dòng tiêu đề: cột đầu tiên là tiêu đề công việc
+        yield {"title": header[0] if header else ""}
+        for row in reader:
+            yield {"title": row[0] if row else ""}
+        return
+    
+    for row in reader:
+        yield dict(zip(columns, row))
+
+def _iter_text_tasks(stream):
+    """Mỗi dòng một công việc; bỏ qua dòng trống và dòng bắt đầu bằng #"""
+    for line in stream:
+        line = line.strip()
+        if line.startswith("- "):
+            line = line[2:].strip()
+        if line and not line.startswith("#"):
+            yield {"title": line}
+
+def _parse_datetime(value):
+    if value in (None, ""):
+        return None
+    if not isinstance(value, str):
+        raise ImportRowError("hạn chót không hợp lệ")
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        pass
+    for fmt in ("%d/%m/%Y", "%d/%m/%Y %H:%M"):
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            pass
+    raise ImportRowError("hạn chót không hợp lệ")
+
+def _parse_row(item):
+    """Kiểm tra một dòng, trả về (các cột của task, tên danh mục)"""
+    if not isinstance(item, dict):
+        raise ImportRowError("dòng không đúng định dạng")
+    
+    title = item.get("title")
+    title = title.strip() if isinstance(title, str) else ""
+    if not title:
+        raise ImportRowError("thiếu tiêu đề")
+    if len(title) > 200:
+        raise ImportRowError("tiêu đề quá dài")
+    
+    priority = item.get("priority")
+    if priority in (None, ""):
+        priority = 2
+    else:
+        try:
+            priority = int(priority)
+        except (TypeError, ValueError):
+            raise ImportRowError("độ ưu tiên không hợp lệ")
+        if priority not in (1, 2, 3):
+            raise ImportRowError("độ ưu tiên không hợp lệ")
+    
+    completed = item.get("completed")
+    if not isinstance(completed, bool):
+        completed = str(completed or "").strip().lower() in TRUE_VALUES
+    
+    description = item.get("description")
+    description = description.strip() if isinstance(description, str) and description.strip() else None
+    
+    category = item.get("category")
+    category = category.strip() if isinstance(category, str) and category.strip() else None
+    
+    fields = {
+        "title": title,
+        "description": description,
+        "completed": completed,
+        "priority": priority,
+        "due_date": _parse_datetime(item.get("due_date"))
+    }
+    return fields, category
+
+class DataImporter:
+    @staticmethod
+    def detect_format(filename):
+        """Xác định (định dạng, đã mã hóa) từ tên file"""
+        name = (filename or "").lower()
+        encrypted = name.endswith(".enc")
+        if encrypted:
+            name = name[:-len(".enc")]
+        extension = name.rsplit(".", 1)[-1] if "." in name else "txt"
+        return extension, encrypted
+    
+    @staticmethod
+    def iter_rows(file, fmt, encrypted=False):
+        """Đọc file nhị phân đã tải về thành các dict task, từng dòng một"""
+        raw = io.BufferedReader(DecryptingReader(file)) if encrypted else file
+        stream = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="" if fmt == "csv" else None)
+        
+        if fmt == "csv":
+            return _iter_csv_tasks(stream)
+        if fmt == "json":
+            return _iter_json_tasks(stream)
+        return _iter_text_tasks(stream)
+    
+    @staticmethod
+    def import_tasks(session, user_id, file, fmt, encrypted=False):
+        """Nhập task từ file, ghi theo lô IMPORT_BATCH_SIZE dòng mỗi giao dịch
+        
+        Danh mục được tra bằng một truy vấn duy nhất; danh mục chưa có sẽ được tạo.
+        Dòng lỗi bị bỏ qua và được tổng hợp trong kết quả trả về.
+        """
+        started = time.perf_counter()
+        batch_size = config.Config.IMPORT_BATCH_SIZE
+        
+        categories = {c.name.lower(): c.id for c in db.get_categories(session, user_id)}
+        imported = 0
+        rejected = Counter()
+        errors = []
+        batch = []
+        
+        def reject(line, reason):
+            rejected[reason] += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append((line, reason))
+        
+        line = 0
+        try:
+            for line, item in enumerate(DataImporter.iter_rows(file, fmt, encrypted), 1):
+                try:
+                    fields, category = _parse_row(item)
+                except ImportRowError as e:
+                    reject(line, str(e))
+                    continue
+                
+                if category:
+                    key = category.lower()
+                    if key not in categories:
+                        categories[key] = db.add_category(session, user_id, category[:100])
+                    fields["category_id"] = categories[key]
+                else:
+                    fields["category_id"] = None
+                
+                fields["user_id"] = user_id
+                batch.append(fields)
+                if len(batch) >= batch_size:
+                    db.insert_tasks(session, batch)
+                    session.commit()
+                    imported += len(batch)
+                    batch = []
+        except (ValueError, UnicodeDecodeError, csv.Error):
+            # File hỏng giữa chừng: giữ các dòng hợp lệ đã đọc được
+            reject(line + 1, "file bị lỗi, dừng đọc")
+        except InvalidToken:
+            # Không phải ValueError: file .enc sai khóa (ENCRYPTION_KEY khác) hoặc bị sửa
+            reject(line + 1, "không giải mã được file (sai khóa hoặc file hỏng), dừng đọc")
+        
+        if batch:
+            db.insert_tasks(session, batch)
+            imported += len(batch)
+        
+        duration = time.perf_counter() - started
+        return {
+            "imported": imported,
+            "rejected": sum(rejected.values()),
+            "reasons": dict(rejected),
+            "errors": errors,
+            "duration": duration,
+            "rate": imported / duration if duration else 0
+        }
+    
+    @staticmethod
+    def format_report(result):
+        """Tóm tắt kết quả nhập dữ liệu"""
+        text = f"📥 Đã nhập *{result['imported']}* công việc"
+        text += f" ({result['rate']:.0f} dòng/giây)"
+        if result["rejected"]:
+            text += f"\n\n⚠️ Bỏ qua {result['rejected']} dòng lỗi:"
+            for reason, count in sorted(result["reasons"].items(), key=lambda item: -item[1]):
+                text += f"\n• {reason}: {count}"
+            lines = ", ".join(str(line) for line, _ in result["errors"])
+            text += f"\n(ví dụ dòng {lines})"
+        return text
+
+importer = DataImporter()
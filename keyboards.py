@@ -1,84 +1,124 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from datetime import datetime, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+import config
+from router import callbacks
+from utils import PRIORITY_ICONS
+
+# InlineKeyboardMarkup của PTB là bất biến nên có thể dùng chung giữa các
+# tin nhắn: bàn phím cố định được tạo một lần, bàn phím theo task được nhớ
+# theo LRU giới hạn, bàn phím theo ngày được nhớ theo ngày hiện tại.
+KEYBOARD_CACHE_SIZE = config.Config.KEYBOARD_CACHE_SIZE
+TIMEZONE = ZoneInfo(config.Config.TIMEZONE)
 
 class TodoKeyboards:
     @staticmethod
+    @lru_cache(maxsize=None)
     def main_menu():
         """Bàn phím menu chính"""
         keyboard = [
-            [InlineKeyboardButton("📝 Xem việc cần làm", callback_data="view_tasks")],
-            [InlineKeyboardButton("➕ Thêm việc mới", callback_data="add_task")],
-            [InlineKeyboardButton("📂 Danh mục", callback_data="manage_categories")],
-            [InlineKeyboardButton("⚙️ Cài đặt", callback_data="settings")]
+            [InlineKeyboardButton("📝 Xem việc cần làm", callback_data=callbacks.encode("view_tasks"))],
+            [InlineKeyboardButton("➕ Thêm việc mới", callback_data=callbacks.encode("add_task"))],
+            [InlineKeyboardButton("📂 Danh mục", callback_data=callbacks.encode("manage_categories"))],
+            [InlineKeyboardButton("⚙️ Cài đặt", callback_data=callbacks.encode("settings"))]
         ]
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
-    def task_list(tasks, page=0, tasks_per_page=5):
-        """Bàn phím danh sách công việc"""
+    def task_list(tasks, page=0, total_pages=1):
+        """Bàn phím danh sách công việc (tasks là các task của trang hiện tại)"""
         keyboard = []
         
-        # Hiển thị tasks trên trang hiện tại
-        start_idx = page * tasks_per_page
-        end_idx = start_idx + tasks_per_page
-        current_tasks = tasks[start_idx:end_idx]
-        
-        for task in current_tasks:
+        for task in tasks:
             status = "✅" if task.completed else "⬜"
-            priority_icons = {1: "🔴", 2: "🟡", 3: "🟢"}
-            priority_icon = priority_icons.get(task.priority, "🟡")
+            priority_icon = PRIORITY_ICONS.get(task.priority, "🟡")
             
             button_text = f"{status} {priority_icon} {task.title[:30]}"
             keyboard.append([InlineKeyboardButton(
                 button_text, 
-                callback_data=f"task_detail_{task.id}"
+                callback_data=callbacks.encode("task_detail", task.id)
             )])
         
         # Nút điều hướng
         nav_buttons = []
-        if page > 0:
-            nav_buttons.append(InlineKeyboardButton("⬅️ Trước", callback_data=f"page_{page-1}"))
-        if end_idx < len(tasks):
-            nav_buttons.append(InlineKeyboardButton("Sau ➡️", callback_data=f"page_{page+1}"))
+        if page > 0 and tasks:
+            nav_buttons.append(InlineKeyboardButton(
+                "⬅️ Trước", callback_data=TodoKeyboards.page_callback(page - 1, "p", tasks[0])
+            ))
+        if page + 1 < total_pages and tasks:
+            nav_buttons.append(InlineKeyboardButton(
+                "Sau ➡️", callback_data=TodoKeyboards.page_callback(page + 1, "n", tasks[-1])
+            ))
         
         if nav_buttons:
             keyboard.append(nav_buttons)
         
         # Nút quay lại
-        keyboard.append([InlineKeyboardButton("🔙 Quay lại", callback_data="main_menu")])
+        keyboard.append([InlineKeyboardButton("🔙 Quay lại", callback_data=callbacks.encode("main_menu"))])
+        
+        return InlineKeyboardMarkup(keyboard)
+    
+    @staticmethod
+    def search_results(tasks, page=0, has_next=False):
+        """Bàn phím kết quả tìm kiếm, cùng kiểu với danh sách công việc"""
+        keyboard = TodoKeyboards.task_list(tasks).inline_keyboard[:-1]
+        
+        nav_buttons = []
+        if page > 0:
+            nav_buttons.append(InlineKeyboardButton("⬅️ Trước", callback_data=callbacks.encode("search", page - 1)))
+        if has_next:
+            nav_buttons.append(InlineKeyboardButton("Sau ➡️", callback_data=callbacks.encode("search", page + 1)))
+        
+        if nav_buttons:
+            keyboard += (tuple(nav_buttons),)
+        keyboard += ((InlineKeyboardButton("🔙 Quay lại", callback_data=callbacks.encode("main_menu")),),)
         
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
+    def page_callback(page, direction, task):
+        """Tạo callback_data phân trang: số trang, hướng (n|p) và khóa sắp xếp của task mốc"""
+        return callbacks.encode(
+            "page", page, direction == "p",
+            bool(task.completed), task.priority, task.due_date, task.id
+        )
+    
+    @staticmethod
+    @lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
     def task_detail(task_id):
         """Bàn phím chi tiết công việc"""
         keyboard = [
             [
-                InlineKeyboardButton("✅ Hoàn thành", callback_data=f"complete_{task_id}"),
-                InlineKeyboardButton("✏️ Sửa", callback_data=f"edit_task_{task_id}")
+                InlineKeyboardButton("✅ Hoàn thành", callback_data=callbacks.encode("complete", task_id)),
+                InlineKeyboardButton("✏️ Sửa", callback_data=callbacks.encode("edit_task", task_id))
             ],
             [
-                InlineKeyboardButton("🗑️ Xóa", callback_data=f"delete_task_{task_id}"),
-                InlineKeyboardButton("📅 Hẹn giờ", callback_data=f"set_reminder_{task_id}")
+                InlineKeyboardButton("🗑️ Xóa", callback_data=callbacks.encode("delete_task", task_id)),
+                InlineKeyboardButton("📅 Hẹn giờ", callback_data=callbacks.encode("set_reminder", task_id))
             ],
-            [InlineKeyboardButton("🔙 Quay lại", callback_data="view_tasks")]
+            [InlineKeyboardButton("🔙 Quay lại", callback_data=callbacks.encode("view_tasks"))]
         ]
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
+    @lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
     def priority_buttons(task_id=None):
         """Bàn phím chọn độ ưu tiên"""
-        callback_prefix = f"set_priority_{task_id}_" if task_id else "priority_"
+        def callback(priority):
+            if task_id:
+                return callbacks.encode("set_priority", task_id, priority)
+            return callbacks.encode("priority", priority)
         
         keyboard = [
             [
-                InlineKeyboardButton("🔴 Cao", callback_data=f"{callback_prefix}1"),
-                InlineKeyboardButton("🟡 Trung bình", callback_data=f"{callback_prefix}2"),
-                InlineKeyboardButton("🟢 Thấp", callback_data=f"{callback_prefix}3")
+                InlineKeyboardButton("🔴 Cao", callback_data=callback(1)),
+                InlineKeyboardButton("🟡 Trung bình", callback_data=callback(2)),
+                InlineKeyboardButton("🟢 Thấp", callback_data=callback(3))
             ]
         ]
         if task_id:
-            keyboard.append([InlineKeyboardButton("🔙 Quay lại", callback_data=f"task_detail_{task_id}")])
+            keyboard.append([InlineKeyboardButton("🔙 Quay lại", callback_data=callbacks.encode("task_detail", task_id))])
         
         return InlineKeyboardMarkup(keyboard)
     
@@ -86,23 +126,26 @@ class TodoKeyboards:
     def category_buttons(categories, task_id=None):
         """Bàn phím chọn danh mục"""
         keyboard = []
-        callback_prefix = f"set_category_{task_id}_" if task_id else "select_category_"
-        
         for category in categories:
-            keyboard.append([InlineKeyboardButton(
-                f"■ {category.name}", 
-                callback_data=f"{callback_prefix}{category.id}"
-            )])
+            if task_id:
+                callback_data = callbacks.encode("set_category", task_id, category.id)
+            else:
+                callback_data = callbacks.encode("select_category", category.id)
+            keyboard.append([InlineKeyboardButton(f"■ {category.name}", callback_data=callback_data)])
         
         if task_id:
-            keyboard.append([InlineKeyboardButton("🔙 Quay lại", callback_data=f"task_detail_{task_id}")])
+            keyboard.append([InlineKeyboardButton("🔙 Quay lại", callback_data=callbacks.encode("task_detail", task_id))])
         
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
     def due_date_buttons(task_id=None):
-        """Bàn phím chọn ngày đến hạn"""
-        today = datetime.now()
+        """Bàn phím chọn ngày đến hạn, dùng lại bản đã tạo trong cùng ngày (theo TIMEZONE)"""
+        return TodoKeyboards._due_date_buttons(datetime.now(TIMEZONE).date(), task_id)
+    
+    @staticmethod
+    @lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+    def _due_date_buttons(today, task_id):
         keyboard = []
         
         # Các tùy chọn nhanh
@@ -113,35 +156,87 @@ class TodoKeyboards:
         ]
         
         for text, date in quick_options:
-            date_str = date.strftime("%Y-%m-%d")
-            callback_data = f"set_duedate_{task_id}_{date_str}" if task_id else f"duedate_{date_str}"
+            if task_id:
+                callback_data = callbacks.encode("set_duedate", task_id, date)
+            else:
+                callback_data = callbacks.encode("duedate", date)
             keyboard.append([InlineKeyboardButton(text, callback_data=callback_data)])
         
-        keyboard.append([InlineKeyboardButton("📅 Chọn ngày khác", callback_data="custom_date")])
+        keyboard.append([InlineKeyboardButton("📅 Chọn ngày khác", callback_data=callbacks.encode("custom_date"))])
         
         if task_id:
-            keyboard.append([InlineKeyboardButton("🔙 Quay lại", callback_data=f"task_detail_{task_id}")])
+            keyboard.append([InlineKeyboardButton("🔙 Quay lại", callback_data=callbacks.encode("task_detail", task_id))])
         
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
+    @lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+    def reminder_buttons(task_id):
+        """Bàn phím đặt giờ nhắc nhở"""
+        keyboard = [
+            [
+                InlineKeyboardButton("⏰ 30 phút nữa", callback_data=callbacks.encode("remind", task_id, "30")),
+                InlineKeyboardButton("⏰ 1 giờ nữa", callback_data=callbacks.encode("remind", task_id, "60"))
+            ],
+            [
+                InlineKeyboardButton("⏰ 3 giờ nữa", callback_data=callbacks.encode("remind", task_id, "180")),
+                InlineKeyboardButton("🌅 9:00 sáng mai", callback_data=callbacks.encode("remind", task_id, "tomorrow"))
+            ],
+            [InlineKeyboardButton("🔕 Tắt nhắc nhở", callback_data=callbacks.encode("remind", task_id, "off"))],
+            [InlineKeyboardButton("🔙 Quay lại", callback_data=callbacks.encode("task_detail", task_id))]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+    
+    @staticmethod
+    @lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
     def confirm_delete(task_id):
         """Bàn phím xác nhận xóa"""
         keyboard = [
             [
-                InlineKeyboardButton("✅ Có, xóa", callback_data=f"confirm_delete_{task_id}"),
-                InlineKeyboardButton("❌ Không", callback_data=f"task_detail_{task_id}")
+                InlineKeyboardButton("✅ Có, xóa", callback_data=callbacks.encode("confirm_delete", task_id)),
+                InlineKeyboardButton("❌ Không", callback_data=callbacks.encode("task_detail", task_id))
             ]
         ]
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
+    @lru_cache(maxsize=None)
     def settings_menu():
         """Bàn phím cài đặt"""
         keyboard = [
-            [InlineKeyboardButton("👤 Thông tin tài khoản", callback_data="account_info")],
-            [InlineKeyboardButton("🔔 Cài đặt thông báo", callback_data="notification_settings")],
-            [InlineKeyboardButton("📤 Xuất dữ liệu", callback_data="export_data")],
-            [InlineKeyboardButton("🔙 Quay lại", callback_data="main_menu")]
+            [InlineKeyboardButton("👤 Thông tin tài khoản", callback_data=callbacks.encode("account_info"))],
+            [InlineKeyboardButton("🔔 Cài đặt thông báo", callback_data=callbacks.encode("notification_settings"))],
+            [InlineKeyboardButton("📤 Xuất dữ liệu", callback_data=callbacks.encode("export_data"))],
+            [InlineKeyboardButton("📥 Nhập dữ liệu", callback_data=callbacks.encode("import_data"))],
+            [InlineKeyboardButton("🔙 Quay lại", callback_data=callbacks.encode("main_menu"))]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+    
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def export_options():
+        """Bàn phím chọn định dạng xuất dữ liệu"""
+        keyboard = [
+            [
+                InlineKeyboardButton("📄 CSV", callback_data=callbacks.encode("export", "csv", False)),
+                InlineKeyboardButton("🧾 JSON", callback_data=callbacks.encode("export", "json", False))
+            ],
+            [
+                InlineKeyboardButton("🔒 CSV mã hóa", callback_data=callbacks.encode("export", "csv", True)),
+                InlineKeyboardButton("🔒 JSON mã hóa", callback_data=callbacks.encode("export", "json", True))
+            ],
+            [InlineKeyboardButton("🔙 Quay lại", callback_data=callbacks.encode("settings"))]
         ]
-        return InlineKeyboardMarkup(keyboard)
\ No newline at end of file
+        return InlineKeyboardMarkup(keyboard)
+    
+    @staticmethod
+    def cache_stats():
+        """Số liệu hit/miss của các bàn phím được nhớ"""
+        cached = {
+            "task_detail": TodoKeyboards.task_detail,
+            "priority_buttons": TodoKeyboards.priority_buttons,
+            "due_date_buttons": TodoKeyboards._due_date_buttons,
+            "reminder_buttons": TodoKeyboards.reminder_buttons,
+            "confirm_delete": TodoKeyboards.confirm_delete
+        }
+        return {name: func.cache_info()._asdict() for name, func in cached.items()}
\ No newline at end of file
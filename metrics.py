@@ -0,0 +1,326 @@
+"""Đo độ trễ handler, truy vấn SQL và request Bot API
+
+Mỗi lần một handler của TodoBot chạy là một phiên đo (HandlerScope) giữ
+trong contextvar. db.run sao chép context sang thread database, nên câu lệnh
+SQL (đếm qua sự kiện cursor của SQLAlchemy) và request Bot API (đếm trong
+OutboundRateLimiter) được tính cho đúng handler đã gây ra chúng. Callback
+query được tính theo route trong router.py thay vì chung một button_handler.
+
+Số liệu được xuất dạng text của Prometheus qua GET /metrics (chế độ webhook
+và worker) và tóm tắt bằng lệnh /stats cho admin. Ở chế độ sharded mỗi worker
+giữ số liệu riêng.
+"""
+import bisect
+import contextvars
+import functools
+import itertools
+import secrets
+import threading
+import time
+from sqlalchemy import event
+from telegram.ext import ApplicationHandlerStop
+import config
+
+# Mốc histogram (giây): độ trễ handler / request Bot API, và độ trễ một câu lệnh SQL
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Khóa trong connection.info: thời điểm bắt đầu các câu lệnh đang chạy
+QUERY_START = "metrics_query_start"
+
+class Histogram:
+    """Histogram với các mốc cố định; counts[i] là số giá trị <= buckets[i] và > mốc trước đó"""
+    __slots__ = ("buckets", "counts", "total", "count")
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Ô cuối: lớn hơn mốc cuối (+Inf)
+        self.total = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+    
+    def quantile(self, q):
+        """Ước lượng phân vị bằng nội suy tuyến tính trong ô chứa nó (như histogram_quantile)"""
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return 0.0
+
+class HandlerStats:
+    __slots__ = ("latency", "errors", "sql_statements", "sql_seconds", "api_calls")
+    
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.api_calls = 0
+
+class HandlerScope:
+    """Một lần chạy handler: nhãn (có thể đổi theo route) và phần SQL/Bot API nó gây ra"""
+    __slots__ = ("label", "sql_statements", "sql_seconds", "api_calls")
+    
+    def __init__(self, label):
+        self.label = label
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.api_calls = 0
+
+_scope = contextvars.ContextVar("metrics_scope", default=None)
+
+class Metrics:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.handlers = {}  # Nhãn handler -> HandlerStats
+        self.sql = Histogram(SQL_BUCKETS)
+        self.api = {}  # Method Bot API -> Histogram
+        self.api_errors = {}  # Method Bot API -> số request lỗi
+        self.collectors = {}  # Tên -> hàm trả về dict số liệu (cache, persistence...)
+        # Câu lệnh SQL được ghi từ các thread database
+        self._lock = threading.Lock()
+    
+    def instrument(self, callback, name=None):
+        """Bọc handler async(update, context) để đo độ trễ và phần SQL/Bot API của nó"""
+        label = name or callback.__name__
+        
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            scope = HandlerScope(label)
+            token = _scope.set(scope)
+            started = time.perf_counter()
+            failed = False
+            try:
+                return await callback(update, context)
+            except ApplicationHandlerStop:
+                raise
+            except Exception:
+                failed = True
+                raise
+            finally:
+                _scope.reset(token)
+                self.record_handler(scope, time.perf_counter() - started, failed)
+        
+        return wrapper
+    
+    @staticmethod
+    def relabel(label):
+        """Đổi nhãn của handler đang chạy (ví dụ theo route của callback query)"""
+        scope = _scope.get()
+        if scope is not None:
+            scope.label = label
+    
+    @staticmethod
+    def current_label():
+        """Nhãn của handler đang chạy, None nếu không ở trong handler"""
+        scope = _scope.get()
+        return scope.label if scope is not None else None
+    
+    def record_handler(self, scope, elapsed, failed=False):
+        with self._lock:
+            stats = self.handlers.get(scope.label)
+            if stats is None:
+                stats = self.handlers[scope.label] = HandlerStats()
+            stats.latency.observe(elapsed)
+            stats.errors += failed
+            stats.sql_statements += scope.sql_statements
+            stats.sql_seconds += scope.sql_seconds
+            stats.api_calls += scope.api_calls
+    
+    def record_sql(self, elapsed):
+        scope = _scope.get()
+        with self._lock:
+            self.sql.observe(elapsed)
+            if scope is not None:
+                scope.sql_statements += 1
+                scope.sql_seconds += elapsed
+    
+    def record_api(self, method, elapsed, failed=False):
+        scope = _scope.get()
+        if scope is not None:
+            scope.api_calls += 1
+        histogram = self.api.get(method)
+        if histogram is None:
+            histogram = self.api[method] = Histogram()
+        histogram.observe(elapsed)
+        if failed:
+            self.api_errors[method] = self.api_errors.get(method, 0) + 1
+    
+    def instrument_engine(self, engine):
+        """Đếm số câu lệnh và thời gian chạy SQL qua sự kiện cursor của engine"""
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault(QUERY_START, []).append(time.perf_counter())
+        
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            self.record_sql(time.perf_counter() - conn.info[QUERY_START].pop())
+        
+        def handle_error(exception_context):
+            # Câu lệnh lỗi không có after_cursor_execute
+            conn = exception_context.connection
+            if conn is not None and conn.info.get(QUERY_START):
+                self.record_sql(time.perf_counter() - conn.info[QUERY_START].pop())
+        
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(engine, "handle_error", handle_error)
+    
+    def register(self, name, stats):
+        """Thêm nguồn số liệu dạng gauge: stats() trả về dict (có thể lồng nhau) các giá trị số"""
+        self.collectors[name] = stats
+    
+    def collect(self):
+        """Gọi các nguồn số liệu, trả về {tên: {khóa phẳng: giá trị}}"""
+        def flatten(values, prefix=""):
+            for key, value in values.items():
+                if isinstance(value, dict):
+                    yield from flatten(value, f"{prefix}{key}_")
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield prefix + key, value
+        
+        return {name: dict(flatten(stats())) for name, stats in self.collectors.items()}
+    
+    def handler_summary(self):
+        """Số liệu từng handler, nhiều lượt chạy nhất trước"""
+        with self._lock:
+            rows = [
+                {
+                    "handler": label,
+                    "count": stats.latency.count,
+                    "errors": stats.errors,
+                    "avg": stats.latency.total / stats.latency.count,
+                    "p50": stats.latency.quantile(0.5),
+                    "p95": stats.latency.quantile(0.95),
+                    "sql_per_call": stats.sql_statements / stats.latency.count,
+                    "sql_seconds": stats.sql_seconds,
+                    "api_per_call": stats.api_calls / stats.latency.count
+                }
+                for label, stats in self.handlers.items()
+            ]
+        return sorted(rows, key=lambda row: row["count"], reverse=True)
+    
+    def render(self):
+        """Toàn bộ số liệu ở định dạng text của Prometheus"""
+        lines = []
+        
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+        
+        def write_histogram(name, histogram, labels=""):
+            cumulative = list(itertools.accumulate(histogram.counts))
+            sep = "," if labels else ""
+            for bound, count in zip(histogram.buckets, cumulative):
+                lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {cumulative[-1]}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{name}_sum{suffix} {histogram.total}")
+            lines.append(f"{name}_count{suffix} {histogram.count}")
+        
+        def counters(name, kind, help_text, label, values):
+            header(name, kind, help_text)
+            for key, value in values:
+                lines.append(f'{name}{{{label}="{escape(key)}"}} {value}')
+        
+        collected = self.collect()
+        with self._lock:
+            handlers = sorted(self.handlers.items())
+            header("todo_handler_latency_seconds", "histogram", "Độ trễ handler")
+            for label, stats in handlers:
+                write_histogram("todo_handler_latency_seconds", stats.latency, f'handler="{escape(label)}"')
+            counters("todo_handler_errors_total", "counter", "Số lần handler lỗi", "handler",
+                     ((label, stats.errors) for label, stats in handlers))
+            counters("todo_handler_sql_statements_total", "counter", "Số câu lệnh SQL theo handler", "handler",
+                     ((label, stats.sql_statements) for label, stats in handlers))
+            counters("todo_handler_sql_seconds_total", "counter", "Thời gian chạy SQL theo handler", "handler",
+                     ((label, stats.sql_seconds) for label, stats in handlers))
+            counters("todo_handler_api_calls_total", "counter", "Số request Bot API theo handler", "handler",
+                     ((label, stats.api_calls) for label, stats in handlers))
+            
+            header("todo_sql_statement_seconds", "histogram", "Độ trễ từng câu lệnh SQL (mọi nguồn)")
+            write_histogram("todo_sql_statement_seconds", self.sql)
+            
+            api = sorted(self.api.items())
+            header("todo_bot_api_request_seconds", "histogram", "Độ trễ request Bot API")
+            for method, histogram in api:
+                write_histogram("todo_bot_api_request_seconds", histogram, f'method="{escape(method)}"')
+            counters("todo_bot_api_errors_total", "counter", "Số request Bot API lỗi", "method",
+                     sorted(self.api_errors.items()))
+        
+        for name, values in collected.items():
+            for key, value in sorted(values.items()):
+                metric = f"todo_{name}_{key}"
+                header(metric, "gauge", f"{name}.{key}")
+                lines.append(f"{metric} {value}")
+        
+        header("todo_uptime_seconds", "gauge", "Thời gian tiến trình đã chạy")
+        lines.append(f"todo_uptime_seconds {time.monotonic() - self.started_at}")
+        return "\n".join(lines) + "\n"
+    
+    def summary(self, limit=15):
+        """Tóm tắt ngắn gọn cho lệnh /stats (Markdown)"""
+        uptime = int(time.monotonic() - self.started_at)
+        lines = [f"📊 *Thống kê hiệu năng* (chạy {uptime // 3600}h{uptime % 3600 // 60:02d}m)"]
+        if config.Config.SHARD_COUNT > 1:
+            lines.append(f"Worker {config.Config.SHARD_INDEX + 1}/{config.Config.SHARD_COUNT}")
+        
+        rows = self.handler_summary()
+        table = [f"{'handler':<22}{'n':>7}{'p50':>7}{'p95':>7}{'sql':>5}{'api':>5}"]
+        for row in rows[:limit]:
+            table.append(
+                f"{row['handler'][:21]:<22}{row['count']:>7}"
+                f"{row['p50'] * 1000:>7.1f}{row['p95'] * 1000:>7.1f}"
+                f"{row['sql_per_call']:>5.1f}{row['api_per_call']:>5.1f}"
+            )
+        lines.append("\n⏱️ *Handler* (ms; sql/api: trung bình mỗi lượt)")
+        lines.append("```\n" + "\n".join(table) + "\n```")
+        
+        with self._lock:
+            sql_count, sql_total = self.sql.count, self.sql.total
+            sql_p95 = self.sql.quantile(0.95)
+            api_count = sum(histogram.count for histogram in self.api.values())
+            api_errors = sum(self.api_errors.values())
+            api_top = sorted(self.api.items(), key=lambda item: item[1].count, reverse=True)[:5]
+        
+        lines.append(
+            f"\n🗄️ *SQL:* {sql_count} câu lệnh, tổng {sql_total:.2f}s"
+            + (f", trung bình {sql_total / sql_count * 1000:.2f}ms, p95 {sql_p95 * 1000:.2f}ms" if sql_count else "")
+        )
+        lines.append(f"📡 *Bot API:* {api_count} request, {api_errors} lỗi")
+        for method, histogram in api_top:
+            lines.append(f"• `{method}`: {histogram.count} (p95 {histogram.quantile(0.95) * 1000:.0f}ms)")
+        
+        lines.append("\n🧠 *Cache và bộ đệm*")
+        for name, values in self.collect().items():
+            parts = ", ".join(
+                f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in values.items()
+            )
+            lines.append(f"• `{name}: {parts}`")
+        return "\n".join(lines)
+    
+    async def serve(self, headers, body):
+        """Route GET /metrics của WebhookServer; cần Bearer token nếu đặt METRICS_TOKEN"""
+        token = config.Config.METRICS_TOKEN
+        if token and not secrets.compare_digest(
+            headers.get("authorization", "").encode("latin-1"),
+            f"Bearer {token}".encode("latin-1")
+        ):
+            return 403, "text/plain", b""
+        return 200, CONTENT_TYPE, self.render().encode("utf-8")
+
+def escape(value):
+    """Escape giá trị nhãn Prometheus"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+metrics = Metrics()
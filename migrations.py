@@ -0,0 +1,123 @@
+"""Migration schema có đánh số phiên bản
+
+Base.metadata.create_all chỉ tạo bảng còn thiếu, không thêm index hay cột
+vào database đã tồn tại. Mỗi migration ở đây chạy đúng một lần, theo thứ tự
+phiên bản, và được ghi lại trong bảng schema_version.
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import Table, Column, Integer, String, DateTime, MetaData, select, func, inspect, text
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+schema_version = Table(
+    "schema_version", metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200)),
+    Column("applied_at", DateTime, default=datetime.now)
+)
+
+MIGRATIONS = []
+
+def migration(version, description):
+    """Đăng ký một migration: func(connection, metadata)"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+def create_indexes(conn, models_metadata, *names):
+    """Tạo các index đã khai báo trên model nếu chưa có"""
+    for table in models_metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in names:
+                index.create(conn, checkfirst=True)
+
+def add_column(conn, models_metadata, table_name, column_name):
+    """Thêm cột đã khai báo trên model vào bảng cũ nếu chưa có"""
+    existing = {col["name"] for col in inspect(conn).get_columns(table_name)}
+    if column_name in existing:
+        return
+    column = models_metadata.tables[table_name].c[column_name]
+    column_type = column.type.compile(conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+
+def current_version(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+def upgrade(engine, models_metadata):
+    """Chạy các migration chưa được áp dụng"""
+    metadata.create_all(engine)
+    version = current_version(engine)
+    
+    for number, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if number <= version:
+            continue
+        
+        with engine.begin() as conn:
+            func(conn, models_metadata)
+            conn.execute(schema_version.insert().values(
+                version=number,
+                description=description
+            ))
+        logger.info("Đã áp dụng migration %s: %s", number, description)
+
+@migration(1, "Index cho các truy vấn theo user, hạn chót và danh mục")
+def add_task_indexes(conn, models_metadata):
+    create_indexes(
+        conn, models_metadata,
+        "ix_tasks_user_order",
+        "ix_tasks_user_open_due",
+        "ix_tasks_category",
+        "ix_categories_user"
+    )
+
+@migration(2, "Cột remind_at cho nhắc nhở")
+def add_task_remind_at(conn, models_metadata):
+    add_column(conn, models_metadata, "tasks", "remind_at")
+    create_indexes(conn, models_metadata, "ix_tasks_remind_at")
+
+# Chuẩn hóa cho tìm kiếm: tokenizer unicode61 đã bỏ dấu và chữ hoa, riêng "đ" là chữ cái riêng nên đổi thành "d"
+def _fts_text(column):
+    return f"replace(replace(coalesce({column}, ''), 'đ', 'd'), 'Đ', 'D')"
+
+FTS_STATEMENTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        owner, title, description,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2 3 4 5 6'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts (rowid, owner, title, description)
+        VALUES (new.id, 'u' || new.user_id, {_fts_text('new.title')}, {_fts_text('new.description')});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        DELETE FROM tasks_fts WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF user_id, title, description ON tasks BEGIN
+        UPDATE tasks_fts
+        SET owner = 'u' || new.user_id, title = {_fts_text('new.title')}, description = {_fts_text('new.description')}
+        WHERE rowid = new.id;
+    END""",
+    f"""INSERT INTO tasks_fts (rowid, owner, title, description)
+        SELECT id, 'u' || user_id, {_fts_text('title')}, {_fts_text('description')} FROM tasks"""
+]
+
+@migration(3, "Bảng FTS5 tìm kiếm tiêu đề và mô tả công việc")
+def add_task_search(conn, models_metadata):
+    """owner = "u<user_id>" giúp lọc theo user ngay trong index; prefix index cho tìm kiếm theo tiền tố"""
+    # Chỉ SQLite có FTS5; database khác tìm kiếm bằng LIKE
+    if conn.dialect.name != "sqlite":
+        return
+    for statement in FTS_STATEMENTS:
+        conn.execute(text(statement))
+
+@migration(4, "telegram_id kiểu BIGINT (ID Telegram vượt quá 32 bit)")
+def widen_telegram_id(conn, models_metadata):
+    # SQLite lưu số nguyên tới 64 bit với mọi kiểu INTEGER, không cần đổi
+    if conn.dialect.name == "sqlite":
+        return
+    conn.execute(text("ALTER TABLE users ALTER COLUMN telegram_id TYPE BIGINT"))
@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from telegram.constants import ChatType
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import BaseRateLimiter
+from cache import LRUCache
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Các request sửa tin nhắn có thể gộp lại: chỉ cần gửi lần sửa mới nhất
+EDIT_ENDPOINTS = ("editMessageText", "editMessageReplyMarkup")
+
+class PendingEdit:
+    __slots__ = ("endpoint", "send_at", "sending", "superseded")
+    
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.send_at = None  # Thời điểm được gửi đã đặt chỗ trong chat
+        self.sending = False
+        self.superseded = False
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """Điều phối mọi request gửi tới Bot API theo giới hạn flood của Telegram
+    
+    - Tối đa global_rate tin nhắn/giây cho toàn bot
+    - Mỗi chat cách nhau chat_interval giây, cho phép dồn chat_burst tin liên tiếp
+    - Gặp RetryAfter: tạm dừng toàn bộ việc gửi trong retry_after giây rồi thử lại
+    - Nhiều lần sửa cùng một tin nhắn đang chờ: chỉ gửi lần sửa mới nhất
+    
+    Chỉ các request có chat_id bị giới hạn; answerCallbackQuery, getMe... đi thẳng.
+    Lịch gửi dùng thời điểm dự kiến (GCRA) nên mỗi request là O(1).
+    """
+    def __init__(self, global_rate=30, chat_interval=1.0, chat_burst=3, max_retries=3):
+        self.global_interval = 1 / global_rate
+        self.chat_interval = chat_interval
+        self.chat_tolerance = (chat_burst - 1) * chat_interval
+        self.max_retries = max_retries
+        
+        self._global_next = 0.0
+        self._chat_next = OrderedDict()  # chat_id -> thời điểm dự kiến cho tin kế tiếp
+        self._paused_until = 0.0
+        self._pending_edits = {}  # (chat_id, message_id) -> PendingEdit mới nhất
+        
+        self.coalesced_edits = 0
+        self.retries = 0
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+    
+    def _reserve_chat_slot(self, chat_id, now):
+        """Đặt chỗ cho một tin trong chat, trả về thời điểm được gửi"""
+        tat = max(self._chat_next.pop(chat_id, now), now)
+        self._chat_next[chat_id] = tat + self.chat_interval
+        
+        # Bỏ các chat đã rảnh (thời điểm dự kiến đã qua), đứng đầu theo thứ tự LRU
+        while self._chat_next:
+            oldest_chat, oldest_tat = next(iter(self._chat_next.items()))
+            if oldest_tat >= now:
+                break
+            del self._chat_next[oldest_chat]
+        
+        return max(now, tat - self.chat_tolerance)
+    
+    def _reserve_global_slot(self, now):
+        send_at = max(now, self._global_next, self._paused_until)
+        self._global_next = send_at + self.global_interval
+        return send_at
+    
+    @staticmethod
+    async def _sleep_until(moment):
+        delay = moment - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    
+    def _track_edit(self, endpoint, data):
+        """Ghi nhận lần sửa mới nhất của một tin nhắn
+        
+        Lần sửa cũ chưa được gửi sẽ bị thay thế, và lần sửa mới nhận lại chỗ
+        đã đặt của nó nên không phải xếp hàng thêm trong chat.
+        """
+        key = (data.get("chat_id"), data.get("message_id"))
+        if key[1] is None:
+            return None, None
+        
+        edit = PendingEdit(endpoint)
+        previous = self._pending_edits.get(key)
+        # editMessageText thay thế mọi lần sửa trước; chỉ đổi bàn phím thì không thay được sửa nội dung
+        if previous and not previous.sending and (
+            endpoint == "editMessageText" or previous.endpoint == endpoint
+        ):
+            previous.superseded = True
+            edit.send_at = previous.send_at
+        self._pending_edits[key] = edit
+        return key, edit
+    
+    @staticmethod
+    async def _send(endpoint, callback, args, kwargs):
+        """Gửi request, ghi nhận độ trễ và lỗi theo method vào metrics"""
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await callback(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            metrics.record_api(endpoint, time.perf_counter() - started, failed)
+    
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return await self._send(endpoint, callback, args, kwargs)
+        
+        key, edit = self._track_edit(endpoint, data) if endpoint in EDIT_ENDPOINTS else (None, None)
+        max_retries = rate_limit_args if rate_limit_args is not None else self.max_retries
+        
+        try:
+            if edit and edit.send_at is not None:
+                send_at = edit.send_at
+            else:
+                send_at = self._reserve_chat_slot(chat_id, time.monotonic())
+                if edit:
+                    edit.send_at = send_at
+            await self._sleep_until(send_at)
+            
+            if edit:
+                if edit.superseded:
+                    self.coalesced_edits += 1
+                    return True
+                edit.sending = True
+            
+            for attempt in range(max_retries + 1):
+                await self._sleep_until(self._reserve_global_slot(time.monotonic()))
+                try:
+                    return await self._send(endpoint, callback, args, kwargs)
+                except RetryAfter as e:
+                    if attempt >= max_retries:
+                        raise
+                    delay = e.retry_after
+                    if isinstance(delay, timedelta):
+                        delay = delay.total_seconds()
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    self.retries += 1
+                    logger.warning("Bị giới hạn flood, thử lại sau %ss (%s)", delay, endpoint)
+        finally:
+            if key and self._pending_edits.get(key) is edit:
+                del self._pending_edits[key]
+    
+    def stats(self):
+        """Số lần gộp lần sửa tin nhắn và thử lại do giới hạn flood"""
+        return {
+            "tracked_chats": len(self._chat_next),
+            "pending_edits": len(self._pending_edits),
+            "coalesced_edits": self.coalesced_edits,
+            "retries": self.retries
+        }
+
+class MessageEditor:
+    """Sửa tin nhắn của callback query, bỏ qua các lần sửa không đổi gì
+    
+    Ghi nhớ dấu vân tay (text, bàn phím) đã gửi cho từng (chat, tin nhắn):
+    - Nội dung và bàn phím giống hệt: không gọi Bot API
+    - Chỉ bàn phím thay đổi: chỉ gọi editMessageReplyMarkup
+    
+    Lần sửa được gửi nền: handler không chờ lượt gửi trong chat nên trả lại
+    khóa của chat ngay (xem updates.py), và update kế tiếp của chat có thể
+    thay thế lần sửa còn đang chờ trong OutboundRateLimiter. Bấm nhanh nhiều
+    lần trên cùng tin nhắn vì vậy chỉ tốn lần sửa cuối cùng. Dấu vân tay được
+    ghi ngay khi lên lịch và bị xóa nếu lần gửi thất bại.
+    
+    Mọi lần sửa tin nhắn của callback đều phải đi qua đây, nếu không dấu vân
+    tay đã lưu sẽ không còn đúng với nội dung thật của tin nhắn. Tin nhắn trong
+    nhóm có thể được worker khác sửa (shard.py chia update theo user), nên với
+    track_shared_chats=False chỉ tin nhắn trong chat riêng được ghi nhớ.
+    """
+    def __init__(self, maxsize=10000, track_shared_chats=True):
+        self.fingerprints = LRUCache(maxsize)
+        self.track_shared_chats = track_shared_chats
+        self._sending = set()  # Các lần sửa đang gửi nền
+        
+        self.skipped_edits = 0
+        self.markup_only_edits = 0
+        self.not_modified_errors = 0
+        self.failed_edits = 0
+    
+    @staticmethod
+    def fingerprint(text, parse_mode, reply_markup):
+        markup = reply_markup.to_json() if reply_markup else None
+        return hash((text, parse_mode)), hash(markup)
+    
+    async def edit(self, query, text, parse_mode=None, reply_markup=None):
+        message = query.message
+        if message is None or (not self.track_shared_chats and message.chat.type != ChatType.PRIVATE):
+            return await query.edit_message_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+        
+        key = (message.chat_id, message.message_id)
+        fingerprint = self.fingerprint(text, parse_mode, reply_markup)
+        previous = self.fingerprints.get(key)
+        
+        if previous == fingerprint:
+            self.skipped_edits += 1
+            return message
+        
+        if previous and previous[0] == fingerprint[0]:
+            self.markup_only_edits += 1
+            request = query.edit_message_reply_markup(reply_markup=reply_markup)
+        else:
+            request = query.edit_message_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+        
+        # Lần sửa sau so sánh với nội dung sẽ có, kể cả khi lần này chưa gửi xong
+        self.fingerprints.set(key, fingerprint)
+        task = asyncio.ensure_future(self._send(key, fingerprint, request))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+        return message
+    
+    async def _send(self, key, fingerprint, request):
+        try:
+            await request
+        except BadRequest as e:
+            # Tin nhắn chưa được theo dõi (ví dụ sau khi bot khởi động lại) có thể đã đúng nội dung
+            if "not modified" in str(e).lower():
+                self.not_modified_errors += 1
+                return
+            self._forget(key, fingerprint)
+            logger.warning("Không sửa được tin nhắn %s: %s", key, e)
+        except Exception as e:
+            self._forget(key, fingerprint)
+            logger.warning("Không sửa được tin nhắn %s: %r", key, e)
+    
+    def _forget(self, key, fingerprint):
+        """Lần gửi thất bại: nội dung thật của tin nhắn không còn biết chắc"""
+        self.failed_edits += 1
+        # Giữ dấu vân tay của lần sửa mới hơn (nếu có), nó sẽ tự xử lý kết quả của mình
+        if self.fingerprints.get(key) == fingerprint:
+            self.fingerprints.pop(key)
+    
+    async def drain(self):
+        """Chờ gửi xong các lần sửa đang chờ (trước khi dừng bot)"""
+        while self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+    
+    def stats(self):
+        """Số lần gọi Bot API đã tiết kiệm được"""
+        return {
+            "tracked_messages": len(self.fingerprints),
+            "pending_edits": len(self._sending),
+            "skipped_edits": self.skipped_edits,
+            "markup_only_edits": self.markup_only_edits,
+            "not_modified_errors": self.not_modified_errors,
+            "failed_edits": self.failed_edits
+        }
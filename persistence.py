@@ -0,0 +1,163 @@
+"""Persistence cho PTB: user_data, chat_data và trạng thái hội thoại lưu trong database
+
+Application chỉ gọi update_* cho các user/chat có thay đổi, theo chu kỳ
+update_interval và một lần khi tắt. Các lần gọi đó chỉ đưa dữ liệu vào hàng
+đợi; một task ghi duy nhất gom cả lượt vào một giao dịch, chạy trong thread
+pool database. Dữ liệu của user/chat được nạp lười ở lần đầu có update
+(refresh_user_data/refresh_chat_data) thay vì nạp toàn bộ lúc khởi động.
+
+Việc nhớ user/chat nào đã nạp và bản đã lưu gần nhất dùng LRU giới hạn: mục bị
+đẩy ra chỉ khiến lần sau nạp lại (không ghi đè dữ liệu đang có trong bộ nhớ)
+hoặc ghi lại một bản không đổi.
+"""
+import asyncio
+import json
+import logging
+import pickle
+from datetime import datetime, timedelta
+from telegram.ext import BasePersistence, PersistenceInput
+from cache import LRUCache
+from database import db
+import config
+
+logger = logging.getLogger(__name__)
+
+# Phân biệt "chưa biết" với "đã biết là không có dữ liệu" (None) trong snapshots
+MISSING = object()
+
+class DatabasePersistence(BasePersistence):
+    def __init__(self, update_interval=60, cache_size=10000):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self.loaded = LRUCache(cache_size)  # (scope, id) -> True khi đã nạp, hoặc future đang nạp
+        self.snapshots = LRUCache(cache_size)  # (scope, id) -> bytes|None đã lưu (hoặc đang chờ ghi), tránh ghi lại dữ liệu không đổi
+        self.pending_data = {}  # (scope, id) -> bytes | None (xóa)
+        self.pending_conversations = {}  # (tên, khóa JSON) -> bytes | None (xóa)
+        self.write_task = None
+        self.writes = 0
+        self.rows_written = 0
+    
+    # Dữ liệu được nạp lười theo từng user/chat nên lúc khởi động trả về rỗng
+    async def get_user_data(self):
+        return {}
+    
+    async def get_chat_data(self):
+        return {}
+    
+    async def get_bot_data(self):
+        return {}
+    
+    async def get_callback_data(self):
+        return None
+    
+    async def get_conversations(self, name):
+        """Các hội thoại đang dở dang; hội thoại bỏ dở quá CONVERSATION_TIMEOUT bị xóa thay vì nạp"""
+        # Job hết hạn của ConversationHandler không sống qua lần khởi động lại
+        stale_before = datetime.now() - timedelta(seconds=config.Config.CONVERSATION_TIMEOUT)
+        rows = await db.run(db.load_conversations, name, stale_before)
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+    
+    async def refresh_user_data(self, user_id, user_data):
+        await self._load("user", user_id, user_data)
+    
+    async def refresh_chat_data(self, chat_id, chat_data):
+        await self._load("chat", chat_id, chat_data)
+    
+    async def refresh_bot_data(self, bot_data):
+        pass
+    
+    async def _load(self, scope, key, target):
+        """Nạp dữ liệu đã lưu vào target ở lần đầu gặp user/chat"""
+        item = (scope, key)
+        loading = self.loaded.get(item)
+        if loading is True:
+            return
+        if loading is None:
+            loading = asyncio.ensure_future(db.run(db.load_persistent_data, scope, key))
+            self.loaded.set(item, loading)
+        
+        try:
+            stored = await loading
+        except Exception:
+            self.loaded.pop(item)
+            raise
+        self.loaded.set(item, True)
+        
+        if self.snapshots.get(item, MISSING) is MISSING:
+            self.snapshots.set(item, stored)
+        if stored:
+            # Không ghi đè giá trị handler đã đặt trong lúc chờ nạp
+            for name, value in pickle.loads(stored).items():
+                target.setdefault(name, value)
+    
+    async def update_user_data(self, user_id, data):
+        self._queue_data("user", user_id, data)
+    
+    async def update_chat_data(self, chat_id, data):
+        self._queue_data("chat", chat_id, data)
+    
+    async def update_bot_data(self, data):
+        pass
+    
+    async def update_callback_data(self, data):
+        pass
+    
+    async def drop_user_data(self, user_id):
+        self._queue_data("user", user_id, None)
+    
+    async def drop_chat_data(self, chat_id):
+        self._queue_data("chat", chat_id, None)
+    
+    def _queue_data(self, scope, key, data):
+        item = (scope, key)
+        blob = pickle.dumps(data) if data else None
+        if self.snapshots.get(item, MISSING) == blob:
+            return
+        self.snapshots.set(item, blob)
+        self.pending_data[item] = blob
+        self._schedule_write()
+    
+    async def update_conversation(self, name, key, new_state):
+        state = None if new_state is None else pickle.dumps(new_state)
+        self.pending_conversations[(name, json.dumps(list(key)))] = state
+        self._schedule_write()
+    
+    def _schedule_write(self):
+        # Các update_* của cùng một lượt update_persistence chạy xong trước khi task ghi bắt đầu
+        if self.write_task is None or self.write_task.done():
+            self.write_task = asyncio.ensure_future(self._write_pending())
+    
+    async def _write_pending(self):
+        """Ghi hàng đợi theo lô cho đến khi rỗng; lỗi thì giữ lại để ghi ở lượt sau"""
+        while self.pending_data or self.pending_conversations:
+            data, self.pending_data = self.pending_data, {}
+            conversations, self.pending_conversations = self.pending_conversations, {}
+            try:
+                await db.run(db.save_persistence, data, conversations)
+            except Exception:
+                logger.exception("Lỗi khi lưu persistence, sẽ thử lại ở lượt sau")
+                # Thay đổi mới hơn đến trong lúc ghi được ưu tiên
+                for item, value in data.items():
+                    self.pending_data.setdefault(item, value)
+                for item, value in conversations.items():
+                    self.pending_conversations.setdefault(item, value)
+                return
+            self.writes += 1
+            self.rows_written += len(data) + len(conversations)
+    
+    async def flush(self):
+        """Ghi nốt hàng đợi khi tắt bot"""
+        if self.write_task is not None:
+            await self.write_task
+        await self._write_pending()
+    
+    def stats(self):
+        """Số liệu ghi của persistence"""
+        return {
+            "loaded": len(self.loaded),
+            "pending": len(self.pending_data) + len(self.pending_conversations),
+            "writes": self.writes,
+            "rows_written": self.rows_written
+        }
@@ -0,0 +1,192 @@
+"""Phát hiện truy vấn N+1 và ghi log truy vấn chậm khi phát triển (SQL_DEBUG=1)
+
+Mỗi lần handler chạy, các câu lệnh SQL được gom theo dạng (bỏ tham số, gộp
+danh sách IN). Một dạng lặp lại từ SQL_N_PLUS_ONE_THRESHOLD lần trong cùng
+một handler (ví dụ count() cho từng danh mục, hay lazy load task.category
+trong vòng lặp) bị cảnh báo là N+1, kèm handler (theo route của callback
+query nếu có) và chỗ gọi trong mã của bot. Câu lệnh chạy lâu hơn SQL_SLOW_MS
+được ghi cùng kết quả EXPLAIN (QUERY PLAN) vào file log xoay vòng.
+
+Khi tắt, không listener nào được đăng ký và handler không bị bọc thêm, nên
+không tốn gì cho mỗi câu lệnh hay mỗi update.
+"""
+import contextvars
+import functools
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+from sqlalchemy import event
+import config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Khung của các module này không phải là chỗ gọi đáng báo
+SKIPPED_FILES = (os.path.abspath(__file__), os.path.join(PROJECT_DIR, "metrics.py"))
+STACK_DEPTH = 4
+MAX_STATEMENT_LENGTH = 500
+
+# Khóa trong connection.info: thời điểm bắt đầu các câu lệnh đang chạy
+QUERY_START = "query_debug_start"
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|%s)(?:\s*,\s*(?:\?|%\(\w+\)s|%s))*\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+def statement_shape(statement):
+    """Dạng của câu lệnh: bỏ giá trị cụ thể để các lần chạy N+1 trùng nhau"""
+    shape = STRING_LITERAL.sub("?", statement)
+    shape = NUMBER_LITERAL.sub("?", shape)
+    shape = PLACEHOLDER_LIST.sub("(?)", shape)
+    return WHITESPACE.sub(" ", shape).strip()
+
+def call_site():
+    """Các khung gọi gần nhất nằm trong mã của bot (không tính thư viện)"""
+    frames = []
+    frame = sys._getframe(2)
+    while frame is not None and len(frames) < STACK_DEPTH:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(PROJECT_DIR) and filename not in SKIPPED_FILES:
+            frames.append(f"{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} {frame.f_code.co_name}")
+        frame = frame.f_back
+    return " <- ".join(frames) or "?"
+
+class QueryTrace:
+    """Các câu lệnh SQL của một lần chạy handler"""
+    __slots__ = ("shapes", "sites", "statements")
+    
+    def __init__(self):
+        self.shapes = Counter()
+        self.sites = {}  # Dạng bị nghi N+1 -> chỗ gọi
+        self.statements = 0
+
+_trace = contextvars.ContextVar("query_trace", default=None)
+
+class QueryDebugger:
+    def __init__(self, threshold=5, slow_ms=100):
+        self.threshold = threshold
+        self.slow_seconds = slow_ms / 1000
+        self.installed = False
+        
+        # Log truy vấn chậm và N+1, gắn file xoay vòng khi install
+        self.log = logging.getLogger("sql_debug")
+        
+        self.n_plus_one = 0
+        self.slow_queries = 0
+    
+    def install(self, engine, path, max_bytes, backups):
+        """Đăng ký listener trên engine và mở file log"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+        self.log.addHandler(handler)
+        self.log.setLevel(logging.INFO)
+        # Log truy vấn chậm chỉ ghi ra file; cảnh báo N+1 đã đi qua logger của module
+        self.log.propagate = False
+        
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(engine, "handle_error", self.handle_error)
+        self.installed = True
+        metrics.register("query_debug", self.stats)
+        logger.warning("SQL_DEBUG đang bật: theo dõi N+1 và truy vấn chậm, ghi vào %s", path)
+    
+    def trace(self, callback):
+        """Bọc handler async(update, context) để gom câu lệnh SQL của mỗi lần chạy"""
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            trace = QueryTrace()
+            token = _trace.set(trace)
+            try:
+                return await callback(update, context)
+            finally:
+                _trace.reset(token)
+                self.report(trace, metrics.current_label() or callback.__name__)
+        
+        return wrapper
+    
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(QUERY_START, []).append(time.perf_counter())
+    
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info[QUERY_START].pop()
+        
+        trace = _trace.get()
+        if trace is not None:
+            shape = statement_shape(statement)
+            trace.statements += 1
+            trace.shapes[shape] += 1
+            # Chỉ lấy stack khi dạng này vừa chạm ngưỡng
+            if trace.shapes[shape] == self.threshold:
+                trace.sites[shape] = call_site()
+        
+        if elapsed >= self.slow_seconds and not executemany:
+            self.log_slow_query(conn, statement, parameters, elapsed)
+    
+    @staticmethod
+    def handle_error(exception_context):
+        # Câu lệnh lỗi không có after_cursor_execute
+        conn = exception_context.connection
+        if conn is not None and conn.info.get(QUERY_START):
+            conn.info[QUERY_START].pop()
+    
+    def report(self, trace, handler):
+        """Cảnh báo các dạng câu lệnh lặp lại quá ngưỡng trong một lần chạy handler"""
+        for shape, site in trace.sites.items():
+            self.n_plus_one += 1
+            message = (
+                f"Nghi N+1 trong {handler}: {trace.shapes[shape]}/{trace.statements} câu lệnh cùng dạng "
+                f"{shape[:MAX_STATEMENT_LENGTH]} tại {site}"
+            )
+            logger.warning(message)
+            self.log.warning(message)
+    
+    def log_slow_query(self, conn, statement, parameters, elapsed):
+        """Ghi câu lệnh chậm kèm kế hoạch thực thi (chỉ với SELECT)"""
+        self.slow_queries += 1
+        plan = ""
+        if statement.lstrip()[:6].upper().startswith(("SELECT", "WITH")):
+            plan = self.explain(conn, statement, parameters)
+        self.log.info(
+            "Truy vấn chậm %.1fms trong %s tại %s\n%s\nTham số: %r%s",
+            elapsed * 1000, metrics.current_label() or "-", call_site(),
+            statement.strip()[:MAX_STATEMENT_LENGTH * 4], parameters,
+            f"\nKế hoạch:\n{plan}" if plan else ""
+        )
+    
+    @staticmethod
+    def explain(conn, statement, parameters):
+        """Chạy EXPLAIN trên cùng kết nối DBAPI (không qua SQLAlchemy nên không sinh sự kiện)"""
+        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception as e:
+            return f"(không chạy được EXPLAIN: {e})"
+        finally:
+            cursor.close()
+        
+        if conn.dialect.name == "sqlite":
+            # (id, parent, notused, detail)
+            return "\n".join(f"  {row[1]}>{row[0]} {row[-1]}" for row in rows)
+        return "\n".join(f"  {row[0]}" for row in rows)
+    
+    def stats(self):
+        return {
+            "n_plus_one": self.n_plus_one,
+            "slow_queries": self.slow_queries
+        }
+
+query_debugger = QueryDebugger(
+    threshold=config.Config.SQL_N_PLUS_ONE_THRESHOLD,
+    slow_ms=config.Config.SQL_SLOW_MS
+)
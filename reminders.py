@@ -0,0 +1,102 @@
+import heapq
+import logging
+from datetime import datetime, timedelta
+from telegram.constants import ParseMode
+from telegram.error import TelegramError
+import config
+from database import db
+from cache import render_cache
+from keyboards import TodoKeyboards
+from utils import date_utils
+
+logger = logging.getLogger(__name__)
+
+class ReminderScheduler:
+    """Gửi nhắc nhở công việc bằng một job lặp trên JobQueue
+    
+    Chỉ các lời nhắc trong cửa sổ thời gian sắp tới được nạp vào min-heap
+    (remind_at, task_id); phần còn lại nằm trong database và được quét dần
+    qua index ix_tasks_remind_at, nên chi phí khởi động không phụ thuộc vào
+    tổng số lời nhắc đang chờ.
+    """
+    def __init__(self):
+        self.window = timedelta(minutes=config.Config.REMINDER_WINDOW_MINUTES)
+        self.tick_seconds = config.Config.REMINDER_TICK_SECONDS
+        self.batch_size = config.Config.REMINDER_BATCH_SIZE
+        self.max_loaded = config.Config.REMINDER_MAX_LOADED
+        # Chế độ nhiều worker: mỗi worker chỉ gửi lời nhắc của các user thuộc mình
+        self.shard = (config.Config.SHARD_INDEX, config.Config.SHARD_COUNT) if config.Config.SHARD_COUNT > 1 else None
+        
+        self.heap = []
+        self.horizon = None  # Mọi lời nhắc đến trước mốc này đã nằm trong heap
+        self.cursor = None  # Mốc (remind_at, id) đã nạp đến; id None nghĩa là hết mốc thời gian đó
+    
+    def start(self, job_queue):
+        """Đăng ký job quét lời nhắc"""
+        job_queue.run_repeating(self.tick, interval=self.tick_seconds, first=1, name="reminders")
+    
+    def schedule(self, task_id, remind_at):
+        """Đưa lời nhắc vừa đặt vào heap nếu nó thuộc cửa sổ đã nạp
+        
+        Lời nhắc xa hơn sẽ được nạp khi cửa sổ tiến tới. Bản ghi trùng hoặc
+        đã lỗi thời trong heap không gây hại vì claim_due_reminders kiểm tra
+        lại với database trước khi gửi.
+        """
+        if self.horizon is not None and remind_at <= self.horizon:
+            heapq.heappush(self.heap, (remind_at, task_id))
+    
+    async def refill(self, now):
+        """Nạp các lời nhắc của cửa sổ kế tiếp từ database"""
+        limit = self.max_loaded - len(self.heap)
+        if limit <= 0:
+            return
+        
+        horizon = now + self.window
+        # Đặt horizon trước khi truy vấn để lời nhắc được tạo trong lúc nạp vẫn vào heap
+        self.horizon = horizon
+        
+        rows = await db.run(db.get_upcoming_reminders, self.cursor, horizon, limit, self.shard)
+        for row in rows:
+            heapq.heappush(self.heap, row)
+        
+        if len(rows) == limit:
+            # Heap đã đầy: chỉ coi là đã nạp đến lời nhắc cuối cùng
+            self.cursor = rows[-1]
+            self.horizon = rows[-1][0]
+        else:
+            self.cursor = (horizon, None)
+    
+    async def tick(self, context):
+        """Gửi các lời nhắc đã đến hạn theo từng lô"""
+        now = datetime.now()
+        while True:
+            if self.horizon is None or now + self.window / 2 >= self.horizon:
+                await self.refill(now)
+            if not self.heap or self.heap[0][0] > now:
+                break
+            
+            task_ids = []
+            while self.heap and self.heap[0][0] <= now and len(task_ids) < self.batch_size:
+                task_ids.append(heapq.heappop(self.heap)[1])
+            
+            reminders = await db.run(db.claim_due_reminders, task_ids, now)
+            for reminder in reminders:
+                await self.send(context.bot, reminder)
+    
+    async def send(self, bot, reminder):
+        # Lời nhắc đã được đánh dấu gửi (remind_at = NULL): màn hình chi tiết đã cũ
+        render_cache.bump(reminder.chat_id)
+        
+        text = f"🔔 *Nhắc nhở:* {reminder.title}"
+        if reminder.due_date:
+            text += f"\n📅 Hạn chót: {date_utils.format_date(reminder.due_date)}"
+        
+        try:
+            await bot.send_message(
+                reminder.chat_id,
+                text,
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=TodoKeyboards.task_detail(reminder.task_id)
+            )
+        except TelegramError as e:
+            logger.warning("Không gửi được nhắc nhở task %s: %s", reminder.task_id, e)
@@ -0,0 +1,63 @@
+"""Gửi lại các update đã ghi (JSON Lines hoặc mảng JSON) tới webhook của bot
+
+Ví dụ:
+    python replay_updates.py updates.jsonl --concurrency 20
+"""
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+def load_updates(path):
+    """Đọc update từ file JSON Lines hoặc file chứa một mảng JSON"""
+    with open(path, encoding="utf-8") as f:
+        content = f.read().strip()
+    if content.startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+def post_update(url, secret, update):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    if secret:
+        request.add_header("X-Telegram-Bot-Api-Secret-Token", secret)
+    
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except urllib.error.URLError:
+        return "error"
+
+def main():
+    default_url = f"http://localhost:{config.Config.PORT}{config.Config.WEBHOOK_PATH}"
+    
+    parser = argparse.ArgumentParser(description="Gửi lại update đã ghi tới webhook")
+    parser.add_argument("file", help="File JSON Lines hoặc mảng JSON chứa các update")
+    parser.add_argument("--url", default=default_url, help="URL webhook")
+    parser.add_argument("--secret", default=config.Config.WEBHOOK_SECRET, help="Secret token của webhook")
+    parser.add_argument("--concurrency", type=int, default=1, help="Số request gửi đồng thời")
+    args = parser.parse_args()
+    
+    updates = load_updates(args.file)
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        statuses = Counter(executor.map(lambda u: post_update(args.url, args.secret, u), updates))
+    elapsed = time.perf_counter() - start
+    
+    print(f"Đã gửi {len(updates)} update trong {elapsed:.2f}s ({len(updates) / elapsed:.1f} update/s)")
+    for status, count in sorted(statuses.items(), key=str):
+        print(f"  {status}: {count}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Bảng định tuyến callback query và mã hóa callback_data gọn
+
+callback_data có dạng "<phiên bản><mã hành động>[:tham số...]", ví dụ
+"1d:2s" là task_detail với task_id=100. Số nguyên được ghi theo base36, ngày
+giờ tính từ mốc epoch, nên dữ liệu luôn nằm xa dưới giới hạn 64 byte của
+Telegram. Khi đổi định dạng, tăng CALLBACK_VERSION: nút cũ sẽ không khớp
+route nào và được xử lý như nút đã hết hạn thay vì bị đọc sai.
+"""
+import re
+from datetime import date, datetime, timedelta
+
+CALLBACK_VERSION = "1"
+SEPARATOR = ":"
+MAX_CALLBACK_DATA = 64
+
+EPOCH = datetime(1970, 1, 1)
+BASE36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def encode_int(value):
+    if value < 0:
+        return "-" + encode_int(-value)
+    digits = ""
+    while True:
+        value, remainder = divmod(value, 36)
+        digits = BASE36[remainder] + digits
+        if not value:
+            return digits
+
+def decode_int(text):
+    return int(text, 36)
+
+def encode_str(value):
+    if SEPARATOR in value:
+        raise ValueError(f"Tham số không được chứa '{SEPARATOR}': {value!r}")
+    return value
+
+# Kiểu tham số -> (mã hóa, giải mã); tham số Nullable là None được ghi thành chuỗi rỗng
+CODECS = {
+    int: (encode_int, decode_int),
+    bool: (lambda value: "1" if value else "0", lambda text: text == "1"),
+    str: (encode_str, str),
+    date: (
+        lambda value: encode_int((value - EPOCH.date()).days),
+        lambda text: EPOCH.date() + timedelta(days=decode_int(text))
+    ),
+    datetime: (
+        lambda value: encode_int((value - EPOCH) // timedelta(microseconds=1)),
+        lambda text: EPOCH + timedelta(microseconds=decode_int(text))
+    )
+}
+
+class Choice:
+    """Kiểu tham số chỉ nhận một trong các chuỗi cho trước"""
+    __slots__ = ("values",)
+    
+    def __init__(self, *values):
+        self.values = frozenset(values)
+    
+    def check(self, value):
+        if value not in self.values:
+            raise ValueError(f"Giá trị không hợp lệ: {value!r}")
+        return value
+
+class Nullable:
+    """Tham số được phép để trống: None được ghi thành chuỗi rỗng và đọc lại thành None
+    
+    Tham số không khai báo Nullable mà để trống thì callback_data bị coi là không hợp lệ.
+    """
+    __slots__ = ("kind",)
+    
+    def __init__(self, kind):
+        self.kind = kind
+
+def codec(kind):
+    """(mã hóa, giải mã) của một kiểu tham số"""
+    if isinstance(kind, Nullable):
+        return codec(kind.kind)
+    if isinstance(kind, Choice):
+        return kind.check, kind.check
+    return CODECS[kind]
+
+class Route:
+    __slots__ = ("name", "code", "types", "user", "context")
+    
+    def __init__(self, name, code, types, user=False, context=False):
+        self.name = name
+        self.code = code
+        self.types = types
+        self.user = user  # Handler cần thông tin user (tra cứu database/cache)
+        self.context = context  # Handler cần CallbackContext
+
+class CallbackRouter:
+    def __init__(self, version=CALLBACK_VERSION):
+        self.version = version
+        self.routes = {}  # Mã hành động -> Route
+        self.names = {}  # Tên hành động -> Route
+    
+    def action(self, name, code, *types, user=False, context=False):
+        """Khai báo một hành động với mã và kiểu các tham số"""
+        if code in self.routes or name in self.names:
+            raise ValueError(f"Hành động bị trùng: {name} ({code})")
+        route = Route(name, code, types, user, context)
+        self.routes[code] = route
+        self.names[name] = route
+        return route
+    
+    def encode(self, name, *args):
+        """Tạo callback_data cho hành động name"""
+        route = self.names[name]
+        if len(args) != len(route.types):
+            raise ValueError(f"{name} cần {len(route.types)} tham số")
+        
+        parts = [self.version + route.code]
+        for kind, value in zip(route.types, args):
+            if value is None:
+                if not isinstance(kind, Nullable):
+                    raise ValueError(f"{name}: tham số không được để trống")
+                parts.append("")
+            else:
+                parts.append(codec(kind)[0](value))
+        data = SEPARATOR.join(parts)
+        
+        if len(data.encode("utf-8")) > MAX_CALLBACK_DATA:
+            raise ValueError(f"callback_data quá dài: {data}")
+        return data
+    
+    def decode(self, data):
+        """Đọc callback_data, trả về (route, tham số); (None, None) nếu không hợp lệ hoặc đã cũ"""
+        head, *values = (data or "").split(SEPARATOR)
+        if not head.startswith(self.version):
+            return None, None
+        
+        route = self.routes.get(head[len(self.version):])
+        if route is None or len(values) != len(route.types):
+            return None, None
+        
+        args = []
+        try:
+            for kind, value in zip(route.types, values):
+                if value:
+                    args.append(codec(kind)[1](value))
+                elif isinstance(kind, Nullable):
+                    args.append(None)
+                else:
+                    # Tham số bắt buộc bị bỏ trống: dữ liệu giả mạo hoặc hỏng
+                    return None, None
+        except (ValueError, OverflowError):
+            return None, None
+        return route, tuple(args)
+    
+    def route_name(self, data):
+        """Tên hành động của callback_data mà không giải mã tham số, None nếu không nhận ra"""
+        head = (data or "").split(SEPARATOR, 1)[0]
+        if not head.startswith(self.version):
+            return None
+        route = self.routes.get(head[len(self.version):])
+        return route.name if route else None
+    
+    def pattern(self, name):
+        """Regex cho CallbackQueryHandler chỉ khớp với hành động name"""
+        prefix = re.escape(self.version + self.names[name].code)
+        return f"^{prefix}({re.escape(SEPARATOR)}|$)"
+
+callbacks = CallbackRouter()
+
+# Điều hướng chung
+callbacks.action("main_menu", "m")
+callbacks.action("settings", "S")
+callbacks.action("manage_categories", "k", user=True)
+
+# Danh sách và chi tiết công việc
+callbacks.action("view_tasks", "l", user=True)
+# page, lùi trang, rồi khóa sắp xếp (completed, priority, due_date, id) của task mốc;
+# due_date là tham số duy nhất được để trống (task không có hạn chót)
+callbacks.action("page", "p", int, bool, bool, int, Nullable(datetime), int, user=True)
+callbacks.action("task_detail", "d", int)
+callbacks.action("edit_task", "t", int)
+callbacks.action("complete", "c", int)
+callbacks.action("delete_task", "x", int)
+callbacks.action("confirm_delete", "X", int, user=True)
+callbacks.action("search", "s", int, user=True, context=True)
+
+# Sửa thuộc tính task
+callbacks.action("set_priority", "P", int, int)
+callbacks.action("set_category", "C", int, int)
+callbacks.action("set_duedate", "D", int, date)
+callbacks.action("set_reminder", "r", int)
+callbacks.action("remind", "R", int, Choice("30", "60", "180", "tomorrow", "off"))
+
+# Cài đặt, xuất/nhập dữ liệu
+callbacks.action("account_info", "A")
+callbacks.action("notification_settings", "N")
+callbacks.action("export_data", "e")
+callbacks.action("export", "E", str, bool, user=True)
+callbacks.action("import_data", "i")
+
+# Các bước của ConversationHandler thêm công việc
+callbacks.action("add_task", "a")
+callbacks.action("select_category", "g", int)
+callbacks.action("priority", "y", int)
+callbacks.action("duedate", "u", date)
+callbacks.action("custom_date", "U")
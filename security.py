@@ -1,7 +1,54 @@
 import hashlib
 import secrets
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
+class TokenBucketLimiter:
+    """Rate limiter token bucket theo khóa (user, hành động)
+    
+    Mỗi lần kiểm tra là O(1). Bucket được giữ theo thứ tự LRU: bucket ít dùng
+    nhất bị loại khi vượt max_buckets, hoặc khi đã rảnh đủ lâu để đầy token
+    trở lại (lúc đó nó không khác gì một bucket mới).
+    """
+    def __init__(self, max_buckets=100000):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # key -> [tokens, lần cập nhật cuối, period]
+    
+    def allow(self, key, limit, period, cost=1):
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(limit), now, period]
+        else:
+            # Nạp lại token theo thời gian đã trôi qua
+            bucket[0] = min(limit, bucket[0] + (now - bucket[1]) * limit / period)
+            bucket[1] = now
+            bucket[2] = period
+            self._buckets.move_to_end(key)
+        
+        allowed = bucket[0] >= cost
+        if allowed:
+            bucket[0] -= cost
+        
+        self._evict(now)
+        return allowed
+    
+    def _evict(self, now):
+        buckets = self._buckets
+        while buckets:
+            _, last, period = next(iter(buckets.values()))
+            if len(buckets) > self.max_buckets or now - last >= period:
+                buckets.popitem(last=False)
+            else:
+                break
+    
+    def __len__(self):
+        return len(self._buckets)
+
+# Rate limiter dùng chung cho toàn bot
+rate_limiter = TokenBucketLimiter()
+
 class Security:
     @staticmethod
     def generate_session_token():
@@ -34,6 +81,5 @@ class Security:
     
     @staticmethod
     def rate_limit_check(user_id, action, limit=5, period=60):
-        """Kiểm tra rate limiting"""
-        # Triển khai logic rate limiting
-        pass
\ No newline at end of file
+        """Kiểm tra rate limiting: True nếu được phép, tối đa limit lần mỗi period giây"""
+        return rate_limiter.allow((user_id, action), limit, period)
\ No newline at end of file
@@ -0,0 +1,291 @@
+"""Chạy bot trên nhiều tiến trình worker, chia update theo user
+
+Tiến trình front (BOT_MODE=sharded) nhận webhook của Telegram và chuyển
+từng update tới worker abs(user_id) % SHARD_WORKERS qua HTTP nội bộ (update
+không có user thì theo chat). Mọi update của một user luôn tới cùng một worker
+và đi qua cùng một làn gửi tuần tự, nên thứ tự của user được giữ nguyên;
+ChatSerializedUpdateProcessor của worker lo phần còn lại.
+
+Chia theo user chứ không theo chat vì các cache trong bộ nhớ của worker (user
+cache, render cache theo phiên bản dữ liệu của user) không được báo khi worker
+khác sửa dữ liệu: một user bấm nút trong nhóm và trong chat riêng vẫn tới cùng
+một worker, và lời nhắc cũng chia theo telegram_id của user (database.py).
+Tin nhắn trong nhóm thì nhiều user (nhiều worker) có thể cùng sửa, nên khi có
+nhiều worker MessageEditor không ghi nhớ nội dung của chúng (xem bot.py); thứ
+tự giữa các user khác nhau trong cùng một nhóm không được đảm bảo.
+
+Front giám sát các worker: worker thoát sẽ được khởi động lại, trong lúc đó
+update của nó nằm chờ trong làn (tối đa SHARD_QUEUE_SIZE mỗi làn) và được gửi
+lại đúng thứ tự khi worker sẵn sàng; làn đầy thì trả 503 để Telegram tự gửi
+lại sau. Worker nhận SIGTERM thì dừng êm: ngừng nhận update, xử lý hết hàng
+đợi và ghi persistence trước khi thoát, nên worker mới đọc lại được trạng
+thái hội thoại và user_data từ database.
+
+Các worker dùng chung một database (nên là PostgreSQL). Front chia đều
+SHARD_DB_CONNECTIONS kết nối và giới hạn gửi tin toàn bot cho các worker.
+
+Chạy thử cục bộ (SQLite hoặc PostgreSQL tạm):
+    BOT_MODE=sharded SHARD_WORKERS=3 python bot.py
+    python replay_updates.py updates.jsonl --concurrency 20
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import secrets
+import signal
+import sys
+from telegram import Bot, Update
+import config
+from database import db
+from webhook import WebhookServer, parse_update
+
+logger = logging.getLogger(__name__)
+
+WORKER_HOST = "127.0.0.1"
+WORKER_PATH = "/update"
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+# Thời gian chờ (giây): mỗi lần gửi tới worker, giữa các lần thử lại, trước khi
+# khởi động lại worker, và khi chờ worker dừng
+DELIVERY_TIMEOUT = 10
+RETRY_DELAYS = (0.2, 0.5, 1, 2, 5)
+RESTART_DELAY = 1
+STOP_TIMEOUT = 30
+
+def shard_for(key, count):
+    """Worker xử lý khóa key (user); cùng công thức với bộ lọc lời nhắc trong database.py"""
+    return abs(key) % count
+
+def route_key(update):
+    """Khóa chia worker của update: user gửi, nếu không có thì chat, cuối cùng là update_id"""
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    # Update không thuộc user/chat nào thì không cần giữ thứ tự
+    return update.update_id
+
+async def post(host, port, path, headers, body, timeout=DELIVERY_TIMEOUT):
+    """Gửi một request POST HTTP/1.1, trả về mã trạng thái"""
+    async def request():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            head = (
+                f"POST {path} HTTP/1.1\r\n"
+                f"Host: {host}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n"
+            )
+            head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+            writer.write((head + "\r\n").encode("latin-1") + body)
+            await writer.drain()
+            status_line = await reader.readline()
+            return int(status_line.split()[1])
+        finally:
+            writer.close()
+    
+    return await asyncio.wait_for(request(), timeout)
+
+def worker_env(index, count, port, secret):
+    """Biến môi trường của worker: cổng nội bộ, shard và phần tài nguyên được chia"""
+    connections = max(2, config.Config.SHARD_DB_CONNECTIONS // count)
+    env = dict(os.environ)
+    env.update({
+        "BOT_MODE": "worker",
+        "SHARD_INDEX": str(index),
+        "SHARD_COUNT": str(count),
+        "WEBHOOK_HOST": WORKER_HOST,
+        "WEBHOOK_PATH": WORKER_PATH,
+        "WEBHOOK_SECRET": secret,
+        "PORT": str(port),
+        # Mỗi thread database giữ một kết nối, chừa một kết nối cho luồng chính và job nền
+        "DB_POOL_SIZE": str(connections),
+        "DB_POOL_OVERFLOW": "0",
+        "DB_WORKERS": str(min(config.Config.DB_WORKERS, connections - 1)),
+        # Giới hạn của Telegram tính cho cả bot, không phải cho từng tiến trình
+        "OUTBOUND_GLOBAL_RATE": str(max(1, config.Config.OUTBOUND_GLOBAL_RATE // count))
+    })
+    return env
+
+class Worker:
+    """Một tiến trình worker và các làn gửi update tới nó"""
+    def __init__(self, index, count, secret, lanes=8, queue_size=1000):
+        self.index = index
+        self.count = count
+        self.port = config.Config.SHARD_BASE_PORT + index
+        self.secret = secret
+        self.lanes = [asyncio.Queue(queue_size) for _ in range(lanes)]
+        self.process = None
+        self.tasks = []
+        
+        self.restarts = 0
+        self.delivered = 0
+        self.retries = 0
+        self.dropped = 0
+    
+    def start(self):
+        self.tasks = [asyncio.ensure_future(self.supervise())]
+        self.tasks += [asyncio.ensure_future(self.deliver(lane)) for lane in self.lanes]
+    
+    def submit(self, key, body):
+        """Đưa update vào làn của khóa key; False nếu làn đã đầy"""
+        lane = self.lanes[(abs(key) // self.count) % len(self.lanes)]
+        try:
+            lane.put_nowait(body)
+        except asyncio.QueueFull:
+            return False
+        return True
+    
+    async def supervise(self):
+        """Chạy tiến trình worker, khởi động lại khi nó thoát"""
+        env = worker_env(self.index, self.count, self.port, self.secret)
+        while True:
+            # Phiên riêng: Ctrl+C ở terminal chỉ tới front, front tự dừng worker theo thứ tự
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, BOT_SCRIPT, env=env, start_new_session=True
+            )
+            logger.info("Worker %s chạy (pid %s, cổng %s)", self.index, self.process.pid, self.port)
+            code = await self.process.wait()
+            
+            self.restarts += 1
+            logger.warning("Worker %s thoát (mã %s), khởi động lại sau %ss", self.index, code, RESTART_DELAY)
+            await asyncio.sleep(RESTART_DELAY)
+    
+    async def deliver(self, lane):
+        """Gửi lần lượt các update của một làn, giữ đúng thứ tự"""
+        while True:
+            body = await lane.get()
+            try:
+                await self.send(body)
+            finally:
+                lane.task_done()
+    
+    async def send(self, body):
+        """Gửi tới khi worker nhận; update bị worker từ chối (4xx) thì bỏ qua"""
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.secret}
+        for attempt in itertools.count():
+            try:
+                status = await post(WORKER_HOST, self.port, WORKER_PATH, headers, body)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                # Worker đang khởi động lại hoặc đang dừng: giữ update và thử lại
+                status = None
+            
+            if status == 200:
+                self.delivered += 1
+                return
+            if status is not None and 400 <= status < 500:
+                self.dropped += 1
+                logger.warning("Worker %s từ chối update (HTTP %s)", self.index, status)
+                return
+            
+            self.retries += 1
+            await asyncio.sleep(RETRY_DELAYS[min(attempt, len(RETRY_DELAYS) - 1)])
+    
+    async def drain(self):
+        """Chờ gửi hết các update đang chờ"""
+        await asyncio.gather(*(lane.join() for lane in self.lanes))
+    
+    async def stop(self):
+        """Dừng giám sát rồi dừng êm tiến trình worker (SIGTERM, quá hạn thì SIGKILL)"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Worker %s không dừng kịp, buộc dừng", self.index)
+            self.process.kill()
+            await self.process.wait()
+    
+    def stats(self):
+        return {
+            "index": self.index,
+            "pid": self.process.pid if self.process else None,
+            "running": self.process is not None and self.process.returncode is None,
+            "queued": sum(lane.qsize() for lane in self.lanes),
+            "delivered": self.delivered,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "restarts": self.restarts
+        }
+
+class FrontServer(WebhookServer):
+    """Webhook của front: chuyển update tới worker theo user thay vì tự xử lý"""
+    def __init__(self, workers, host, port, path, secret_token=None):
+        super().__init__(None, host, port, path, secret_token)
+        self.workers = workers
+        self.rejected = 0
+    
+    async def receive_update(self, headers, body):
+        if not self.check_secret(headers):
+            return 403, "text/plain", b""
+        
+        update = parse_update(body, None)
+        if update is None:
+            return 400, "text/plain", b""
+        
+        key = route_key(update)
+        if not self.workers[shard_for(key, len(self.workers))].submit(key, body):
+            self.rejected += 1
+            return 503, "text/plain", b""
+        return 200, "text/plain", b""
+    
+    async def health(self, headers, body):
+        workers = [worker.stats() for worker in self.workers]
+        status = "ok" if all(worker["running"] for worker in workers) else "degraded"
+        payload = {"status": status, "rejected": self.rejected, "workers": workers}
+        return 200, "application/json", json.dumps(payload).encode()
+
+async def run_front():
+    """Chạy front cùng SHARD_WORKERS worker cho tới khi nhận SIGINT/SIGTERM"""
+    # Migration đã chạy khi nạp database; front không truy vấn nên trả kết nối ngay
+    db.close()
+    
+    count = config.Config.SHARD_WORKERS
+    secret = secrets.token_urlsafe(32)
+    workers = [
+        Worker(index, count, secret, config.Config.SHARD_LANES, config.Config.SHARD_QUEUE_SIZE)
+        for index in range(count)
+    ]
+    server = FrontServer(
+        workers,
+        config.Config.WEBHOOK_HOST,
+        config.Config.PORT,
+        config.Config.WEBHOOK_PATH,
+        config.Config.WEBHOOK_SECRET
+    )
+    
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    for worker in workers:
+        worker.start()
+    await server.start()
+    
+    if config.Config.WEBHOOK_URL:
+        async with Bot(config.Config.BOT_TOKEN, base_url=config.Config.BOT_API_URL) as bot:
+            await bot.set_webhook(
+                url=config.Config.WEBHOOK_URL.rstrip("/") + config.Config.WEBHOOK_PATH,
+                secret_token=config.Config.WEBHOOK_SECRET or None,
+                allowed_updates=Update.ALL_TYPES
+            )
+    
+    try:
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        # Chuyển nốt các update đã nhận rồi mới dừng worker
+        try:
+            await asyncio.wait_for(asyncio.gather(*(worker.drain() for worker in workers)), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Còn update chưa chuyển được tới worker khi dừng")
+        await asyncio.gather(*(worker.stop() for worker in workers))
@@ -0,0 +1,14 @@
+import os
+import tempfile
+import pytest
+
+# Các module của bot đọc cấu hình lúc nạp: trỏ database sang file tạm trước khi import
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='todo_bot_test_'), 'test.db')}"
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:test")
+os.environ["SQL_DEBUG"] = "0"
+
+from database import db as database
+
+@pytest.fixture(scope="session")
+def db():
+    return database
@@ -0,0 +1,68 @@
+"""MessageEditor chỉ gọi Bot API khi tin nhắn thật sự thay đổi"""
+import asyncio
+from telegram import Chat, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from telegram.error import BadRequest
+from outbound import MessageEditor
+
+def keyboard(label):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(label, callback_data=label)]])
+
+class FakeQuery:
+    """CallbackQuery tối thiểu: ghi lại các lần gọi sửa tin nhắn"""
+    def __init__(self, message_id=1, fail=None):
+        self.message = Message(message_id, None, Chat(42, Chat.PRIVATE))
+        self.fail = fail
+        self.calls = []
+    
+    async def edit_message_text(self, text, parse_mode=None, reply_markup=None):
+        self.calls.append(("text", text))
+        if self.fail:
+            raise self.fail
+    
+    async def edit_message_reply_markup(self, reply_markup=None):
+        self.calls.append(("markup", reply_markup.inline_keyboard[0][0].text))
+        if self.fail:
+            raise self.fail
+
+def run_edits(editor, query, edits):
+    async def main():
+        for text, label in edits:
+            await editor.edit(query, text, reply_markup=keyboard(label))
+            # Lần sửa được gửi nền: chờ gửi xong như giữa hai lần bấm nút thật
+            await editor.drain()
+    
+    asyncio.run(main())
+    return query.calls
+
+def test_identical_edit_is_skipped():
+    editor = MessageEditor()
+    assert run_edits(editor, FakeQuery(), [("a", "x"), ("a", "x"), ("a", "x")]) == [("text", "a")]
+    assert editor.skipped_edits == 2
+
+def test_keyboard_only_change_edits_markup():
+    editor = MessageEditor()
+    calls = run_edits(editor, FakeQuery(), [("a", "x"), ("a", "y"), ("b", "y")])
+    assert calls == [("text", "a"), ("markup", "y"), ("text", "b")]
+    assert editor.markup_only_edits == 1
+
+def test_messages_are_tracked_separately():
+    editor = MessageEditor()
+    run_edits(editor, FakeQuery(1), [("a", "x")])
+    assert run_edits(editor, FakeQuery(2), [("a", "x")]) == [("text", "a")]
+
+def test_failed_edit_is_forgotten():
+    editor = MessageEditor()
+    query = FakeQuery(fail=BadRequest("Message to edit not found"))
+    run_edits(editor, query, [("a", "x")])
+    assert editor.failed_edits == 1
+    # Nội dung thật không còn biết chắc: lần sau gửi lại đầy đủ
+    query.fail = None
+    assert run_edits(editor, query, [("a", "x")])[-1] == ("text", "a")
+
+def test_not_modified_keeps_fingerprint():
+    editor = MessageEditor()
+    query = FakeQuery(fail=BadRequest("Message is not modified"))
+    run_edits(editor, query, [("a", "x")])
+    query.fail = None
+    assert run_edits(editor, query, [("a", "x")]) == [("text", "a")]
+    assert editor.not_modified_errors == 1
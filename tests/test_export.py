@@ -0,0 +1,70 @@
+"""Xuất dữ liệu đọc task theo lô và ghi thẳng ra file tạm: bộ nhớ không tăng theo số task"""
+import csv
+import io
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+import pytest
+import config
+from export import DataExporter
+
+TASK_COUNT = 100_000
+# File tạm chuyển sang đĩa sau 1 MB; phần còn lại là một lô dòng và bộ đệm ghi
+SPOOL_SIZE = 1024 * 1024
+MEMORY_CEILING = 4 * 1024 * 1024
+
+@pytest.fixture(scope="module")
+def user_id(db):
+    now = datetime.now()
+    with db.session_scope() as session:
+        owner = db.get_or_create_user(session, 800_000, None, "Export", None).id
+        category_id = db.get_categories(session, owner)[0].id
+        for start in range(0, TASK_COUNT, 10_000):
+            db.insert_tasks(session, [
+                {
+                    "user_id": owner,
+                    "title": f"Công việc số {i}",
+                    "description": f"Mô tả chi tiết cho công việc số {i}",
+                    "priority": i % 3 + 1,
+                    "completed": i % 2 == 0,
+                    "due_date": now + timedelta(hours=i % 500),
+                    "category_id": category_id if i % 3 else None
+                }
+                for i in range(start, start + 10_000)
+            ])
+    return owner
+
+def export_peak(db, user_id, fmt, encrypt=False):
+    """Xuất file, trả về (nội dung, đỉnh bộ nhớ cấp phát trong lúc xuất)"""
+    tracemalloc.start()
+    try:
+        with db.session_scope() as session:
+            file, filename = DataExporter.export(session, user_id, fmt, encrypt)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    with file:
+        return file.read(), peak
+
+@pytest.fixture(autouse=True)
+def small_spool(monkeypatch):
+    monkeypatch.setattr(config.Config, "EXPORT_SPOOL_SIZE", SPOOL_SIZE)
+
+@pytest.mark.parametrize("fmt", ["csv", "json"])
+def test_export_memory_is_bounded(db, user_id, fmt):
+    data, peak = export_peak(db, user_id, fmt)
+    
+    # File kết quả lớn hơn nhiều lần mức trần bộ nhớ
+    assert len(data) > 2 * MEMORY_CEILING
+    assert peak < MEMORY_CEILING
+    
+    if fmt == "csv":
+        rows = list(csv.reader(io.StringIO(data.decode("utf-8"))))
+        assert len(rows) == TASK_COUNT + 1
+    else:
+        assert len(json.loads(data)["tasks"]) == TASK_COUNT
+
+def test_encrypted_export_memory_is_bounded(db, user_id):
+    data, peak = export_peak(db, user_id, "csv", encrypt=True)
+    assert peak < MEMORY_CEILING
@@ -0,0 +1,89 @@
+"""Nhập dữ liệu: kiểm tra từng dòng, bỏ qua dòng lỗi và tổng hợp lý do"""
+import io
+import json
+import pytest
+from database import Task
+from importer import MAX_REPORTED_ERRORS, ImportRowError, _parse_row, importer
+from utils import encryption
+
+@pytest.fixture
+def user_id(db):
+    with db.session_scope() as session:
+        return db.get_or_create_user(session, 960_001, None, "Import", None).id
+
+def run_import(db, user_id, content, fmt, encrypted=False):
+    with db.session_scope() as session:
+        return importer.import_tasks(session, user_id, io.BytesIO(content.encode()), fmt, encrypted)
+
+def titles(db, user_id):
+    with db.session_scope() as session:
+        return sorted(title for title, in session.query(Task.title).filter_by(user_id=user_id))
+
+@pytest.mark.parametrize("item, reason", [
+    ("chuỗi", "dòng không đúng định dạng"),
+    ({"title": "  "}, "thiếu tiêu đề"),
+    ({"title": 5}, "thiếu tiêu đề"),
+    ({"title": "x" * 201}, "tiêu đề quá dài"),
+    ({"title": "a", "priority": "cao"}, "độ ưu tiên không hợp lệ"),
+    ({"title": "a", "priority": 4}, "độ ưu tiên không hợp lệ"),
+    ({"title": "a", "due_date": "mai"}, "hạn chót không hợp lệ"),
+    ({"title": "a", "due_date": 20250601}, "hạn chót không hợp lệ")
+])
+def test_invalid_rows_are_rejected(item, reason):
+    with pytest.raises(ImportRowError, match=reason):
+        _parse_row(item)
+
+def test_row_defaults_and_formats():
+    fields, category = _parse_row({
+        "title": " Mua sữa ", "completed": "Có", "due_date": "01/06/2025 09:30", "category": " Nhà "
+    })
+    assert fields["title"] == "Mua sữa"
+    assert fields["priority"] == 2
+    assert fields["completed"] is True
+    assert fields["due_date"].isoformat() == "2025-06-01T09:30:00"
+    assert category == "Nhà"
+
+def test_csv_import_keeps_valid_rows_and_summarises_rejections(db, user_id):
+    content = (
+        "title,priority,due_date,category\n"
+        "Việc 1,1,2025-06-01,Công việc\n"
+        ",2,,\n"
+        "Việc 2,9,,\n"
+        "Việc 3,,không phải ngày,\n"
+        "Việc 4,3,,Mới\n"
+    )
+    result = run_import(db, user_id, content, "csv")
+    assert result["imported"] == 2
+    assert result["rejected"] == 3
+    assert result["reasons"] == {"thiếu tiêu đề": 1, "độ ưu tiên không hợp lệ": 1, "hạn chót không hợp lệ": 1}
+    assert result["errors"] == [
+        (2, "thiếu tiêu đề"), (3, "độ ưu tiên không hợp lệ"), (4, "hạn chót không hợp lệ")
+    ]
+    assert {"Việc 1", "Việc 4"} <= set(titles(db, user_id))
+    
+    report = importer.format_report(result)
+    assert "Đã nhập *2* công việc" in report
+    assert "Bỏ qua 3 dòng lỗi" in report
+    assert "ví dụ dòng 2, 3, 4" in report
+
+def test_reported_examples_are_capped(db, user_id):
+    content = json.dumps([{"title": ""}] * (MAX_REPORTED_ERRORS + 3) + [{"title": "Còn lại"}])
+    result = run_import(db, user_id, content, "json")
+    assert result["imported"] == 1
+    assert result["rejected"] == MAX_REPORTED_ERRORS + 3
+    assert len(result["errors"]) == MAX_REPORTED_ERRORS
+
+def test_broken_file_keeps_rows_read_so_far(db, user_id):
+    result = run_import(db, user_id, '[{"title": "Trước lỗi"}, {"title": ', "json")
+    assert result["imported"] == 1
+    assert result["reasons"] == {"file bị lỗi, dừng đọc": 1}
+
+def test_encrypted_file_with_wrong_key_is_reported(db, user_id):
+    result = run_import(db, user_id, "không phải dữ liệu mã hóa" * 10, "json", encrypted=True)
+    assert result["imported"] == 0
+    assert result["rejected"] == 1
+    assert "không giải mã được" in next(iter(result["reasons"]))
+
+def test_encrypted_export_round_trips(db, user_id):
+    content = encryption.encrypt(json.dumps([{"title": "Bí mật"}]))
+    assert run_import(db, user_id, content, "json", encrypted=True)["imported"] == 1
@@ -0,0 +1,81 @@
+"""OutboundRateLimiter trước lỗi 429 của Bot API (giả lập) và khi gộp lần sửa tin nhắn"""
+import asyncio
+import pytest
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+import config
+from outbound import OutboundRateLimiter
+from benchmarks.stub_api import StubBotAPI
+
+TOKEN = "123456:test"
+
+def run_with_bot(scenario, limiter, retry_after=1):
+    """Chạy scenario(bot, stub) với ExtBot gửi qua limiter tới Bot API giả lập"""
+    async def main():
+        stub = StubBotAPI(retry_after=retry_after)
+        await stub.start()
+        try:
+            async with ExtBot(TOKEN, base_url=stub.base_url, rate_limiter=limiter) as bot:
+                return await scenario(bot, stub)
+        finally:
+            await stub.stop()
+    
+    return asyncio.run(main())
+
+async def wait_for(condition, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Hết thời gian chờ")
+
+def test_retry_after_pauses_every_chat():
+    limiter = OutboundRateLimiter(global_rate=1000, chat_interval=0, chat_burst=1)
+    
+    async def scenario(bot, stub):
+        stub.flood(1)
+        first = asyncio.ensure_future(bot.send_message(1, "a"))
+        await wait_for(lambda: stub.flooded["sendMessage"])
+        # Chat khác không bị giới hạn vẫn phải chờ hết thời gian tạm dừng chung
+        await bot.send_message(2, "b")
+        await first
+        return stub.history
+    
+    history = run_with_bot(scenario, limiter)
+    flooded_at = next(at for at, _, status in history if status == 429)
+    sent = [at for at, method, status in history if method == "sendMessage" and status == 200]
+    assert len(sent) == 2
+    assert min(sent) >= flooded_at + 1 - 0.05
+    assert limiter.retries == 1
+
+def test_retries_are_capped():
+    max_retries = config.Config.OUTBOUND_MAX_RETRIES
+    limiter = OutboundRateLimiter(global_rate=1000, chat_interval=0, chat_burst=1, max_retries=max_retries)
+    
+    async def scenario(bot, stub):
+        stub.flood(100)
+        with pytest.raises(RetryAfter):
+            await bot.send_message(1, "a")
+        return stub.flooded["sendMessage"]
+    
+    # Bot API không bao giờ trả retry_after 0 (PTB coi là lỗi mạng): mỗi lần thử chờ 1 giây
+    assert run_with_bot(scenario, limiter) == max_retries + 1
+    assert limiter.retries == max_retries
+
+def test_superseded_edit_is_not_sent():
+    limiter = OutboundRateLimiter(global_rate=1000, chat_interval=0.3, chat_burst=1)
+    
+    async def scenario(bot, stub):
+        # Tin đầu dùng hết lượt của chat: hai lần sửa sau phải xếp hàng
+        await bot.send_message(1, "a")
+        first = asyncio.ensure_future(bot.edit_message_text("b", chat_id=1, message_id=7))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(bot.edit_message_text("c", chat_id=1, message_id=7))
+        results = await asyncio.gather(first, second)
+        return results, stub.calls["editMessageText"]
+    
+    (first, second), edits = run_with_bot(scenario, limiter)
+    assert first is True
+    assert second.text == ""
+    assert edits == 1
+    assert limiter.coalesced_edits == 1
@@ -0,0 +1,66 @@
+"""Persistence giữ bộ nhớ giới hạn và không nạp lại hội thoại bỏ dở từ lâu"""
+import asyncio
+import json
+import pickle
+from datetime import datetime, timedelta
+from database import ConversationState
+from persistence import DatabasePersistence
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_loaded_and_snapshots_are_bounded(db):
+    async def scenario():
+        persistence = DatabasePersistence(cache_size=3)
+        for user_id in range(10):
+            await persistence.refresh_user_data(800_000 + user_id, {})
+        return persistence
+    
+    persistence = run(scenario())
+    assert len(persistence.loaded) == 3
+    assert len(persistence.snapshots) == 3
+
+def test_evicted_user_is_reloaded_without_overwriting(db):
+    async def scenario():
+        persistence = DatabasePersistence(cache_size=2)
+        await persistence.update_user_data(810_001, {"lang": "vi"})
+        await persistence.flush()
+        # Đẩy user ra khỏi LRU rồi quay lại với dữ liệu mới trong bộ nhớ
+        for user_id in range(5):
+            await persistence.refresh_user_data(810_100 + user_id, {})
+        user_data = {"lang": "en"}
+        await persistence.refresh_user_data(810_001, user_data)
+        return user_data
+    
+    assert run(scenario()) == {"lang": "en"}
+
+def test_drop_after_eviction_still_deletes(db):
+    async def scenario():
+        persistence = DatabasePersistence(cache_size=1)
+        await persistence.update_user_data(820_001, {"draft": 1})
+        await persistence.flush()
+        await persistence.refresh_user_data(820_002, {})
+        # Bản đã lưu của 820_001 đã bị đẩy ra: dữ liệu rỗng vẫn phải xóa dòng trong database
+        await persistence.update_user_data(820_001, {})
+        await persistence.flush()
+    
+    run(scenario())
+    with db.session_scope() as session:
+        assert db.load_persistent_data(session, "user", 820_001) is None
+
+def test_stale_conversations_are_pruned_on_load(db):
+    now = datetime.now()
+    with db.session_scope() as session:
+        session.query(ConversationState).filter_by(name="prune_test").delete()
+        session.add_all([
+            ConversationState(name="prune_test", key=json.dumps([1, 1]), state=pickle.dumps(0), updated_at=now),
+            ConversationState(
+                name="prune_test", key=json.dumps([2, 2]), state=pickle.dumps(0),
+                updated_at=now - timedelta(days=2)
+            )
+        ])
+    
+    conversations = run(DatabasePersistence().get_conversations("prune_test"))
+    assert conversations == {(1, 1): 0}
+    with db.session_scope() as session:
+        assert session.query(ConversationState).filter_by(name="prune_test").count() == 1
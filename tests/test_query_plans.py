@@ -0,0 +1,78 @@
+"""Các truy vấn nóng phải đi qua index của migration 1 (kiểm tra bằng EXPLAIN QUERY PLAN)"""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+
+def query_plans(db, func, *args):
+    """Chạy func(session, *args), trả về kế hoạch thực thi của từng câu SELECT nó phát ra"""
+    statements = []
+    
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+    
+    event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        with db.session_scope() as session:
+            func(session, *args)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capture)
+    
+    plans = []
+    with db.engine.connect() as conn:
+        for statement, parameters in statements:
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+            # (id, parent, notused, detail)
+            plans.append(" | ".join(row[-1] for row in rows))
+    return plans
+
+@pytest.fixture(scope="module")
+def user_id(db):
+    """Vài user với task đủ loại để planner có dữ liệu thật để chọn"""
+    now = datetime.now()
+    with db.session_scope() as session:
+        ids = [db.get_or_create_user(session, 900_000 + i, None, "Plan", None).id for i in range(5)]
+        db.insert_tasks(session, [
+            {
+                "user_id": owner,
+                "title": f"Task {i}",
+                "completed": i % 4 == 0,
+                "priority": i % 3 + 1,
+                "due_date": now + timedelta(hours=i - 200) if i % 5 else None,
+                "remind_at": now + timedelta(minutes=i) if i % 7 == 0 else None
+            }
+            for owner in ids for i in range(400)
+        ])
+    return ids[0]
+
+def test_task_list_first_page_uses_order_index(db, user_id):
+    plan, = query_plans(db, db.get_tasks_page, user_id, 5)
+    assert "ix_tasks_user_order" in plan
+    # Index trả về đúng thứ tự sắp xếp, không cần sắp xếp lại
+    assert "TEMP B-TREE" not in plan
+
+@pytest.mark.parametrize("backward", [False, True])
+def test_task_list_keyset_page_uses_order_index(db, user_id, backward):
+    with db.session_scope() as session:
+        first, *_, last = db.get_tasks_page(session, user_id, 5)
+    anchor = first if backward else last
+    cursor = (anchor.completed, anchor.priority, anchor.due_date, anchor.id)
+    
+    plan, = query_plans(db, db.get_tasks_page, user_id, 5, cursor, backward)
+    assert "ix_tasks_user_order" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_due_today_uses_open_due_index(db, user_id):
+    plan, = query_plans(db, db.get_today_tasks, user_id, datetime.now().replace(hour=0, minute=0))
+    # Khoảng hạn chót được quét ngay trong index, không lọc lại từng dòng của user
+    assert "ix_tasks_user_open_due (user_id=? AND completed=? AND due_date>? AND due_date<?)" in plan
+
+def test_category_counts_use_category_index(db, user_id):
+    plan, = query_plans(db, db.get_category_counts, user_id)
+    assert "COVERING INDEX ix_tasks_category" in plan
+
+def test_reminder_scan_uses_remind_at_index(db, user_id):
+    now = datetime.now()
+    plan, = query_plans(db, db.get_upcoming_reminders, None, now + timedelta(hours=1), 100)
+    assert "ix_tasks_remind_at" in plan
+    assert "TEMP B-TREE" not in plan
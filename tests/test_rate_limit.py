@@ -0,0 +1,72 @@
+"""Giới hạn tần suất callback theo từng route, xuất/nhập dữ liệu có bucket riêng"""
+import asyncio
+from types import SimpleNamespace
+import pytest
+from telegram.ext import ApplicationHandlerStop
+import config
+from bot import TodoBot
+from config import parse_rate_limits
+from router import callbacks
+
+class FakeReply:
+    """callback_query/message tối thiểu: ghi lại câu trả lời của bot"""
+    def __init__(self, data=None, document=None):
+        self.data = data
+        self.document = document
+        self.replies = []
+    
+    async def answer(self, text=None, **kwargs):
+        self.replies.append(text)
+    
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+def guard(bot, user_id, callback=None, message=None):
+    """True nếu update được cho qua"""
+    update = SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id), callback_query=callback, message=message
+    )
+    try:
+        asyncio.run(bot.rate_limit_guard(update, None))
+    except ApplicationHandlerStop:
+        return False
+    return True
+
+@pytest.fixture(scope="module")
+def bot():
+    return TodoBot()
+
+def test_routes_have_separate_buckets(bot):
+    user_id = 700_001
+    page = callbacks.encode("page", 2, False, False, 1, None, 100)
+    allowed = sum(guard(bot, user_id, FakeReply(page)) for _ in range(config.Config.RATE_LIMIT_CALLBACKS + 5))
+    assert allowed == config.Config.RATE_LIMIT_CALLBACKS
+    # Hết lượt chuyển trang vẫn mở được chi tiết công việc
+    assert guard(bot, user_id, FakeReply(callbacks.encode("task_detail", 1)))
+
+def test_export_has_a_stricter_bucket(bot):
+    user_id = 700_002
+    export = callbacks.encode("export", "csv", False)
+    replies = [FakeReply(export) for _ in range(config.Config.RATE_LIMIT_EXPORTS + 1)]
+    assert [guard(bot, user_id, reply) for reply in replies] == [True] * config.Config.RATE_LIMIT_EXPORTS + [False]
+    assert replies[-1].replies
+    assert guard(bot, user_id, FakeReply(callbacks.encode("main_menu")))
+
+def test_invalid_callbacks_share_one_bucket(bot):
+    user_id = 700_003
+    allowed = sum(guard(bot, user_id, FakeReply(f"junk{i}")) for i in range(config.Config.RATE_LIMIT_CALLBACKS + 5))
+    assert allowed == config.Config.RATE_LIMIT_CALLBACKS
+
+def test_imports_have_their_own_bucket(bot):
+    user_id = 700_004
+    results = [
+        guard(bot, user_id, message=FakeReply(document=object()))
+        for _ in range(config.Config.RATE_LIMIT_IMPORTS + 1)
+    ]
+    assert results == [True] * config.Config.RATE_LIMIT_IMPORTS + [False]
+    # Tin nhắn thường không tính vào lượt nhập
+    assert guard(bot, user_id, message=FakeReply())
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("page:40/10, search:5/30,") == {"page": (40, 10), "search": (5, 30)}
+    assert parse_rate_limits("") == {}
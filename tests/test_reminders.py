@@ -0,0 +1,63 @@
+"""Mỗi lời nhắc chỉ được gửi một lần, và không gửi khi giờ nhắc đã đổi"""
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from database import Task
+from reminders import ReminderScheduler
+
+TELEGRAM_ID = 950_001
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+    
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id == TELEGRAM_ID:
+            self.sent.append(text)
+
+def tick(scheduler, bot):
+    asyncio.run(scheduler.tick(SimpleNamespace(bot=bot)))
+
+@pytest.fixture
+def task_id(db):
+    """Một task của user riêng, giờ nhắc đã đến"""
+    with db.session_scope() as session:
+        user = db.get_or_create_user(session, TELEGRAM_ID, None, "Remind", None)
+        task = Task(user_id=user.id, title="Gọi điện", remind_at=datetime.now() - timedelta(minutes=1))
+        session.add(task)
+        session.flush()
+        return task.id
+
+def test_reminder_is_claimed_once(db, task_id):
+    now = datetime.now()
+    with db.session_scope() as session:
+        first = db.claim_due_reminders(session, [task_id], now)
+    with db.session_scope() as session:
+        second = db.claim_due_reminders(session, [task_id], now)
+    assert [reminder.task_id for reminder in first] == [task_id]
+    assert second == []
+
+def test_duplicate_heap_entries_send_once(db, task_id):
+    scheduler = ReminderScheduler()
+    bot = FakeBot()
+    tick(scheduler, bot)
+    # Bản ghi trùng trong heap (ví dụ schedule lại cùng giờ) không gây gửi thêm
+    scheduler.schedule(task_id, datetime.now() - timedelta(minutes=1))
+    tick(scheduler, bot)
+    assert bot.sent == ["🔔 *Nhắc nhở:* Gọi điện"]
+
+def test_rescheduled_reminder_is_skipped(db, task_id):
+    scheduler = ReminderScheduler()
+    bot = FakeBot()
+    old_time = datetime.now() - timedelta(minutes=1)
+    scheduler.horizon = datetime.now() + scheduler.window
+    scheduler.cursor = (scheduler.horizon, None)
+    scheduler.schedule(task_id, old_time)
+    # User dời giờ nhắc sau khi lời nhắc cũ đã vào heap
+    with db.session_scope() as session:
+        db.update_task(session, task_id, remind_at=datetime.now() + timedelta(days=1))
+    tick(scheduler, bot)
+    assert bot.sent == []
+    with db.session_scope() as session:
+        assert session.query(Task.remind_at).filter_by(id=task_id).scalar() is not None
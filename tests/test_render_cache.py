@@ -0,0 +1,37 @@
+"""Render cache mất hiệu lực theo phiên bản dữ liệu của user"""
+from cache import RenderCache
+
+def test_bump_invalidates_only_that_user():
+    cache = RenderCache()
+    for user_id in (1, 2):
+        _, token = cache.lookup(user_id, "list")
+        cache.store(token, f"screen {user_id}")
+    
+    cache.bump(1)
+    assert cache.lookup(1, "list")[0] is None
+    assert cache.lookup(2, "list")[0] == "screen 2"
+
+def test_render_started_before_bump_is_not_served_after_it():
+    cache = RenderCache()
+    _, token = cache.lookup(1, "list")
+    # Dữ liệu đổi trong lúc đang render từ bản đọc cũ
+    cache.bump(1)
+    cache.store(token, "stale")
+    assert cache.lookup(1, "list")[0] is None
+
+def test_screens_are_keyed_per_view():
+    cache = RenderCache()
+    _, token = cache.lookup(1, ("page", 0))
+    cache.store(token, "page 0")
+    assert cache.lookup(1, ("page", 1))[0] is None
+    assert cache.lookup(1, ("page", 0))[0] == "page 0"
+
+def test_evicted_version_never_reuses_an_old_number():
+    cache = RenderCache(max_users=1)
+    _, token = cache.lookup(1, "list")
+    cache.store(token, "v1")
+    cache.bump(1)
+    # User 2 đẩy phiên bản của user 1 ra khỏi LRU; user 1 quay lại nhận số mới
+    cache.lookup(2, "list")
+    assert cache.lookup(1, "list")[0] is None
+    assert cache.stats()["bumps"] == 1
@@ -0,0 +1,47 @@
+"""Router từ chối callback_data hỏng hoặc giả mạo thay vì đưa None vào handler"""
+from datetime import date, datetime
+import pytest
+from router import SEPARATOR, Choice, Nullable, callbacks
+
+SAMPLES = {int: 42, bool: True, str: "csv", date: date(2025, 6, 1), datetime: datetime(2025, 6, 1, 9, 30)}
+
+def sample(kind):
+    if isinstance(kind, Nullable):
+        return sample(kind.kind)
+    if isinstance(kind, Choice):
+        return min(kind.values)
+    return SAMPLES[kind]
+
+@pytest.mark.parametrize("name", sorted(callbacks.names))
+def test_route_round_trips(name):
+    route = callbacks.names[name]
+    args = tuple(sample(kind) for kind in route.types)
+    assert callbacks.decode(callbacks.encode(name, *args)) == (route, args)
+
+@pytest.mark.parametrize("data", [
+    "1D:2s:",       # set_duedate không có ngày
+    "1P:2s:",       # set_priority không có độ ưu tiên
+    "1s:",          # search không có số trang
+    "1p::::::",     # page rỗng toàn bộ
+    "1R:2s:abc",    # remind với lựa chọn không có trên bàn phím
+    "1R:2s:",
+    "1g:",          # select_category của hội thoại thêm task
+    "1d:2s:extra",  # thừa tham số
+    "0d:2s"         # phiên bản cũ
+])
+def test_crafted_data_is_rejected(data):
+    assert callbacks.decode(data) == (None, None)
+
+def test_page_cursor_due_date_may_be_empty():
+    data = callbacks.encode("page", 2, False, False, 1, None, 100)
+    route, args = callbacks.decode(data)
+    assert route.name == "page"
+    assert args == (2, False, False, 1, None, 100)
+
+def test_encode_refuses_none_for_required_argument():
+    with pytest.raises(ValueError):
+        callbacks.encode("task_detail", None)
+
+def test_separator_in_string_argument_is_refused():
+    with pytest.raises(ValueError):
+        callbacks.encode("export", f"csv{SEPARATOR}x", False)
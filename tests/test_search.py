@@ -0,0 +1,60 @@
+"""Tìm kiếm FTS5: chỉ trong task của user, không phân biệt dấu và hoa thường"""
+import pytest
+
+@pytest.fixture(scope="module")
+def users(db):
+    if not db.fts_enabled:
+        pytest.skip("SQLite không có FTS5")
+    with db.session_scope() as session:
+        owner, other = (
+            db.get_or_create_user(session, telegram_id, None, "Search", None).id
+            for telegram_id in (970_001, 970_002)
+        )
+        db.insert_tasks(session, [
+            {"user_id": owner, "title": "Đi chợ mua sắm", "description": "Rau, thịt"},
+            {"user_id": owner, "title": "Việc nhà", "description": "Dọn dẹp phòng khách"},
+            {"user_id": owner, "title": "Gọi điện", "description": None},
+            {"user_id": other, "title": "Đi chợ Bến Thành", "description": "mua sắm quà"}
+        ])
+    return owner, other
+
+def search(db, user_id, query):
+    with db.session_scope() as session:
+        return [row.title for row in db.search_tasks(session, user_id, query, 20)]
+
+@pytest.mark.parametrize("query", ["đi chợ", "di cho", "DI CHO", "Đi Chợ"])
+def test_diacritics_and_case_are_folded(db, users, query):
+    owner, _ = users
+    assert search(db, owner, query) == ["Đi chợ mua sắm"]
+
+def test_prefix_matches_each_word(db, users):
+    owner, _ = users
+    assert search(db, owner, "don phong") == ["Việc nhà"]
+    assert search(db, owner, "viec nh") == ["Việc nhà"]
+    assert search(db, owner, "viec mua") == []
+
+def test_results_stay_within_owner(db, users):
+    owner, other = users
+    assert search(db, owner, "cho") == ["Đi chợ mua sắm"]
+    assert search(db, other, "cho") == ["Đi chợ Bến Thành"]
+    assert search(db, other, "goi dien") == []
+
+def test_owner_token_is_not_searchable(db, users):
+    owner, other = users
+    # Cột owner lưu "u<user_id>": từ khóa không được khớp vào đó
+    assert search(db, owner, f"u{owner}") == []
+    assert search(db, owner, f"u{other}") == []
+
+def test_title_hits_rank_before_description_hits(db, users):
+    _, other = users
+    with db.session_scope() as session:
+        db.insert_tasks(session, [{"user_id": other, "title": "Quà sinh nhật", "description": None}])
+    assert search(db, other, "qua") == ["Quà sinh nhật", "Đi chợ Bến Thành"]
+
+def test_renamed_task_is_found_by_new_title(db, users):
+    owner, _ = users
+    with db.session_scope() as session:
+        task_id = db.search_tasks(session, owner, "goi dien", 1)[0].id
+        db.update_task(session, task_id, title="Nhắn tin")
+    assert search(db, owner, "goi dien") == []
+    assert search(db, owner, "nhan tin") == ["Nhắn tin"]
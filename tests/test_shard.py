@@ -0,0 +1,57 @@
+"""Chia update theo user để cache trong bộ nhớ của worker không bị worker khác làm cũ"""
+import asyncio
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from outbound import MessageEditor
+from shard import route_key
+
+USER = {"id": 5, "is_bot": False, "first_name": "A"}
+GROUP = {"id": -1001, "type": "supergroup", "title": "G"}
+PRIVATE = {"id": 5, "type": "private", "first_name": "A"}
+
+def callback_update(chat, message_id=10):
+    message = {"message_id": message_id, "date": 0, "chat": chat, "text": "x"}
+    return Update.de_json({
+        "update_id": 1,
+        "callback_query": {"id": "q", "from": USER, "chat_instance": "c", "data": "d", "message": message}
+    }, None)
+
+def test_group_and_private_updates_of_a_user_share_a_worker():
+    assert route_key(callback_update(GROUP)) == route_key(callback_update(PRIVATE)) == USER["id"]
+
+def test_update_without_user_routes_by_chat_then_update_id():
+    post = {"message_id": 1, "date": 0, "chat": {"id": -1002, "type": "channel", "title": "C"}, "text": "x"}
+    assert route_key(Update.de_json({"update_id": 7, "channel_post": post}, None)) == -1002
+    assert route_key(Update.de_json({"update_id": 8}, None)) == 8
+
+class FakeQuery:
+    """CallbackQuery tối thiểu: đếm số lần gọi sửa tin nhắn"""
+    def __init__(self, message):
+        self.message = message
+        self.edits = 0
+    
+    async def edit_message_text(self, *args, **kwargs):
+        self.edits += 1
+    
+    async def edit_message_reply_markup(self, *args, **kwargs):
+        self.edits += 1
+
+def repeat_edit(editor, chat):
+    query = FakeQuery(callback_update(chat).callback_query.message)
+    markup = InlineKeyboardMarkup([[InlineKeyboardButton("ok", callback_data="1")]])
+    
+    async def main():
+        for _ in range(3):
+            await editor.edit(query, "same", reply_markup=markup)
+        await editor.drain()
+    
+    asyncio.run(main())
+    return query.edits
+
+def test_sharded_editor_does_not_trust_group_fingerprints():
+    editor = MessageEditor(track_shared_chats=False)
+    assert repeat_edit(editor, GROUP) == 3
+    assert repeat_edit(editor, PRIVATE) == 1
+    assert len(editor.fingerprints) == 1
+
+def test_single_worker_editor_skips_unchanged_group_edits():
+    assert repeat_edit(MessageEditor(), GROUP) == 1
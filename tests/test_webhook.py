@@ -0,0 +1,56 @@
+"""Webhook trả lời lỗi 4xx thay vì treo hoặc ném ngoại lệ với request xấu"""
+import asyncio
+import json
+from webhook import MAX_HEADERS, WebhookServer
+
+class FakeApplication:
+    bot = None
+    running = True
+    
+    def __init__(self):
+        self.update_queue = asyncio.Queue()
+
+def exchange(request, read_timeout=None, close=True):
+    """Gửi request thô tới một WebhookServer, trả về (mã trạng thái, số update đã nhận)"""
+    async def main():
+        application = FakeApplication()
+        server = WebhookServer(application, "127.0.0.1", 0, "/webhook")
+        if read_timeout is not None:
+            server.read_timeout = read_timeout
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            writer.write(request)
+            await writer.drain()
+            if close:
+                writer.write_eof()
+            status_line = await asyncio.wait_for(reader.readline(), 5)
+            writer.close()
+            return int(status_line.split()[1]), application.update_queue.qsize()
+        finally:
+            await server.stop()
+    
+    return asyncio.run(main())
+
+def post(body):
+    body = body.encode()
+    return b"POST /webhook HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body
+
+def test_valid_update_is_queued():
+    assert exchange(post(json.dumps({"update_id": 1}))) == (200, 1)
+
+def test_non_object_json_is_rejected():
+    for body in ("[]", "1", '"x"', "null", "{", '{"message": 1}'):
+        assert exchange(post(body)) == (400, 0), body
+
+def test_slow_client_times_out():
+    # Gửi dở phần header rồi im lặng
+    status, queued = exchange(b"POST /webhook HTTP/1.1\r\nContent-Le", read_timeout=0.2, close=False)
+    assert (status, queued) == (408, 0)
+
+def test_too_many_headers_are_rejected():
+    headers = b"".join(b"X-H%d: v\r\n" % i for i in range(MAX_HEADERS + 1))
+    assert exchange(b"POST /webhook HTTP/1.1\r\n" + headers + b"\r\n") == (431, 0)
+
+def test_oversized_header_line_is_rejected():
+    assert exchange(b"POST /webhook HTTP/1.1\r\nX-Big: " + b"a" * 32 * 1024 + b"\r\n\r\n") == (431, 0)
@@ -0,0 +1,53 @@
+import asyncio
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+class ChatSerializedUpdateProcessor(BaseUpdateProcessor):
+    """Xử lý song song update của nhiều chat, nhưng tuần tự trong cùng một chat
+    
+    Update của cùng một chat xếp hàng trên một asyncio.Lock (FIFO) theo đúng
+    thứ tự nhận, nên trạng thái ConversationHandler và user_data luôn nhất quán.
+    Semaphore của lớp cha giới hạn tổng số update đang chờ và đang xử lý;
+    số update được xử lý cùng lúc do max_workers quyết định.
+    """
+    def __init__(self, max_workers, max_pending_updates=None):
+        super().__init__(max_pending_updates or max_workers * 32)
+        self.max_workers = max_workers
+        self._workers = asyncio.BoundedSemaphore(max_workers)
+        self._chats = {}  # chat_id -> [lock, số update đang giữ hoặc chờ lock]
+    
+    @staticmethod
+    def chat_key(update):
+        """Khóa tuần tự hóa: chat của update, hoặc user nếu không có chat"""
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return update.effective_user.id
+        return None
+    
+    async def do_process_update(self, update, coroutine):
+        key = self.chat_key(update)
+        if key is None:
+            async with self._workers:
+                await coroutine
+            return
+        
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._workers:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chats[key]
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
@@ -3,6 +3,8 @@ from cryptography.fernet import Fernet
 import base64
 import config
 
+PRIORITY_ICONS = {1: "🔴", 2: "🟡", 3: "🟢"}
+
 class Encryption:
     def __init__(self):
         # Tạo key từ secret
@@ -47,38 +49,40 @@ class DateUtils:
 class TaskFormatter:
     @staticmethod
     def format_task(task):
-        """Định dạng hiển thị task"""
+        """Định dạng hiển thị task (TaskDetailRow hoặc Task)"""
         status = "✅ Đã hoàn thành" if task.completed else "⏳ Đang thực hiện"
         priority_text = {1: "🔴 Cao", 2: "🟡 Trung bình", 3: "🟢 Thấp"}.get(task.priority, "🟡 Trung bình")
         
-        category_name = task.category.name if task.category else "Không có danh mục"
+        category_name = task.category_name or "Không có danh mục"
         due_date_text = DateUtils.format_date(task.due_date)
         
         overdue = DateUtils.is_overdue(task.due_date)
         overdue_text = " ⚠️ QUÁ HẠN" if overdue else ""
         
+        remind_at = getattr(task, "remind_at", None)
+        reminder_text = f"⏰ Nhắc lúc: {remind_at.strftime('%d/%m/%Y %H:%M')}\n" if remind_at else ""
+        
         return f"""📝 *{task.title}*
 
 📋 Mô tả: {task.description or 'Không có mô tả'}
 📂 Danh mục: {category_name}
 🏷️ Độ ưu tiên: {priority_text}
 📅 Hạn chót: {due_date_text}{overdue_text}
-📊 Trạng thái: {status}
+{reminder_text}📊 Trạng thái: {status}
 🕐 Tạo lúc: {task.created_at.strftime('%d/%m/%Y %H:%M')}
 🆔 ID: `{task.id}`
 """
-    
+
     @staticmethod
-    def format_tasks_list(tasks):
-        """Định dạng danh sách tasks"""
+    def format_tasks_list(tasks, start=1):
+        """Định dạng danh sách tasks (start là số thứ tự của task đầu tiên)"""
         if not tasks:
             return "📭 Danh sách trống!"
         
         result = []
-        for i, task in enumerate(tasks, 1):
+        for i, task in enumerate(tasks, start):
             status = "✅" if task.completed else "⬜"
-            priority_icons = {1: "🔴", 2: "🟡", 3: "🟢"}
-            priority_icon = priority_icons.get(task.priority, "🟡")
+            priority_icon = PRIORITY_ICONS.get(task.priority, "🟡")
             
             overdue = DateUtils.is_overdue(task.due_date)
             overdue_text = " ⚠️" if overdue else ""
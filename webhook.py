@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+import secrets
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Giới hạn kích thước body của một request (update của Telegram nhỏ hơn nhiều)
+MAX_BODY_SIZE = 1024 * 1024
+# Giới hạn phần header: số dòng và tổng số byte (cũng là độ dài tối đa của một dòng)
+MAX_HEADERS = 100
+MAX_HEADER_SIZE = 16 * 1024
+# Thời gian (giây) tối đa để đọc xong một request, và để gửi xong câu trả lời;
+# client gửi nhỏ giọt không giữ được kết nối mãi
+READ_TIMEOUT = 10
+WRITE_TIMEOUT = 10
+
+HTTP_STATUS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    503: "Service Unavailable"
+}
+
+class RequestError(Exception):
+    """Request không đọc được, trả lời bằng mã status"""
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+def parse_update(body, bot):
+    """Update từ body JSON, None nếu body không phải một update hợp lệ"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    try:
+        return Update.de_json(data, bot)
+    except Exception as e:
+        logger.debug("Update không hợp lệ: %r", e)
+        return None
+
+class WebhookServer:
+    """Máy chủ HTTP tối giản (asyncio thuần) nhận update từ Telegram
+    
+    - POST <path>: nhận update, kiểm tra header X-Telegram-Bot-Api-Secret-Token
+      rồi đưa vào application.update_queue
+    - GET /health: kiểm tra sống cho Render
+    
+    Có thể đăng ký thêm route bằng add_route. Với path=None máy chủ không nhận
+    update (dùng cho cổng nội bộ chỉ có /health và các route thêm vào).
+    """
+    def __init__(self, application, host, port, path, secret_token=None):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.read_timeout = READ_TIMEOUT
+        self.server = None
+        
+        self.routes = {}
+        if path:
+            self.add_route("POST", path, self.receive_update)
+        self.add_route("GET", "/health", self.health)
+    
+    def add_route(self, method, path, handler):
+        """Đăng ký handler(headers, body) -> (status, content_type, body)"""
+        self.routes[(method, path)] = handler
+    
+    async def start(self):
+        # limit: readline báo lỗi với dòng dài hơn giới hạn thay vì đệm cả dòng
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, limit=MAX_HEADER_SIZE
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info("Webhook server lắng nghe tại %s:%s%s", self.host, self.port, self.path or "")
+    
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+    
+    async def handle_connection(self, reader, writer):
+        """Đọc một request HTTP/1.1, trả lời rồi đóng kết nối"""
+        try:
+            method, target, headers, body = await asyncio.wait_for(self.read_request(reader), self.read_timeout)
+            response = await self.dispatch(method, target.split("?", 1)[0], headers, body)
+        except RequestError as e:
+            response = (e.status, "text/plain", b"")
+        except asyncio.TimeoutError:
+            response = (408, "text/plain", b"")
+        except (ValueError, asyncio.IncompleteReadError):
+            response = (400, "text/plain", b"")
+        
+        status, content_type, payload = response
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_STATUS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + payload
+        )
+        try:
+            await asyncio.wait_for(writer.drain(), WRITE_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    @staticmethod
+    async def read_request(reader):
+        """Đọc request line, header và body: (method, target, headers, body)"""
+        request_line = await reader.readline()
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        
+        headers = {}
+        size = 0
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                # Một dòng header dài hơn MAX_HEADER_SIZE
+                raise RequestError(431)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            size += len(line)
+            if len(headers) >= MAX_HEADERS or size > MAX_HEADER_SIZE:
+                raise RequestError(431)
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY_SIZE:
+            raise RequestError(413)
+        body = await reader.readexactly(length) if length else b""
+        return method, target, headers, body
+    
+    async def dispatch(self, method, path, headers, body):
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(route_path == path for _, route_path in self.routes):
+                return 405, "text/plain", b""
+            return 404, "text/plain", b""
+        return await handler(headers, body)
+    
+    def check_secret(self, headers):
+        """Kiểm tra header X-Telegram-Bot-Api-Secret-Token"""
+        return not self.secret_token or secrets.compare_digest(
+            headers.get("x-telegram-bot-api-secret-token", "").encode("latin-1"),
+            self.secret_token.encode("latin-1")
+        )
+    
+    async def receive_update(self, headers, body):
+        """Nhận update từ Telegram"""
+        if not self.check_secret(headers):
+            return 403, "text/plain", b""
+        
+        update = parse_update(body, self.application.bot)
+        if update is None:
+            return 400, "text/plain", b""
+        
+        await self.application.update_queue.put(update)
+        return 200, "text/plain", b""
+    
+    async def health(self, headers, body):
+        """Kiểm tra sống"""
+        status = "ok" if self.application.running else "starting"
+        return 200, "application/json", json.dumps({"status": status}).encode()